@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Kiacha OS Asset Pack Tool
+
+Writer, reader and verifier for assets.pack, the indexed file holding
+frontend assets too large to embed in the binary. embed_assets.py writes it
+when run with --pack-threshold; the app memory-maps it on first use
+(src-tauri/src/embed/pack.rs).
+
+Usage:
+    python asset_pack.py list src-tauri/assets.pack
+    python asset_pack.py verify src-tauri/assets.pack
+    python asset_pack.py extract src-tauri/assets.pack INDEX OUTPUT
+
+Layout (little endian):
+    0   magic      b"KIAPACK\\0"
+    8   version    u32
+    12  count      u32
+    16  align      u32   blob alignment
+    20  reserved   u32
+    24  pack id    16 bytes
+    40  entries    count x (offset u64, length u64, sha256 32 bytes)
+        blobs      each starting at a multiple of align
+
+The pack id is derived from the entry plan (content hash, encoding, length)
+and compiled into the asset table, so the app rejects a pack from another
+build.
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+from pathlib import Path
+
+MAGIC = b'KIAPACK\0'
+VERSION = 1
+ALIGN = 4096
+HEADER = struct.Struct('<8sIIII16s')
+ENTRY = struct.Struct('<QQ32s')
+COPY_CHUNK = 1 << 20
+
+def align_up(value, align):
+    return (value + align - 1) // align * align
+
+def pack_id(plan):
+    """16-byte id of a plan: [(key, length), ...] in entry order"""
+    h = hashlib.sha256()
+    for key, length in plan:
+        h.update(f'{key} {length}\n'.encode('utf-8'))
+    return h.digest()[:16]
+
+def read_header(path):
+    """Parse header and offset table; raises ValueError on a malformed pack"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError('truncated header')
+        magic, version, count, align, _, ident = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError('not an asset pack')
+        if version != VERSION:
+            raise ValueError(f'unsupported version {version}')
+        table = f.read(count * ENTRY.size)
+        if len(table) < count * ENTRY.size:
+            raise ValueError('truncated offset table')
+    entries = [ENTRY.unpack_from(table, i * ENTRY.size) for i in range(count)]
+    return {'id': ident, 'align': align, 'entries': entries}
+
+def write_pack(path, parts, align=ALIGN):
+    """Write parts [(key, source path), ...]; returns False if already up to date"""
+    path = Path(path)
+    plan = [(key, Path(source).stat().st_size) for key, source in parts]
+    ident = pack_id(plan)
+    try:
+        current = read_header(path)
+        if current['id'] == ident and len(current['entries']) == len(parts):
+            return False
+    except (OSError, ValueError):
+        pass
+
+    table_end = HEADER.size + len(parts) * ENTRY.size
+    entries = []
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as out:
+        out.write(b'\0' * table_end)
+        offset = table_end
+        for (key, source), (_, length) in zip(parts, plan):
+            offset = align_up(offset, align)
+            out.seek(offset)
+            h = hashlib.sha256()
+            with open(source, 'rb') as f:
+                while True:
+                    chunk = f.read(COPY_CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    out.write(chunk)
+            entries.append((offset, length, h.digest()))
+            offset += length
+        out.truncate(offset)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, len(parts), align, 0, ident))
+        for entry in entries:
+            out.write(ENTRY.pack(*entry))
+    os.replace(tmp, path)
+    return True
+
+def verify(path):
+    """Check bounds, alignment, overlap and every entry's sha256; returns problems"""
+    try:
+        header = read_header(path)
+    except (OSError, ValueError) as e:
+        return [str(e)]
+    problems = []
+    size = os.path.getsize(path)
+    table_end = HEADER.size + len(header['entries']) * ENTRY.size
+    previous_end = table_end
+    with open(path, 'rb') as f:
+        for i, (offset, length, digest) in enumerate(header['entries']):
+            if offset % header['align']:
+                problems.append(f'entry {i}: offset {offset} not aligned to {header["align"]}')
+            if offset < previous_end:
+                problems.append(f'entry {i}: overlaps the previous entry or the table')
+            if offset + length > size:
+                problems.append(f'entry {i}: extends past end of file')
+                continue
+            previous_end = offset + length
+            f.seek(offset)
+            h = hashlib.sha256()
+            remaining = length
+            while remaining:
+                chunk = f.read(min(COPY_CHUNK, remaining))
+                h.update(chunk)
+                remaining -= len(chunk)
+            if h.digest() != digest:
+                problems.append(f'entry {i}: sha256 mismatch')
+    return problems
+
+def read_entry(path, index):
+    header = read_header(path)
+    offset, length, _ = header['entries'][index]
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and verify a Kiacha asset pack')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('list', 'verify'):
+        sub.add_parser(name).add_argument('pack')
+    extract = sub.add_parser('extract')
+    extract.add_argument('pack')
+    extract.add_argument('index', type=int)
+    extract.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        header = read_header(args.pack)
+        print(f"[*] {args.pack}: {len(header['entries'])} entries, align {header['align']}, "
+              f"id {header['id'].hex()}")
+        for i, (offset, length, digest) in enumerate(header['entries']):
+            print(f"    {i:4d}  offset {offset:>12}  length {length:>12}  sha256 {digest.hex()[:16]}")
+        return 0
+    if args.command == 'verify':
+        problems = verify(args.pack)
+        for problem in problems:
+            print(f"[!] {problem}")
+        if problems:
+            return 1
+        print(f"[✓] {args.pack} OK")
+        return 0
+    Path(args.output).write_bytes(read_entry(args.pack, args.index))
+    print(f"[✓] Wrote entry {args.index} to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -87,6 +87,10 @@ if errorlevel 1 (
 )
 cd ..
 echo     ✓ Build completed
+if exist "src-tauri\assets.pack" (
+    copy /y "src-tauri\assets.pack" "src-tauri\target\release\assets.pack" >nul
+    echo     ✓ Asset pack copied next to the executable
+)
 echo.
 
 REM Step 4: Compress with UPX (if available)
@@ -6,18 +6,68 @@ This script prepares frontend assets for embedding into the Tauri binary.
 It creates a Rust module that includes all assets using include_bytes!()
 
 Usage:
-    python embed_assets.py
-    
+    python embed_assets.py [--pack-threshold 1M]
+
     This will:
     1. Read the frontend dist/ directory
-    2. Generate Rust code with embedded assets
-    3. Create src-tauri/src/embed/assets.rs
+    2. Precompress text assets (gzip, plus brotli when the `brotli`
+       package is installed) into src-tauri/src/embed/generated/
+    3. Generate Rust code with embedded assets
+    4. Create src-tauri/src/embed/assets.rs
+
+The generated module is a static table sorted by path (binary search, no
+runtime construction). Identical files are embedded once, and every asset
+carries a precomputed ETag so the app can answer If-None-Match and serve
+the compressed bytes directly (gzip/brotli variants append -gz/-br to it,
+so each content-coding has its own strong validator).
+
+Runs are incremental: generated/manifest.json records (path, size, mtime,
+hash) per file, unchanged files are neither re-read nor recompressed, and
+generated files are only rewritten when their content changes, so an
+unchanged dist/ leaves cargo nothing to rebuild.
+
+With --pack-threshold, assets at least that large (WASM builds, fonts) and
+their compressed variants go into src-tauri/assets.pack instead of the
+binary; the app maps that file lazily from next to the executable. Inspect
+or verify it with asset_pack.py.
 """
 
+import argparse
+import gzip
+import hashlib
+import json
 import os
 import sys
+import time
 from pathlib import Path
 
+import asset_pack
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = Path(__file__).parent
+OUTPUT_PATH = ROOT / 'src-tauri' / 'src' / 'embed' / 'assets.rs'
+GENERATED_DIR = OUTPUT_PATH.parent / 'generated'
+MANIFEST_PATH = GENERATED_DIR / 'manifest.json'
+MANIFEST_VERSION = 1
+PACK_PATH = ROOT / 'src-tauri' / 'assets.pack'
+
+# Compressed variants are only kept when they save at least this much
+MIN_COMPRESS_SIZE = 256
+MAX_COMPRESS_RATIO = 0.9
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/wasm',
+    'image/svg+xml',
+    'font/ttf',
+)
+
 def get_mime_type(filename):
     """Determine MIME type from filename"""
     ext = Path(filename).suffix.lower()
@@ -44,82 +94,318 @@ def escape_path(path):
     """Escape path for Rust code"""
     return path.replace('\\', '/')
 
-def generate_embed_module():
+def rust_str(value):
+    """Rust string literal"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def is_compressible(mime_type, size):
+    return size >= MIN_COMPRESS_SIZE and mime_type.startswith(COMPRESSIBLE_TYPES)
+
+def compress_variants(data):
+    """Return {'gzip': bytes, 'br': bytes} for the encodings worth keeping"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    limit = len(data) * MAX_COMPRESS_RATIO
+    return {enc: blob for enc, blob in variants.items() if len(blob) <= limit}
+
+def write_if_changed(path, data):
+    """Write bytes unless the file already holds them (keeps mtimes stable)"""
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.write_bytes(data)
+    return True
+
+def variant_path(digest, enc):
+    return GENERATED_DIR / f'{digest[:32]}.{"gz" if enc == "gzip" else enc}'
+
+def encoders():
+    return ['gzip', 'br'] if brotli is not None else ['gzip']
+
+def load_manifest():
+    """Previous run's (path, size, mtime, hash) records, or an empty manifest"""
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        return {'files': {}, 'blobs': {}}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('encoders') != encoders():
+        return {'files': {}, 'blobs': {}}
+    return manifest
+
+def save_manifest(assets, blobs):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'encoders': encoders(),
+        'files': {a['path']: [a['size'], a['mtime_ns'], a['digest']] for a in assets},
+        'blobs': {digest: blob['variants'] for digest, blob in sorted(blobs.items())},
+    }
+    return write_if_changed(MANIFEST_PATH, (json.dumps(manifest, indent=1, sort_keys=True) + '\n').encode('utf-8'))
+
+def collect_assets(dist_dir, manifest, stats):
+    """Scan dist/: one record per file, one blob per distinct content
+
+    Files whose size and mtime match the manifest are not read again, and
+    blobs whose compressed variants are already on disk are not
+    recompressed.
+    """
+    assets = []
+    blobs = {}
+    for root, dirs, filenames in os.walk(dist_dir):
+        dirs.sort()
+        for filename in sorted(filenames):
+            full_path = Path(root) / filename
+            rel_path = escape_path(str(full_path.relative_to(dist_dir)))
+            st = full_path.stat()
+            data = None
+            known = manifest['files'].get(rel_path)
+            if known and known[:2] == [st.st_size, st.st_mtime_ns]:
+                digest = known[2]
+            else:
+                data = full_path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                stats['hashed'] += 1
+            mime_type = get_mime_type(rel_path)
+            if digest not in blobs:
+                variants = manifest['blobs'].get(digest)
+                pending = {}
+                if variants is None or not all(variant_path(digest, enc).exists() for enc in variants):
+                    if data is None:
+                        data = full_path.read_bytes()
+                    pending = compress_variants(data) if is_compressible(mime_type, len(data)) else {}
+                    variants = {enc: len(blob) for enc, blob in pending.items()}
+                    stats['compressed'] += bool(pending)
+                blobs[digest] = {
+                    'source': full_path,
+                    'size': st.st_size,
+                    'variants': variants,
+                    'pending': pending,
+                }
+            assets.append({
+                'path': rel_path,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'mime_type': mime_type,
+                'digest': digest,
+                'etag': f'"{digest[:16]}"',
+            })
+    # Sorted by byte order, the order Rust's str::cmp uses for binary search
+    assets.sort(key=lambda a: a['path'].encode('utf-8'))
+    return assets, blobs
+
+def include_path(path):
+    """include_bytes! path relative to the generated module"""
+    return escape_path(os.path.relpath(path, OUTPUT_PATH.parent))
+
+def plan_pack(blobs, threshold):
+    """Assign pack entries to blobs of at least `threshold` bytes; returns the parts list"""
+    parts = []
+    for digest, blob in sorted(blobs.items()):
+        blob['packed'] = None
+        if threshold is None or blob['size'] < threshold:
+            continue
+        blob['packed'] = {'content': len(parts)}
+        parts.append((f'{digest}.identity', blob['source']))
+        for enc in ('gzip', 'br'):
+            if enc in blob['variants']:
+                blob['packed'][enc] = len(parts)
+                parts.append((f'{digest}.{enc}', variant_path(digest, enc)))
+    return parts
+
+def pack_info(blobs, parts):
+    """(id, entry count) of the planned pack, from sizes only"""
+    sizes = {}
+    for digest, blob in blobs.items():
+        sizes[f'{digest}.identity'] = blob['size']
+        for enc, size in blob['variants'].items():
+            sizes[f'{digest}.{enc}'] = size
+    return asset_pack.pack_id([(key, sizes[key]) for key, _ in parts]), len(parts)
+
+def blob_name(digest):
+    """Static name keyed by content, so unrelated entries never renumber"""
+    return f'BLOB_{digest[:16].upper()}'
+
+def render_module(assets, blobs, pack=None):
+    """Rust source for the static asset table"""
+    inline = {d: b for d, b in blobs.items() if not b.get('packed')}
+    identity = sum(b['size'] for b in inline.values())
+    compressed = {enc: sum(b['variants'].get(enc, 0) for b in inline.values())
+                  for enc in ('gzip', 'br')}
+    lines = [
+        '/// Auto-generated embedded assets',
+        '/// Generated by embed_assets.py - do not edit',
+        f'/// {len(assets)} assets, {len(inline)} unique blobs, {identity} bytes '
+        f'(+{compressed["gzip"]} gzip, +{compressed["br"]} brotli)',
+    ]
+    if pack:
+        lines.append(f'/// {len(blobs) - len(inline)} blobs in {PACK_PATH.name} ({pack[1]} entries)')
+    lines += [
+        '',
+        'use super::{EmbeddedAsset, PackInfo, PackedAsset};' if pack else 'use super::{EmbeddedAsset, PackInfo};',
+        '',
+    ]
+    if pack:
+        ident = ', '.join(f'0x{b:02x}' for b in pack[0])
+        lines += [
+            'pub static PACK: Option<PackInfo> = Some(PackInfo {',
+            f'    file: {rust_str(PACK_PATH.name)},',
+            f'    id: [{ident}],',
+            f'    entries: {pack[1]},',
+            '});',
+        ]
+    else:
+        lines.append('pub static PACK: Option<PackInfo> = None;')
+    lines.append('')
+    for digest, blob in sorted(inline.items()):
+        name = blob_name(digest)
+        lines.append(f'static {name}: &[u8] = include_bytes!({rust_str(include_path(blob["source"]))});')
+        for enc, suffix in (('gzip', 'GZ'), ('br', 'BR')):
+            if enc in blob['variants']:
+                lines.append(f'static {name}_{suffix}: &[u8] = '
+                             f'include_bytes!({rust_str(include_path(variant_path(digest, enc)))});')
+    if inline:
+        lines.append('')
+    lines += [
+        '/// Sorted by path (byte order) for binary search',
+        f'pub static ASSETS: [EmbeddedAsset; {len(assets)}] = [',
+    ]
+    for asset in assets:
+        blob = blobs[asset['digest']]
+        packed = blob.get('packed')
+        if packed:
+            content, gz, br = '&[]', 'None', 'None'
+            slots = ', '.join([
+                f'content: {packed["content"]}',
+                f'gzip: {"Some(%d)" % packed["gzip"] if "gzip" in packed else "None"}',
+                f'brotli: {"Some(%d)" % packed["br"] if "br" in packed else "None"}',
+            ])
+            packed = f'Some(PackedAsset {{ {slots} }})'
+        else:
+            name = blob_name(asset['digest'])
+            content = name
+            gz = f'Some({name}_GZ)' if 'gzip' in blob['variants'] else 'None'
+            br = f'Some({name}_BR)' if 'br' in blob['variants'] else 'None'
+            packed = 'None'
+        lines += [
+            '    EmbeddedAsset {',
+            f'        path: {rust_str(asset["path"])},',
+            f'        content: {content},',
+            f'        mime_type: {rust_str(asset["mime_type"])},',
+            f'        etag: {rust_str(asset["etag"])},',
+            f'        gzip: {gz},',
+            f'        brotli: {br},',
+            f'        packed: {packed},',
+            '    },',
+        ]
+    lines += ['];', '']
+    return '\n'.join(lines)
+
+def write_outputs(assets, blobs, parts):
+    """Write new variants, the pack and the table, prune stale files; returns rewritten names"""
+    GENERATED_DIR.mkdir(parents=True, exist_ok=True)
+    written = []
+    wanted = {MANIFEST_PATH.name}
+    for digest, blob in blobs.items():
+        for enc in blob['variants']:
+            wanted.add(variant_path(digest, enc).name)
+        for enc, data in blob['pending'].items():
+            if write_if_changed(variant_path(digest, enc), data):
+                written.append(variant_path(digest, enc).name)
+    for stale in GENERATED_DIR.iterdir():
+        if stale.name not in wanted:
+            stale.unlink()
+    pack = None
+    if parts:
+        pack = pack_info(blobs, parts)
+        if asset_pack.write_pack(PACK_PATH, parts):
+            written.append(PACK_PATH.name)
+    elif PACK_PATH.exists():
+        PACK_PATH.unlink()
+    if write_if_changed(OUTPUT_PATH, render_module(assets, blobs, pack).encode('utf-8')):
+        written.append(OUTPUT_PATH.name)
+    return written
+
+def generate_embed_module(pack_threshold=None):
     """Generate Rust code that embeds frontend assets"""
-    
-    dist_dir = Path(__file__).parent / 'dist'
-    
+
+    dist_dir = ROOT / 'dist'
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+
     if not dist_dir.exists():
         print(f"Warning: dist/ directory not found at {dist_dir}")
         print("Frontend assets will not be embedded.")
         print("Run 'npm run build' in the frontend directory first.")
+        # An empty table keeps the crate building without a frontend
+        write_if_changed(OUTPUT_PATH, render_module([], {}).encode('utf-8'))
         return False
-    
+
     print(f"[*] Scanning {dist_dir} for assets...")
-    
-    # Collect all files
-    files = []
-    for root, dirs, filenames in os.walk(dist_dir):
-        for filename in filenames:
-            full_path = Path(root) / filename
-            rel_path = full_path.relative_to(dist_dir)
-            files.append((rel_path, full_path))
-    
-    if not files:
+
+    start = time.perf_counter()
+    stats = {'hashed': 0, 'compressed': 0}
+    assets, blobs = collect_assets(dist_dir, load_manifest(), stats)
+
+    if not assets:
         print("No files found in dist/")
+        write_if_changed(OUTPUT_PATH, render_module([], {}).encode('utf-8'))
         return False
-    
-    print(f"[*] Found {len(files)} files to embed")
-    
-    # Generate Rust code
-    rust_code = '''/// Auto-generated embedded assets
-/// Generated by embed_assets.py
-
-use std::collections::HashMap;
-
-pub struct EmbeddedAssets {
-    pub files: HashMap<&'static str, (&'static [u8], &'static str)>,
-}
-
-impl EmbeddedAssets {
-    pub fn new() -> Self {
-        let mut files = HashMap::new();
-        
-'''
-    
-    for rel_path, full_path in sorted(files):
-        escaped_path = escape_path(str(rel_path))
-        mime_type = get_mime_type(str(rel_path))
-        
-        # Use include_bytes! for binary files
-        rust_code += f'''        files.insert(
-            "{escaped_path}",
-            (include_bytes!("{full_path}"), "{mime_type}"),
-        );
-        
-'''
-    
-    rust_code += '''        EmbeddedAssets { files }
-    }
-    
-    pub fn get(&self, path: &str) -> Option<(&'static [u8], &'static str)> {
-        self.files.get(path).copied()
-    }
-}
-'''
-    
-    # Write to file
-    output_path = Path(__file__).parent / 'src-tauri' / 'src' / 'embed' / 'assets.rs'
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(output_path, 'w') as f:
-        f.write(rust_code)
-    
-    print(f"[✓] Generated {output_path}")
+
+    print(f"[*] Found {len(assets)} files to embed ({len(blobs)} unique)")
+    if brotli is None:
+        print("[*] brotli not installed (pip install brotli); embedding gzip variants only")
+
+    parts = plan_pack(blobs, pack_threshold)
+    written = write_outputs(assets, blobs, parts)
+    save_manifest(assets, blobs)
+    elapsed = time.perf_counter() - start
+
+    print(f"[*] Incremental: {stats['hashed']}/{len(assets)} files hashed, "
+          f"{stats['compressed']} blobs compressed in {elapsed * 1000:.0f} ms")
+    if written:
+        print(f"[✓] Rewrote {len(written)} generated files: {', '.join(written[:8])}"
+              f"{' ...' if len(written) > 8 else ''}")
+    else:
+        print("[✓] Assets unchanged; generated files left untouched (no recompile)")
+    report_sizes(assets, blobs)
+    if parts:
+        print(f"[*] Asset pack: {len(parts)} entries, {PACK_PATH.stat().st_size} bytes in {PACK_PATH} "
+              f"(copy it next to the executable)")
     return True
 
+def report_sizes(assets, blobs):
+    """Print embedded size and wire size compared with the old one-include-per-file layout"""
+    before = sum(blobs[a['digest']]['size'] for a in assets)
+    identity = sum(b['size'] for b in blobs.values())
+    variants = sum(size for b in blobs.values() for size in b['variants'].values())
+    packed = sum(b['size'] + sum(b['variants'].values()) for b in blobs.values() if b.get('packed'))
+    best = 0
+    for blob in blobs.values():
+        best += min([blob['size']] + list(blob['variants'].values()))
+    print(f"[*] Embedded bytes: {before} before -> {identity + variants} now "
+          f"({before - identity} saved by dedupe, {variants} added as precompressed variants)")
+    if packed:
+        print(f"[*] Binary bytes: {identity + variants - packed} ({packed} moved to the asset pack)")
+    print(f"[*] Served bytes for one full load: {identity} identity -> {best} best encoding "
+          f"({1 - best / max(identity, 1):.0%} smaller)")
+    print(f"[*] Startup: static table of {len(assets)} entries, no HashMap construction")
+
+def parse_size(text):
+    """Byte count with an optional K/M/G suffix"""
+    text = text.strip().upper()
+    for suffix, scale in (('K', 1 << 10), ('M', 1 << 20), ('G', 1 << 30)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * scale)
+    return int(text)
+
 if __name__ == '__main__':
-    if generate_embed_module():
+    parser = argparse.ArgumentParser(description='Embed dist/ into the Tauri binary')
+    parser.add_argument('--pack-threshold', type=parse_size, default=None, metavar='SIZE',
+                        help='store assets of at least SIZE bytes (e.g. 512K, 1M) in '
+                             f'{PACK_PATH.relative_to(ROOT)} instead of the binary')
+    args = parser.parse_args()
+    if generate_embed_module(args.pack_threshold):
         print("\n[✓] Asset embedding complete!")
         sys.exit(0)
     else:
@@ -15,9 +15,23 @@ Conecta-se ao Brain via IPC/REST API
 import os
 import sys
 import json
+import time
 import asyncio
+import gc
+import hashlib
+import contextlib
+import contextvars
+import functools
+import importlib
+import importlib.util
+import threading
+import concurrent.futures
+import heapq
+import itertools
+import math
+from collections import OrderedDict, deque
 import numpy as np
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Union, Callable
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import logging
@@ -29,44 +43,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ============================================================================
-# IMPORTAÇÕES CONDICIONAIS (instaladas via pip)
-# ============================================================================
-
 try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
+    from . import perception_transport as transport
 except ImportError:
-    YOLO_AVAILABLE = False
-    logger.warning("YOLOv8 not installed: pip install ultralytics")
+    import perception_transport as transport
 
 try:
-    import whisper
-    WHISPER_AVAILABLE = True
+    from . import perception_trace as tracing
 except ImportError:
-    WHISPER_AVAILABLE = False
-    logger.warning("Whisper not installed: pip install openai-whisper")
+    import perception_trace as tracing
 
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-    logger.warning("PIL not installed: pip install pillow")
+# Spans por estágio (KIACHA_TRACE_SAMPLE etc., ver perception_trace)
+tracer = tracing.Tracer.from_env()
 
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except ImportError:
-    CV2_AVAILABLE = False
-    logger.warning("OpenCV not installed: pip install opencv-python")
+# Imagem: caminho em disco ou array HxWx3 uint8 BGR (ver perception_transport)
+ImageInput = Union[str, np.ndarray]
+# Áudio: caminho em disco ou mono float32 a 16 kHz
+AudioInput = Union[str, np.ndarray]
 
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
-    logger.warning("sentence-transformers not installed: pip install sentence-transformers")
+# ============================================================================
+# IMPORTAÇÕES CONDICIONAIS (instaladas via pip)
+# ============================================================================
+
+# Só verifica se os pacotes existem (find_spec não importa nada); torch,
+# ultralytics etc. são importados na primeira carga de modelo, em segundo
+# plano, para o servidor abrir a porta sem esperar por eles.
+
+def _available(module: str, label: str, pip_name: str) -> bool:
+    if importlib.util.find_spec(module) is not None:
+        return True
+    logger.warning(f"{label} not installed: pip install {pip_name}")
+    return False
+
+YOLO_AVAILABLE = _available('ultralytics', 'YOLOv8', 'ultralytics')
+WHISPER_AVAILABLE = _available('whisper', 'Whisper', 'openai-whisper')
+PIL_AVAILABLE = _available('PIL', 'PIL', 'pillow')
+CV2_AVAILABLE = _available('cv2', 'OpenCV', 'opencv-python')
+SENTENCE_TRANSFORMERS_AVAILABLE = _available(
+    'sentence_transformers', 'sentence-transformers', 'sentence-transformers')
+
+@functools.lru_cache(maxsize=None)
+def _import(module: str):
+    """Import adiado de uma dependência pesada (cacheado)"""
+    return importlib.import_module(module)
 
 # ============================================================================
 # ESTRUTURAS DE DADOS
@@ -107,6 +126,287 @@ class VisionResult:
             'detection_count': len(self.detections)
         }
 
+@dataclass
+class VisionColumns:
+    """
+    Detecções em colunas (arrays paralelos), sem objeto Python por caixa
+    
+    boxes (N, 4) float32 x1, y1, x2, y2; scores (N,) float32;
+    class_ids (N,) int32; areas (N,) float32; names é a tabela de classes
+    do modelo (id -> nome); track_ids (N,) int64 só em sessões de vídeo
+    (VisionStream).
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    class_ids: np.ndarray
+    areas: np.ndarray
+    names: Dict[int, str]
+    track_ids: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return len(self.scores)
+    
+    def take(self, index) -> 'VisionColumns':
+        """Subconjunto por máscara booleana ou índices"""
+        track_ids = self.track_ids[index] if self.track_ids is not None else None
+        return VisionColumns(self.boxes[index], self.scores[index], self.class_ids[index],
+                             self.areas[index], self.names, track_ids)
+    
+    def class_names(self) -> List[str]:
+        names = self.names
+        return [names.get(i, str(i)) for i in self.class_ids.tolist()]
+    
+    def to_rows(self) -> List[Dict]:
+        """Mesmo formato de VisionDetection.to_dict, montado a partir das colunas"""
+        rows = [
+            {'class_name': name, 'confidence': score, 'bbox': box, 'area': area}
+            for name, score, box, area in zip(self.class_names(), self.scores.tolist(),
+                                              self.boxes.tolist(), self.areas.tolist())
+        ]
+        if self.track_ids is not None:
+            for row, track_id in zip(rows, self.track_ids.tolist()):
+                row['track_id'] = track_id
+        return rows
+    
+    def to_detections(self) -> List[VisionDetection]:
+        return [
+            VisionDetection(class_name=row['class_name'], confidence=row['confidence'],
+                            bbox=tuple(row['bbox']), area=row['area'])
+            for row in self.to_rows()
+        ]
+    
+    def to_dict(self) -> Dict:
+        """Serialização colunar: uma lista por campo"""
+        ids = self.class_ids.tolist()
+        result = {
+            'boxes': self.boxes.tolist(),
+            'scores': self.scores.tolist(),
+            'class_ids': ids,
+            'areas': self.areas.tolist(),
+            'class_names': {i: self.names.get(i, str(i)) for i in sorted(set(ids))},
+        }
+        if self.track_ids is not None:
+            result['track_ids'] = self.track_ids.tolist()
+        return result
+
+def postprocess_boxes(
+    xyxy: np.ndarray,
+    scores: np.ndarray,
+    class_ids: np.ndarray,
+    names: Dict[int, str],
+    confidence_threshold: float = 0.0,
+    classes: Optional[List[str]] = None,
+    top_k: Optional[int] = None
+) -> VisionColumns:
+    """
+    Filtrar e ordenar caixas de uma vez (limiar, classes, top-k por score)
+    
+    Recebe arrays já em NumPy (uma única conversão do tensor de saída) e
+    devolve VisionColumns ordenado por score decrescente.
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    class_ids = np.asarray(class_ids).astype(np.int32, copy=False).reshape(-1)
+    
+    keep = scores >= confidence_threshold
+    if classes:
+        wanted = [i for i, name in names.items() if name in classes]
+        keep &= np.isin(class_ids, wanted)
+    index = np.flatnonzero(keep)
+    
+    if top_k is not None and len(index) > top_k:
+        # argpartition é O(N); só os top_k restantes são ordenados
+        index = index[np.argpartition(-scores[index], top_k - 1)[:top_k]]
+    index = index[np.argsort(-scores[index], kind='stable')]
+    
+    boxes = xyxy[index]
+    widths = np.clip(boxes[:, 2] - boxes[:, 0], 0, None)
+    heights = np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    return VisionColumns(boxes, scores[index], class_ids[index], widths * heights, names)
+
+def merge_detections(
+    data: np.ndarray,
+    threshold: float = 0.6,
+    tiles: Optional[np.ndarray] = None,
+    grid: Optional[np.ndarray] = None,
+    iou_threshold: float = 0.7
+) -> np.ndarray:
+    """
+    NMS por classe para fundir detecções de tiles sobrepostos; (N, 6) -> (M, 6)
+    
+    tiles: índice em grid (T, 4) do tile de cada detecção. Só pedaços de
+    objetos cortados pela borda interna de um tile são fundidos com caixas
+    de outros tiles, e só quando as duas se continuam: coincidem dentro da
+    faixa de sobreposição entre os tiles (IoS da menor parte > threshold),
+    as bordas não cortadas batem e a caixa vizinha atravessa a borda do
+    corte. A caixa mantida cresce até a união, e a fusão é transitiva (um
+    objeto em quatro tiles junta os quatro pedaços). Os demais pares seguem
+    o NMS comum por IoU (iou_threshold, o padrão do YOLO), então objetos
+    próximos continuam separados.
+    """
+    if len(data) == 0:
+        return data
+    boxes = data[:, :4]
+    # Deslocar cada classe para uma região disjunta: uma passada cobre todas
+    shifted = boxes + data[:, 5:6] * (float(boxes.max()) + 1.0)
+    areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    if tiles is None or grid is None:
+        cut = np.zeros((len(data), 4), bool)
+    else:
+        cut = _seam_cuts(boxes, grid[tiles], grid[:, 2:].max(axis=0))
+    is_cut = cut.any(axis=1)
+    order = np.argsort(-data[:, 4], kind='stable')
+    merged = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        w = np.clip(np.minimum(shifted[i, 2], shifted[rest, 2]) - np.maximum(shifted[i, 0], shifted[rest, 0]), 0, None)
+        h = np.clip(np.minimum(shifted[i, 3], shifted[rest, 3]) - np.maximum(shifted[i, 1], shifted[rest, 1]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        fuse = np.zeros(len(rest), bool)
+        if is_cut.any():
+            frontier = [i]
+            while frontier:
+                m = frontier.pop()
+                candidates = np.flatnonzero(
+                    ~fuse & (is_cut[m] | is_cut[rest]) & (tiles[rest] != tiles[m])
+                    & (shifted[rest, 0] < shifted[m, 2]) & (shifted[rest, 2] > shifted[m, 0])
+                    & (shifted[rest, 1] < shifted[m, 3]) & (shifted[rest, 3] > shifted[m, 1]))
+                if not len(candidates):
+                    continue
+                others = rest[candidates]
+                # Faixa comum aos dois tiles
+                band = np.concatenate([np.maximum(grid[tiles[m], :2], grid[tiles[others], :2]),
+                                       np.minimum(grid[tiles[m], 2:], grid[tiles[others], 2:])], axis=1)
+                match = ((_band_ios(boxes[m], boxes[others], band) > threshold)
+                         & _continues(boxes[m], cut[m], boxes[others], cut[others]))
+                found = candidates[match]
+                fuse[found] = True
+                frontier.extend(rest[found])
+        group = np.append(rest[fuse], i)
+        row = data[i].copy()
+        row[:2] = boxes[group, :2].min(axis=0)
+        row[2:4] = boxes[group, 2:4].max(axis=0)
+        merged.append(row)
+        order = rest[~(fuse | (iou > iou_threshold))]
+    return np.stack(merged)
+
+def _seam_cuts(boxes: np.ndarray, tiles: np.ndarray, size: np.ndarray, margin: float = 2.0) -> np.ndarray:
+    """(N, 4): lados x1, y1, x2, y2 de cada caixa encostados numa borda interna do próprio tile"""
+    near_start = (boxes[:, :2] <= tiles[:, :2] + margin) & (tiles[:, :2] > 0)
+    near_end = (boxes[:, 2:] >= tiles[:, 2:] - margin) & (tiles[:, 2:] < size)
+    return np.concatenate([near_start, near_end], axis=1)
+
+def _continues(box: np.ndarray, cut: np.ndarray, others: np.ndarray, others_cut: np.ndarray,
+               tolerance: float = 0.15) -> np.ndarray:
+    """
+    box e cada uma de others podem ser pedaços do mesmo objeto
+    
+    Num lado cortado em só uma das caixas, a outra tem de ir além do corte;
+    num lado sem corte, os dois lados coincidem (tolerância relativa ao
+    tamanho da menor caixa no eixo).
+    """
+    sizes = np.minimum(box[2:] - box[:2], others[:, 2:] - others[:, :2])
+    slack = np.tile(tolerance * np.maximum(sizes, 1.0), 2) + 2.0
+    sign = np.array([1, 1, -1, -1])  # lados iniciais crescem para dentro, finais para fora
+    # Quanto a outra caixa passa do lado de box (positivo = vai além)
+    beyond_other = (box - others) * sign
+    ok = np.where(cut & ~others_cut, beyond_other >= -slack,
+                  np.where(others_cut & ~cut, -beyond_other >= -slack,
+                           np.where(cut & others_cut, True, np.abs(beyond_other) <= slack)))
+    return ok.all(axis=1)
+
+def _band_ios(box: np.ndarray, others: np.ndarray, bands: np.ndarray) -> np.ndarray:
+    """IoS entre box e cada uma de others, recortadas à faixa correspondente (0 fora dela)"""
+    a = np.concatenate([np.maximum(box[:2], bands[:, :2]), np.minimum(box[2:], bands[:, 2:])], axis=1)
+    b = np.concatenate([np.maximum(others[:, :2], bands[:, :2]), np.minimum(others[:, 2:], bands[:, 2:])], axis=1)
+    
+    def area(c):
+        return np.clip(c[:, 2] - c[:, 0], 0, None) * np.clip(c[:, 3] - c[:, 1], 0, None)
+    
+    inter = area(np.concatenate([np.maximum(a[:, :2], b[:, :2]), np.minimum(a[:, 2:], b[:, 2:])], axis=1))
+    smaller = np.minimum(area(a), area(b))
+    return np.where(smaller > 0, inter / np.maximum(smaller, 1e-6), 0.0)
+
+def block_means(image: np.ndarray, block: int, sample: int = 4) -> np.ndarray:
+    """
+    Média (todos os canais) de cada bloco block x block; bordas parciais incluídas
+    
+    Só 1 pixel a cada sample x sample entra na média: em 4K cai de ~40 ms
+    para ~15 ms e ainda suaviza o ruído do sensor.
+    """
+    sample = max(1, min(sample, block))
+    image = image[::sample, ::sample]
+    block //= sample
+    height, width = image.shape[:2]
+    pad_h, pad_w = -height % block, -width % block
+    if pad_h or pad_w:
+        pad = ((0, pad_h), (0, pad_w)) + ((0, 0),) * (image.ndim - 2)
+        image = np.pad(image, pad, mode='edge')
+    shape = (image.shape[0] // block, block, image.shape[1] // block, block) + image.shape[2:]
+    axes = (1, 3) + tuple(range(4, len(shape)))
+    return image.reshape(shape).mean(axis=axes, dtype=np.float32)
+
+def tile_grid(width: int, height: int, tile: int, overlap: float = 0.2) -> np.ndarray:
+    """Tiles (T, 4) x0, y0, x1, y1 sobrepostos cobrindo a imagem inteira"""
+    stride = max(1, int(tile * (1 - overlap)))
+    
+    def starts(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        positions = list(range(0, length - tile, stride))
+        return positions + [length - tile]
+    
+    return np.array([(x, y, min(x + tile, width), min(y + tile, height))
+                     for y in starts(height) for x in starts(width)], dtype=np.int64)
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Matriz IoU (len(a), len(b)) entre caixas x1, y1, x2, y2"""
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+@dataclass
+class ColumnarVisionResult:
+    """
+    Variante colunar de VisionResult
+    
+    to_dict() mantém o formato por detecção (compatível); to_dict('columns')
+    serializa as colunas diretamente.
+    """
+    timestamp: datetime
+    image_shape: Tuple[int, int, int]
+    columns: VisionColumns
+    confidence_threshold: float
+    processing_time_ms: float
+    tiles: Optional[Dict[str, int]] = None
+    stream: Optional[Dict[str, Any]] = None
+    
+    @property
+    def detections(self) -> List[VisionDetection]:
+        return self.columns.to_detections()
+    
+    def to_dict(self, layout: str = 'rows') -> Dict:
+        result = {
+            'timestamp': self.timestamp.isoformat(),
+            'image_shape': self.image_shape,
+            'confidence_threshold': self.confidence_threshold,
+            'processing_time_ms': self.processing_time_ms,
+            'detection_count': len(self.columns)
+        }
+        if self.tiles:
+            result['tiles'] = self.tiles
+        if self.stream:
+            result['stream'] = self.stream
+        if layout == 'columns':
+            result['columns'] = self.columns.to_dict()
+        else:
+            result['detections'] = self.columns.to_rows()
+        return result
+
 @dataclass
 class AudioTranscription:
     """Resultado de transcrição de áudio"""
@@ -148,15 +448,42 @@ class Embedding:
 class VisionEngine:
     """Engine de visão computacional usando YOLOv8"""
     
-    def __init__(self, model_name: str = 'yolov8n.pt', device: str = 'cpu'):
+    # Lado dos blocos cuja média detecta tiles sem mudança
+    TILE_BLOCK = 8
+    # Streams cujo estado (tiles, sessões de vídeo) é mantido
+    MAX_STREAMS = 8
+    
+    def __init__(
+        self,
+        model_name: str = 'yolov8n.pt',
+        device: str = 'cpu',
+        tile_size: int = 640,
+        tile_overlap: float = 0.2,
+        tile_change_threshold: float = 12.0,
+        merge_threshold: float = 0.6,
+        model: Any = None
+    ):
+        """model: modelo já carregado com a interface do YOLO (benchmarks)"""
         self.model_name = model_name
         self.device = device
-        self.model = None
+        self.model = model
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_change_threshold = tile_change_threshold
+        self.merge_threshold = merge_threshold
+        # stream -> miniaturas e detecções do último quadro, por tile (só
+        # streams identificados)
+        self._tile_state: 'OrderedDict[Optional[str], Dict[str, Any]]' = OrderedDict()
+        self._tile_lock = threading.Lock()
+        # stream -> sessão de vídeo (só streams identificados)
+        self._sessions: 'OrderedDict[str, VisionStream]' = OrderedDict()
         
-        if YOLO_AVAILABLE:
+        if model is not None:
+            logger.info(f"Vision using preloaded model: {model_name}")
+        elif YOLO_AVAILABLE:
             try:
                 logger.info(f"Loading YOLOv8 model: {model_name}")
-                self.model = YOLO(model_name)
+                self.model = _import('ultralytics').YOLO(model_name)
                 self.model.to(device)
                 logger.info("✓ YOLOv8 model loaded")
             except Exception as e:
@@ -166,76 +493,235 @@ class VisionEngine:
     
     def detect_objects(
         self,
-        image_path: str,
-        confidence_threshold: float = 0.5
-    ) -> Optional[VisionResult]:
+        image: ImageInput,
+        confidence_threshold: float = 0.5,
+        classes: Optional[List[str]] = None,
+        top_k: Optional[int] = None,
+        tiled: bool = False,
+        stream: Optional[str] = None
+    ) -> Optional[ColumnarVisionResult]:
         """
         Detectar objetos em uma imagem
         
         Args:
-            image_path: Caminho para a imagem
+            image: Caminho para a imagem ou array HxWx3 uint8 BGR
+                   (quadros recebidos por perception_transport)
             confidence_threshold: Confiança mínima (0.0-1.0)
+            classes: Manter só estas classes (nomes)
+            top_k: Manter só as top_k detecções por score
+            tiled: Dividir imagens grandes em tiles de tile_size (objetos
+                   pequenos em 4K), ver detect_tiled
+            stream: Identificador da câmera; tiles sem mudança desde o
+                    quadro anterior do mesmo stream não são reprocessados
         
         Returns:
-            VisionResult com detecções
+            ColumnarVisionResult com detecções
         """
         if not self.model:
             logger.error("Model not loaded")
             return None
         
-        import time
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         try:
             # Carregar e processar imagem
-            if not PIL_AVAILABLE:
-                logger.error("PIL not available")
+            with tracer.span('vision.decode'):
+                image, image_shape = self._load_image(image)
+            if image is None:
                 return None
             
-            image = Image.open(image_path)
+            # Rodar detecção: (N, 6) x1, y1, x2, y2, conf, cls em NumPy
+            tiles = None
+            if tiled:
+                data, tiles = self.detect_tiled(image, confidence_threshold, stream)
+            else:
+                with tracer.span('vision.inference'):
+                    results = self.model(image, conf=confidence_threshold)
+                    data = self._boxes(results[0]) if results else np.empty((0, 6), np.float32)
             
-            # Rodar detecção
-            results = self.model(image, conf=confidence_threshold)
+            # Filtragem vetorizada, sem objeto por caixa
+            with tracer.span('vision.postprocess', boxes=len(data)):
+                columns = postprocess_boxes(data[:, :4], data[:, 4], data[:, 5],
+                                            getattr(self.model, 'names', {}),
+                                            confidence_threshold, classes, top_k)
             
-            # Processar resultados
-            detections = []
-            if results and len(results) > 0:
-                boxes = results[0].boxes
-                
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    conf = box.conf[0].item()
-                    class_idx = int(box.cls[0].item())
-                    class_name = results[0].names[class_idx]
-                    
-                    area = (x2 - x1) * (y2 - y1)
-                    
-                    detection = VisionDetection(
-                        class_name=class_name,
-                        confidence=conf,
-                        bbox=(x1, y1, x2, y2),
-                        area=area
-                    )
-                    detections.append(detection)
-            
-            processing_time = (time.time() - start_time) * 1000
-            
-            result = VisionResult(
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e6
+            
+            result = ColumnarVisionResult(
                 timestamp=datetime.now(),
-                image_shape=image.size + (3,),
-                detections=detections,
+                image_shape=image_shape,
+                columns=columns,
                 confidence_threshold=confidence_threshold,
-                processing_time_ms=processing_time
+                processing_time_ms=processing_time,
+                tiles=tiles
             )
             
-            logger.info(f"Vision: Detected {len(detections)} objects in {processing_time:.2f}ms")
+            logger.info(f"Vision: Detected {len(columns)} objects in {processing_time:.2f}ms")
             return result
             
         except Exception as e:
             logger.error(f"Vision detection error: {e}")
             return None
     
-    def segment_objects(self, image_path: str) -> Optional[Dict]:
+    def detect_batch(
+        self,
+        images: List[ImageInput],
+        confidence_threshold: float = 0.5,
+        classes: Optional[List[str]] = None,
+        top_k: Optional[int] = None
+    ) -> List[Optional[ColumnarVisionResult]]:
+        """
+        Detectar objetos em várias imagens com uma única chamada ao modelo
+        
+        Se o lote falhar (ex.: um arquivo corrompido), cai para uma chamada
+        por imagem, e só as imagens com problema voltam como None.
+        """
+        if not self.model:
+            logger.error("Model not loaded")
+            return [None] * len(images)
+        
+        start_ns = time.perf_counter_ns()
+        try:
+            with tracer.span('vision.decode', images=len(images)):
+                loaded = [self._load_image(image) for image in images]
+            if any(image is None for image, _ in loaded):
+                raise ValueError('image could not be loaded')
+            with tracer.span('vision.inference', images=len(images)):
+                results = self.model([image for image, _ in loaded], conf=confidence_threshold, verbose=False)
+        except Exception as e:
+            logger.warning(f"Vision batch of {len(images)} failed ({e}), retrying one by one")
+            return [self.detect_objects(image, confidence_threshold, classes, top_k) for image in images]
+        
+        names = getattr(self.model, 'names', {})
+        batch = []
+        with tracer.span('vision.postprocess', images=len(images)):
+            for (_, image_shape), result in zip(loaded, results):
+                data = self._boxes(result)
+                columns = postprocess_boxes(data[:, :4], data[:, 4], data[:, 5], names,
+                                            confidence_threshold, classes, top_k)
+                batch.append(ColumnarVisionResult(datetime.now(), image_shape, columns,
+                                                  confidence_threshold, 0.0))
+        per_image_ms = (time.perf_counter_ns() - start_ns) / 1e6 / max(1, len(images))
+        for result in batch:
+            result.processing_time_ms = per_image_ms
+        logger.info(f"Vision: Batch of {len(images)} images in {per_image_ms * len(images):.2f}ms")
+        return batch
+    
+    @staticmethod
+    def _boxes(result) -> np.ndarray:
+        """Saída de um resultado YOLO como (N, 6) float32, uma única conversão"""
+        return result.boxes.data.cpu().numpy().astype(np.float32, copy=False)
+    
+    def detect_tiled(
+        self,
+        image: ImageInput,
+        confidence_threshold: float = 0.5,
+        stream: Optional[str] = None
+    ) -> Tuple[np.ndarray, Dict[str, int]]:
+        """
+        Detecção em tiles sobrepostos de tile_size, com fusão por NMS
+        
+        Todos os tiles que mudaram desde o quadro anterior do stream vão ao
+        modelo num único lote, na resolução nativa (sem o downscale que faz
+        o YOLO perder objetos pequenos em 4K). Tiles parados reaproveitam as
+        detecções anteriores; sem stream não há reaproveitamento, já que
+        pedidos sem identificação podem vir de câmeras diferentes. Retorna
+        ((N, 6) em coordenadas da imagem, contagem de tiles).
+        """
+        if not isinstance(image, np.ndarray):
+            image = np.asarray(image.convert('RGB'))[:, :, ::-1]
+        height, width = image.shape[:2]
+        grid = tile_grid(width, height, self.tile_size, self.tile_overlap)
+        # Médias de blocos 8x8 (ruído do sensor se cancela, objeto pequeno
+        # que se move ainda muda o próprio bloco); uma passada no quadro.
+        b = self.TILE_BLOCK
+        with tracer.span('vision.tiles.signature', tiles=len(grid)):
+            blocks = block_means(image, b)
+            signatures = [blocks[y0 // b:-(-y1 // b), x0 // b:-(-x1 // b)] for x0, y0, x1, y1 in grid]
+        
+        previous = None
+        if stream is not None:
+            with self._tile_lock:
+                previous = self._tile_state.get(stream)
+        if (previous is None or previous['shape'] != image.shape
+                or previous['confidence'] != confidence_threshold):
+            previous = None
+            changed = list(range(len(grid)))
+        else:
+            changed = [i for i, signature in enumerate(signatures)
+                       if np.abs(signature - previous['signatures'][i]).max() > self.tile_change_threshold]
+        
+        detections = list(previous['detections']) if previous else [None] * len(grid)
+        kept = list(previous['signatures']) if previous else list(signatures)
+        if changed:
+            crops = [image[grid[i, 1]:grid[i, 3], grid[i, 0]:grid[i, 2]] for i in changed]
+            with tracer.span('vision.inference', tiles=len(crops)):
+                results = self.model(crops, conf=confidence_threshold, imgsz=self.tile_size, verbose=False)
+            for i, result in zip(changed, results):
+                data = self._boxes(result).copy()
+                data[:, [0, 2]] += grid[i, 0]
+                data[:, [1, 3]] += grid[i, 1]
+                detections[i] = data
+                # Tiles parados guardam a miniatura da última inferência, então
+                # mudanças lentas acumulam até passar do limiar
+                kept[i] = signatures[i]
+        
+        if stream is not None:
+            with self._tile_lock:
+                self._tile_state[stream] = {
+                    'shape': image.shape,
+                    'confidence': confidence_threshold,
+                    'signatures': kept,
+                    'detections': detections,
+                }
+                self._tile_state.move_to_end(stream)
+                while len(self._tile_state) > self.MAX_STREAMS:
+                    self._tile_state.popitem(last=False)
+        
+        with tracer.span('vision.tiles.merge'):
+            tile_of = np.repeat(np.arange(len(grid)), [len(d) for d in detections])
+            merged = merge_detections(np.concatenate(detections), self.merge_threshold, tile_of, grid)
+        return merged, {'total': len(grid), 'inferred': len(changed)}
+    
+    def _load_image(self, image: ImageInput):
+        """(imagem para o modelo, (largura, altura, canais)); arrays passam direto"""
+        if isinstance(image, np.ndarray):
+            return image, (image.shape[1], image.shape[0], 3)
+        if not PIL_AVAILABLE:
+            logger.error("PIL not available")
+            return None, None
+        image = _import('PIL.Image').open(image)
+        return image, image.size + (3,)
+    
+    def open_stream(self, stream: Optional[str] = None, **detect_options) -> 'VisionStream':
+        """
+        Sessão de vídeo do stream (criada na primeira chamada)
+        
+        detect_options: repassadas a detect_objects nos keyframes; se
+        mudarem entre chamadas, o próximo quadro é keyframe. Sem stream a
+        sessão é nova a cada chamada: quadros de câmeras diferentes na
+        mesma sessão pareceriam movimento e trocariam tracks entre elas.
+        """
+        if stream is None:
+            return VisionStream(self, None, **detect_options)
+        with self._tile_lock:
+            session = self._sessions.get(stream)
+            if session is None:
+                session = self._sessions[stream] = VisionStream(self, stream, **detect_options)
+            else:
+                session.configure(**detect_options)
+            self._sessions.move_to_end(stream)
+            while len(self._sessions) > self.MAX_STREAMS:
+                self._sessions.popitem(last=False)
+        return session
+    
+    def track_frames(self, frames, stream: Optional[str] = None, **options):
+        """Gerador: um ColumnarVisionResult por quadro de uma sequência"""
+        session = VisionStream(self, stream, **options)
+        for frame in frames:
+            yield session.process(frame)
+    
+    def segment_objects(self, image: ImageInput) -> Optional[Dict]:
         """
         Segmentar objetos em uma imagem
         """
@@ -243,10 +729,10 @@ class VisionEngine:
             return None
         
         try:
-            if not PIL_AVAILABLE:
+            image, _ = self._load_image(image)
+            if image is None:
                 return None
             
-            image = Image.open(image_path)
             results = self.model(image, task='segment')
             
             segments = []
@@ -266,6 +752,227 @@ class VisionEngine:
             logger.error(f"Segmentation error: {e}")
             return None
 
+def match_boxes(a: np.ndarray, b: np.ndarray, same: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """Associação gulosa por IoU (maior primeiro); same (len(a), len(b)) restringe pares"""
+    if len(a) == 0 or len(b) == 0:
+        return []
+    iou = np.where(same, box_iou(a, b), -1.0)
+    pairs = []
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < threshold:
+            return pairs
+        pairs.append((int(i), int(j)))
+        iou[i, :] = -1.0
+        iou[:, j] = -1.0
+
+def _subblock(costs: np.ndarray, i: int) -> float:
+    """Ajuste parabólico do mínimo em i (fração de bloco, -0.5 a 0.5)"""
+    if i == 0 or i == len(costs) - 1:
+        return 0.0
+    left, center, right = costs[i - 1], costs[i], costs[i + 1]
+    curvature = left - 2 * center + right
+    if curvature <= 0:
+        return 0.0
+    return float(np.clip((left - right) / (2 * curvature), -0.5, 0.5))
+
+class VisionStream:
+    """
+    Sessão de vídeo: detecção completa só em keyframes, rastreamento entre eles
+    
+    Cada quadro vira uma grade de médias de blocos 8x8 (block_means), a
+    mesma diferença de quadros usada para pular tiles. Por quadro:
+    
+      skip    nada mudou desde o último quadro processado: repete o resultado
+      track   movimento só perto das caixas: cada caixa é propagada por busca
+              local (SAD) do seu recorte do keyframe na grade de blocos,
+              a partir da posição prevista pela velocidade
+      detect  primeiro quadro, keyframe_interval quadros desde o último,
+              movimento fora das caixas (objeto novo) ou alvo perdido;
+              as detecções herdam o track_id da caixa rastreada com maior IoU
+    """
+    
+    BLOCK = 8
+    
+    def __init__(
+        self,
+        engine: VisionEngine,
+        stream: Optional[str] = None,
+        keyframe_interval: int = 15,
+        motion_threshold: float = 12.0,
+        new_motion_blocks: int = 6,
+        search_blocks: int = 4,
+        lost_threshold: float = 20.0,
+        match_iou: float = 0.3,
+        **detect_options
+    ):
+        """
+        Args:
+            keyframe_interval: Quadros processados entre detecções completas
+            motion_threshold: Diferença média de um bloco (0-255) que conta
+                              como movimento
+            new_motion_blocks: Blocos com movimento fora das caixas que
+                               forçam detecção
+            search_blocks: Raio da busca do rastreador, em blocos por quadro
+            lost_threshold: SAD médio acima do qual o alvo é dado como perdido
+            match_iou: IoU mínimo para um track sobreviver a um keyframe
+            detect_options: Repassadas a detect_objects (confidence_threshold,
+                            classes, top_k, tiled)
+        """
+        self.engine = engine
+        self.stream = stream
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold = motion_threshold
+        self.new_motion_blocks = new_motion_blocks
+        self.search_blocks = search_blocks
+        self.lost_threshold = lost_threshold
+        self.match_iou = match_iou
+        self.detect_options = detect_options
+        self.frames = 0
+        self.keyframes = 0
+        self._since_keyframe = 0
+        self._force_keyframe = True
+        self._next_id = 1
+        self._blocks = None
+        self._key_blocks = None
+        self._lock = threading.Lock()
+        self._set_tracks(np.empty((0, 4), np.float32), np.empty(0, np.float32),
+                         np.empty(0, np.int32), np.empty(0, np.int64), {})
+    
+    def configure(self, **detect_options):
+        """Trocar opções de detecção; se mudarem, o próximo quadro é keyframe"""
+        if detect_options and detect_options != self.detect_options:
+            with self._lock:
+                self.detect_options = detect_options
+                self._force_keyframe = True
+    
+    def _set_tracks(self, boxes, scores, class_ids, track_ids, names, velocity=None):
+        self.boxes = boxes.astype(np.float32, copy=True)
+        self.anchors = self.boxes.copy()
+        self.scores = scores
+        self.class_ids = class_ids
+        self.track_ids = track_ids
+        self.names = names
+        self.velocity = velocity if velocity is not None else np.zeros((len(boxes), 2), np.float32)
+    
+    def process(self, frame: np.ndarray) -> Optional[ColumnarVisionResult]:
+        """Processar o próximo quadro (HxWx3 uint8 BGR)"""
+        with self._lock:
+            start = time.perf_counter()
+            with tracer.span('vision.stream.motion') as span:
+                blocks = block_means(frame, self.BLOCK)
+                changed = None
+                if self._blocks is not None and self._blocks.shape == blocks.shape:
+                    changed = np.abs(blocks - self._blocks) > self.motion_threshold
+                mode = self._mode(changed)
+                span.set(mode=mode)
+            
+            result = None
+            if mode == 'detect':
+                result = self.engine.detect_objects(frame, stream=self.stream, **self.detect_options)
+                if result is None:
+                    return None
+                self._keyframe(result.columns, blocks)
+            elif mode == 'track':
+                with tracer.span('vision.stream.track', tracks=len(self.boxes)):
+                    self._track(blocks)
+            
+            self.frames += 1
+            if mode != 'skip':
+                # Quadros pulados não substituem a referência: movimento
+                # lento acumula até passar do limiar
+                self._blocks = blocks
+            
+            areas = ((self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1]))
+            columns = VisionColumns(self.boxes.copy(), self.scores, self.class_ids,
+                                    areas.astype(np.float32), self.names, self.track_ids)
+            return ColumnarVisionResult(
+                timestamp=datetime.now(),
+                image_shape=(frame.shape[1], frame.shape[0], 3),
+                columns=columns,
+                confidence_threshold=self.detect_options.get('confidence_threshold', 0.5),
+                processing_time_ms=(time.perf_counter() - start) * 1000,
+                tiles=result.tiles if result else None,
+                stream={
+                    'id': self.stream,
+                    'frame': self.frames - 1,
+                    'mode': mode,
+                    'motion': float(changed.mean()) if changed is not None else 1.0,
+                    'keyframes': self.keyframes,
+                }
+            )
+    
+    def _mode(self, changed: Optional[np.ndarray]) -> str:
+        if self._force_keyframe or changed is None:
+            return 'detect'
+        if not changed.any():
+            return 'skip'
+        if self._since_keyframe >= self.keyframe_interval:
+            return 'detect'
+        # Movimento fora das caixas (com margem da busca) = objeto novo
+        outside = changed.copy()
+        b, r = self.BLOCK, self.search_blocks
+        for x1, y1, x2, y2 in self.boxes.tolist():
+            outside[max(0, int(y1 // b) - r):int(-(-y2 // b)) + r,
+                    max(0, int(x1 // b) - r):int(-(-x2 // b)) + r] = False
+        if int(outside.sum()) >= self.new_motion_blocks:
+            return 'detect'
+        return 'track'
+    
+    def _keyframe(self, columns: VisionColumns, blocks: np.ndarray):
+        track_ids = np.zeros(len(columns), np.int64)
+        velocity = np.zeros((len(columns), 2), np.float32)
+        same = self.class_ids[:, None] == columns.class_ids[None, :]
+        matched = set()
+        for i, j in match_boxes(self.boxes, columns.boxes, same, self.match_iou):
+            track_ids[j] = self.track_ids[i]
+            velocity[j] = self.velocity[i]
+            matched.add(j)
+        for j in range(len(columns)):
+            if j not in matched:
+                track_ids[j] = self._next_id
+                self._next_id += 1
+        self._set_tracks(columns.boxes, columns.scores, columns.class_ids, track_ids,
+                         columns.names, velocity)
+        self._key_blocks = blocks
+        self._since_keyframe = 0
+        self._force_keyframe = False
+        self.keyframes += 1
+    
+    def _track(self, blocks: np.ndarray):
+        """Busca local de cada recorte do keyframe na grade de blocos atual"""
+        b, r = self.BLOCK, self.search_blocks
+        rows, cols = blocks.shape
+        for k, (x1, y1, x2, y2) in enumerate(self.anchors.tolist()):
+            # Recorte do alvo no keyframe, em blocos (ao menos 1x1)
+            ty, tx = int(y1 // b), int(x1 // b)
+            th = max(1, min(int(-(-y2 // b)), rows) - ty)
+            tw = max(1, min(int(-(-x2 // b)), cols) - tx)
+            template = self._key_blocks[ty:ty + th, tx:tx + tw]
+            th, tw = template.shape
+            
+            # Janela de busca em volta da posição prevista
+            px = (self.boxes[k, 0] + self.velocity[k, 0] - x1) / b + tx
+            py = (self.boxes[k, 1] + self.velocity[k, 1] - y1) / b + ty
+            y0 = int(np.clip(round(py) - r, 0, rows - th))
+            x0 = int(np.clip(round(px) - r, 0, cols - tw))
+            region = blocks[y0:min(rows, y0 + th + 2 * r), x0:min(cols, x0 + tw + 2 * r)]
+            windows = np.lib.stride_tricks.sliding_window_view(region, (th, tw))
+            sad = np.abs(windows - template).mean(axis=(2, 3))
+            dy, dx = np.unravel_index(np.argmin(sad), sad.shape)
+            best = sad[dy, dx]
+            # Perdido: casamento ruim e sem mínimo claro (alvo saiu ou foi coberto)
+            if best > self.lost_threshold and best > 0.5 * float(np.median(sad)):
+                self._force_keyframe = True
+                continue
+            
+            shift = np.array([(x0 + dx - tx + _subblock(sad[dy, :], dx)) * b,
+                              (y0 + dy - ty + _subblock(sad[:, dx], dy)) * b], np.float32)
+            moved = shift - (self.boxes[k, :2] - self.anchors[k, :2])
+            self.velocity[k] = 0.5 * self.velocity[k] + 0.5 * moved
+            self.boxes[k] = self.anchors[k] + np.tile(shift, 2)
+        self._since_keyframe += 1
+
 # ============================================================================
 # MOTOR DE ÁUDIO (WHISPER)
 # ============================================================================
@@ -273,15 +980,18 @@ class VisionEngine:
 class AudioEngine:
     """Engine de processamento de áudio com Whisper"""
     
-    def __init__(self, model_name: str = 'base', device: str = 'cpu'):
+    def __init__(self, model_name: str = 'base', device: str = 'cpu', model: Any = None):
+        """model: modelo já carregado com a interface do Whisper (benchmarks)"""
         self.model_name = model_name
         self.device = device
-        self.model = None
+        self.model = model
         
-        if WHISPER_AVAILABLE:
+        if model is not None:
+            logger.info(f"Whisper using preloaded model: {model_name}")
+        elif WHISPER_AVAILABLE:
             try:
                 logger.info(f"Loading Whisper model: {model_name}")
-                self.model = whisper.load_model(model_name, device=device)
+                self.model = _import('whisper').load_model(model_name, device=device)
                 logger.info("✓ Whisper model loaded")
             except Exception as e:
                 logger.error(f"Failed to load Whisper: {e}")
@@ -290,14 +1000,15 @@ class AudioEngine:
     
     def transcribe(
         self,
-        audio_path: str,
+        audio: AudioInput,
         language: Optional[str] = None
     ) -> Optional[AudioTranscription]:
         """
         Transcrever áudio para texto
         
         Args:
-            audio_path: Caminho para arquivo de áudio
+            audio: Caminho para arquivo de áudio ou mono float32 a 16 kHz
+                   (buffers PCM decodificados por perception_transport)
             language: Código de idioma (ex: 'en', 'pt', None para auto-detect)
         
         Returns:
@@ -307,24 +1018,31 @@ class AudioEngine:
             logger.error("Model not loaded")
             return None
         
-        import time
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         try:
+            # Decodificar antes (ffmpeg), para medir separado da inferência
+            if isinstance(audio, str):
+                with tracer.span('audio.decode'):
+                    audio = _import('whisper').load_audio(audio)
+            
             # Transcrever
             options = {}
             if language:
                 options['language'] = language
             
-            result = self.model.transcribe(audio_path, **options)
+            with tracer.span('audio.inference', samples=len(audio)):
+                result = self.model.transcribe(audio, **options)
             
-            processing_time = (time.time() - start_time) * 1000
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e6
+            
+            duration = len(audio) / transport.WHISPER_SAMPLE_RATE
             
             transcription = AudioTranscription(
                 text=result['text'],
                 language=result.get('language', 'unknown'),
                 confidence=0.85,  # Whisper não fornece confiança por padrão
-                duration_seconds=result.get('duration', 0),
+                duration_seconds=duration,
                 processing_time_ms=processing_time
             )
             
@@ -335,16 +1053,19 @@ class AudioEngine:
             logger.error(f"Transcription error: {e}")
             return None
     
-    def detect_language(self, audio_path: str) -> Optional[str]:
+    def detect_language(self, audio: AudioInput) -> Optional[str]:
         """
-        Detectar idioma de um arquivo de áudio
+        Detectar idioma de um arquivo de áudio (ou buffer float32 a 16 kHz)
         """
         if not self.model:
             return None
         
         try:
             # Carregar áudio e detectar idioma
-            audio = whisper.load_audio(audio_path)
+            whisper = _import('whisper')
+            if isinstance(audio, str):
+                audio = whisper.load_audio(audio)
+            audio = whisper.pad_or_trim(audio)
             mel = whisper.log_mel_spectrogram(audio).to(self.model.device)
             
             _, probs = self.model.detect_language(mel)
@@ -364,14 +1085,17 @@ class AudioEngine:
 class EmbeddingEngine:
     """Engine de embeddings semânticos"""
     
-    def __init__(self, model_name: str = 'BAAI/bge-small-en-v1.5'):
+    def __init__(self, model_name: str = 'BAAI/bge-small-en-v1.5', model: Any = None):
+        """model: modelo já carregado com a interface do SentenceTransformer (benchmarks)"""
         self.model_name = model_name
-        self.model = None
+        self.model = model
         
-        if SENTENCE_TRANSFORMERS_AVAILABLE:
+        if model is not None:
+            logger.info(f"Embedding using preloaded model: {model_name}")
+        elif SENTENCE_TRANSFORMERS_AVAILABLE:
             try:
                 logger.info(f"Loading embedding model: {model_name}")
-                self.model = SentenceTransformer(model_name)
+                self.model = _import('sentence_transformers').SentenceTransformer(model_name)
                 logger.info("✓ Embedding model loaded")
             except Exception as e:
                 logger.error(f"Failed to load embedding model: {e}")
@@ -387,7 +1111,8 @@ class EmbeddingEngine:
             return None
         
         try:
-            vector = self.model.encode(text, convert_to_numpy=True)
+            with tracer.span('embedding.encode', chars=len(text)):
+                vector = self.model.encode(text, convert_to_numpy=True)
             
             embedding = Embedding(
                 text=text,
@@ -411,7 +1136,8 @@ class EmbeddingEngine:
             return None
         
         try:
-            vectors = self.model.encode(texts, convert_to_numpy=True)
+            with tracer.span('embedding.encode', texts=len(texts)):
+                vectors = self.model.encode(texts, convert_to_numpy=True)
             
             embeddings = []
             for text, vector in zip(texts, vectors):
@@ -452,58 +1178,1112 @@ class EmbeddingEngine:
             logger.error(f"Similarity calculation error: {e}")
             return 0.0
 
+# ============================================================================
+# CONTROLE DE ADMISSÃO (prioridades, prazos, descarte de carga)
+# ============================================================================
+
+# Classes de requisição, da mais para a menos prioritária
+PRIORITIES = ('interactive', 'background')
+
+@dataclass(frozen=True)
+class RequestBudget:
+    """Prioridade e prazo de uma requisição (deadline em time.monotonic())"""
+    priority: str = 'interactive'
+    deadline: Optional[float] = None
+    
+    @classmethod
+    def parse(cls, priority: Optional[str] = None, deadline_ms=None,
+              default_priority: str = 'interactive') -> 'RequestBudget':
+        """A partir de cabeçalho, query ou meta de quadro; ValueError se inválido"""
+        priority = (priority or default_priority).lower()
+        if priority not in PRIORITIES:
+            raise ValueError(f'unknown priority {priority!r} (expected one of {", ".join(PRIORITIES)})')
+        deadline = None
+        if deadline_ms not in (None, ''):
+            ms = float(deadline_ms)
+            if ms <= 0:
+                raise ValueError('deadline_ms must be positive')
+            deadline = time.monotonic() + ms / 1000
+        return cls(priority, deadline)
+    
+    @property
+    def rank(self) -> int:
+        return PRIORITIES.index(self.priority)
+    
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo (None sem prazo)"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+    
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def covers(self, other: 'RequestBudget') -> bool:
+        """Trabalho feito com este orçamento serve a other: mesma classe ou melhor, prazo não anterior"""
+        if self.rank > other.rank:
+            return False
+        return self.deadline is None or (other.deadline is not None and self.deadline >= other.deadline)
+
+# Orçamento da requisição atual; chega às filas dos engines pelo contexto
+BUDGET: contextvars.ContextVar[RequestBudget] = contextvars.ContextVar(
+    'request_budget', default=RequestBudget())
+
+class Overloaded(Exception):
+    """Espera prevista acima da meta da classe, ou servidor cheio (HTTP 429)"""
+    
+    def __init__(self, name: str, priority: str, wait_ms: Optional[float] = None, retry_after: float = 1.0):
+        detail = f" (estimated wait {wait_ms:.0f}ms)" if wait_ms is not None else ""
+        super().__init__(f"{name} is overloaded for {priority} requests{detail}")
+        self.name = name
+        self.priority = priority
+        self.wait_ms = wait_ms
+        self.retry_after = retry_after
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': str(self), 'engine': self.name, 'priority': self.priority,
+                'retry_after': self.retry_after}
+
+class DeadlineExceeded(Exception):
+    """Prazo da requisição venceu antes da inferência (HTTP 504)"""
+    
+    def __init__(self, name: str, stage: str):
+        super().__init__(f"deadline exceeded waiting for {name} ({stage})")
+        self.name = name
+        self.stage = stage
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': str(self), 'engine': self.name, 'stage': self.stage}
+
+def queue_targets() -> Dict[str, float]:
+    """Espera máxima prevista na fila de um engine, em ms, por classe"""
+    return {
+        'interactive': float(os.environ.get('KIACHA_QUEUE_TARGET_INTERACTIVE_MS', 250)),
+        'background': float(os.environ.get('KIACHA_QUEUE_TARGET_BACKGROUND_MS', 5000)),
+    }
+
+class EngineQueue:
+    """
+    Fila de inferência de um engine: uma thread, ordem por prioridade
+    
+    Interativas passam na frente das de fundo já enfileiradas (só esperam
+    a chamada em execução). Na entrada, a espera prevista (soma do tempo
+    médio de serviço, por classe, das chamadas à frente) é comparada com
+    a meta da classe: acima dela, Overloaded. Na saída, itens com prazo vencido são
+    descartados sem rodar.
+    """
+    
+    # Peso da última chamada na média móvel do tempo de serviço
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, name: str, targets_ms: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.targets_ms = targets_ms or queue_targets()
+        # Médias separadas: um job em massa custa muito mais que um comando
+        self.service_ms: Dict[str, Optional[float]] = {p: None for p in PRIORITIES}
+        self.stats = {p: {'admitted': 0, 'shed': 0, 'expired': 0} for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=512) for p in PRIORITIES}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running: Optional[Tuple[str, float]] = None
+        self._thread = threading.Thread(target=self._loop, name=f'{name}-infer', daemon=True)
+        self._thread.start()
+    
+    def _service(self, priority: str) -> float:
+        known = [ms for ms in self.service_ms.values() if ms is not None]
+        service = self.service_ms[priority]
+        return service if service is not None else (max(known) if known else 0.0)
+    
+    def _estimate_ms(self, rank: int) -> float:
+        wait = sum(self._service(PRIORITIES[item[0]]) for item in self._heap if item[0] <= rank)
+        if self._running is not None:
+            priority, since = self._running
+            wait += max(self._service(priority) - (time.monotonic() - since) * 1000, 0.0)
+        return wait
+    
+    def estimated_wait_ms(self, priority: str = 'interactive') -> float:
+        with self._cond:
+            return self._estimate_ms(PRIORITIES.index(priority))
+    
+    def submit(self, fn: Callable[[], Any], budget: RequestBudget) -> 'concurrent.futures.Future':
+        """Enfileirar fn; Overloaded / DeadlineExceeded se recusada na entrada"""
+        with self._cond:
+            stats = self.stats[budget.priority]
+            if budget.expired():
+                stats['expired'] += 1
+                raise DeadlineExceeded(self.name, 'queue')
+            wait_ms = self._estimate_ms(budget.rank)
+            if wait_ms > self.targets_ms[budget.priority]:
+                stats['shed'] += 1
+                raise Overloaded(self.name, budget.priority, wait_ms, retry_after=max(1, math.ceil(wait_ms / 1000)))
+            future = concurrent.futures.Future()
+            heapq.heappush(self._heap, (budget.rank, next(self._seq), budget.deadline,
+                                        time.monotonic(), fn, future))
+            stats['admitted'] += 1
+            self._cond.notify()
+        return future
+    
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                rank, _, deadline, queued, fn, future = heapq.heappop(self._heap)
+                now = time.monotonic()
+                priority = PRIORITIES[rank]
+                self._waits[priority].append((now - queued) * 1000)
+                expired = deadline is not None and now >= deadline
+                if expired:
+                    self.stats[priority]['expired'] += 1
+                else:
+                    self._running = (priority, now)
+            if expired:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(DeadlineExceeded(self.name, 'queue'))
+                continue
+            start = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except BaseException as e:
+                    future.set_exception(e)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self._running = None
+                if future.cancelled():
+                    continue
+                previous = self.service_ms[priority]
+                self.service_ms[priority] = (elapsed_ms if previous is None else
+                                             self.EWMA_ALPHA * elapsed_ms + (1 - self.EWMA_ALPHA) * previous)
+    
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            classes = {}
+            for priority in PRIORITIES:
+                waits = np.asarray(self._waits[priority])
+                service = self.service_ms[priority]
+                classes[priority] = dict(
+                    self.stats[priority],
+                    service_ms=round(service, 2) if service is not None else None,
+                    queued=sum(1 for item in self._heap if item[0] == PRIORITIES.index(priority)),
+                    target_ms=self.targets_ms[priority],
+                    wait_p50_ms=round(float(np.percentile(waits, 50)), 2) if len(waits) else None,
+                    wait_p99_ms=round(float(np.percentile(waits, 99)), 2) if len(waits) else None,
+                )
+            return {'queued': len(self._heap), 'classes': classes}
+
+class AdmissionControl:
+    """
+    Vagas de requisições em andamento no servidor (HTTP e socket)
+    
+    Requisições de fundo ocupam no máximo metade das vagas, então sempre
+    sobra espaço para interativas. A requisição admitida leva seu
+    RequestBudget no contexto até as filas dos engines.
+    """
+    
+    def __init__(self, max_inflight: int = 64, default_priority: str = 'interactive'):
+        if default_priority not in PRIORITIES:
+            raise ValueError(f'unknown priority {default_priority!r}')
+        self.max_inflight = max_inflight
+        self.default_priority = default_priority
+        self.inflight = {p: 0 for p in PRIORITIES}
+        self.rejected = {p: 0 for p in PRIORITIES}
+    
+    @classmethod
+    def from_env(cls) -> 'AdmissionControl':
+        return cls(
+            max_inflight=int(os.environ.get('KIACHA_MAX_INFLIGHT', 64)),
+            default_priority=os.environ.get('KIACHA_DEFAULT_PRIORITY', 'interactive'),
+        )
+    
+    def budget(self, priority: Optional[str] = None, deadline_ms=None) -> RequestBudget:
+        return RequestBudget.parse(priority, deadline_ms, self.default_priority)
+    
+    @contextlib.contextmanager
+    def admit(self, budget: RequestBudget):
+        """Ocupar uma vaga durante o bloco; Overloaded se não houver"""
+        total = sum(self.inflight.values())
+        limit = self.max_inflight if budget.priority == 'interactive' else max(1, self.max_inflight // 2)
+        if total >= self.max_inflight or self.inflight[budget.priority] >= limit:
+            self.rejected[budget.priority] += 1
+            raise Overloaded('server', budget.priority)
+        self.inflight[budget.priority] += 1
+        token = BUDGET.set(budget)
+        try:
+            yield budget
+        finally:
+            BUDGET.reset(token)
+            self.inflight[budget.priority] -= 1
+    
+    def status(self) -> Dict[str, Any]:
+        return {'max_inflight': self.max_inflight, 'default_priority': self.default_priority,
+                'inflight': dict(self.inflight), 'rejected': dict(self.rejected)}
+
+# ============================================================================
+# GERENCIADOR DE MODELOS (carregamento, orçamento de memória, LRU)
+# ============================================================================
+
+class EngineNotReady(Exception):
+    """Engine ainda carregando depois do tempo de espera (HTTP 503)"""
+    
+    def __init__(self, name: str, retry_after: float = 5.0):
+        super().__init__(f"{name} engine is still loading")
+        self.name = name
+        self.retry_after = retry_after
+
+def process_rss() -> Optional[int]:
+    """RSS atual do processo em bytes (None se não houver como medir)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+def _torch_module(engine):
+    """nn.Module com os pesos do engine (YOLO guarda em .model.model)"""
+    model = getattr(engine, 'model', None)
+    for candidate in (model, getattr(model, 'model', None)):
+        if hasattr(candidate, 'state_dict') and hasattr(candidate, 'parameters'):
+            return candidate
+    return None
+
+def model_bytes(engine) -> Optional[int]:
+    """Tamanho dos pesos (parâmetros + buffers) ou memory_bytes declarado"""
+    declared = getattr(engine, 'memory_bytes', None)
+    if declared is not None:
+        return int(declared)
+    module = _torch_module(engine)
+    if module is None:
+        return None
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def model_size_hints() -> Dict[str, int]:
+    """Tamanho previsto por engine, em bytes (KIACHA_MODEL_SIZE_VISION_MB etc.)"""
+    hints = {}
+    for name in ('vision', 'audio', 'embedding'):
+        value = os.environ.get(f'KIACHA_MODEL_SIZE_{name.upper()}_MB')
+        if value:
+            hints[name] = int(float(value) * 2**20)
+    return hints
+
+class ModelSlot:
+    """
+    Estado de carregamento de um engine
+    
+    Estados: unavailable (pacote ausente), idle, loading, ready, failed,
+    evicted (descarregado; recarrega pelo factory) e spilled (pesos num
+    arquivo mapeado em memória; recarrega sem reconstruir o modelo).
+    load() roda numa thread; requisições aguardam com wait().
+    """
+    
+    LOADABLE = ('idle', 'evicted', 'spilled')
+    
+    def __init__(self, name: str, factory: Callable[[], Any], available: bool = True):
+        self.name = name
+        self.factory = factory
+        self.state = 'idle' if available else 'unavailable'
+        self.engine = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.size_bytes: Optional[int] = None
+        self.rss_delta: Optional[int] = None
+        self.spill_path: Optional[str] = None
+        self.in_use = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+    
+    @property
+    def settled(self) -> bool:
+        return self.state in ('ready', 'failed', 'unavailable')
+    
+    @property
+    def resident(self) -> bool:
+        return self.state in ('ready', 'loading')
+    
+    def load(self):
+        """Importar a dependência e carregar (ou restaurar) o modelo; bloqueante"""
+        with self._lock:
+            if self.state not in self.LOADABLE:
+                return
+            previous, self.state = self.state, 'loading'
+        start = time.perf_counter()
+        rss_before = process_rss()
+        engine, error = None, None
+        try:
+            if previous == 'spilled':
+                engine = self.engine
+                self._restore(engine)
+            else:
+                engine = self.factory()
+            if getattr(engine, 'model', True) is None:
+                error = 'model failed to load'
+        except Exception as e:
+            error = str(e)
+        self.load_ms = (time.perf_counter() - start) * 1000
+        rss_after = process_rss()
+        with self._lock:
+            if error:
+                self.state, self.error, self.engine = 'failed', error, None
+                logger.error(f"{self.name} engine failed after {self.load_ms:.0f}ms: {error}")
+            else:
+                self.state, self.engine, self.error = 'ready', engine, None
+                if rss_before is not None and rss_after is not None:
+                    self.rss_delta = max(0, rss_after - rss_before)
+                self.size_bytes = model_bytes(engine) or self.rss_delta or self.size_bytes
+                self.loads += 1
+                self.reloads += previous != 'idle'
+                self.last_used = time.monotonic()
+                logger.info(f"✓ {self.name} engine ready in {self.load_ms:.0f}ms"
+                            + (" (reload)" if previous != 'idle' else ""))
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+    
+    def unload(self, cache_dir: Optional[str] = None):
+        """Liberar o modelo; com cache_dir, manter os pesos num arquivo mmap"""
+        with self._lock:
+            if self.state != 'ready' or self.in_use:
+                return False
+            engine = self.engine
+            self.evictions += 1
+            if cache_dir and self._spill(engine, cache_dir):
+                self.state = 'spilled'
+            else:
+                self.state, self.engine = 'evicted', None
+        del engine
+        gc.collect()
+        logger.info(f"{self.name} engine unloaded ({self.state})")
+        return True
+    
+    def _spill(self, engine, cache_dir: str) -> bool:
+        """Trocar os tensores do modelo por views de um arquivo mapeado (torch >= 2.1)"""
+        module = _torch_module(engine)
+        if module is None:
+            return False
+        try:
+            torch = _import('torch')
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, f'{self.name}.weights.pt')
+            torch.save(module.state_dict(), path)
+            module.load_state_dict(torch.load(path, mmap=True, weights_only=True), assign=True)
+            self.spill_path = path
+            return True
+        except Exception as e:
+            logger.warning(f"{self.name}: could not spill weights to {cache_dir}: {e}")
+            return False
+    
+    def _restore(self, engine):
+        """Trazer os pesos do arquivo mapeado de volta para memória anônima"""
+        torch = _import('torch')
+        module = _torch_module(engine)
+        module.load_state_dict(torch.load(self.spill_path, weights_only=True), assign=True)
+    
+    async def wait(self, timeout: float):
+        """Engine pronto, None se indisponível; EngineNotReady se o tempo acabar"""
+        with self._lock:
+            if self.settled:
+                return self.engine
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise EngineNotReady(self.name)
+        return self.engine
+    
+    def status(self) -> Dict[str, Any]:
+        status = {
+            'state': self.state,
+            'resident': self.resident,
+            'loads': self.loads,
+            'reloads': self.reloads,
+            'evictions': self.evictions,
+            'in_use': self.in_use,
+        }
+        if self.size_bytes is not None:
+            status['size_mb'] = round(self.size_bytes / 2**20, 1)
+        if self.rss_delta is not None:
+            status['rss_delta_mb'] = round(self.rss_delta / 2**20, 1)
+        if self.load_ms is not None:
+            status['load_ms'] = round(self.load_ms, 1)
+        if self.last_used:
+            status['idle_s'] = round(time.monotonic() - self.last_used, 1)
+        if self.error:
+            status['error'] = self.error
+        return status
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class ModelManager:
+    """
+    Carrega engines sob demanda dentro de um orçamento de memória
+    
+    Sem orçamento, todos ficam residentes (comportamento anterior). Com
+    orçamento, antes e depois de cada carga o engine usado há mais tempo
+    e sem requisições em andamento é descarregado até o total residente
+    caber; requisições a um engine descarregado o recarregam.
+    
+    O warm-up (fill) não despeja: carrega em série enquanto o próximo
+    engine couber no que sobra do orçamento, pelo tamanho medido na
+    última carga, pela dica de size_hints ou, sem nenhum dos dois, pelo
+    maior engine já medido.
+    """
+    
+    def __init__(
+        self,
+        slots: Dict[str, ModelSlot],
+        budget_bytes: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        ready_timeout: float = 30.0,
+        queue_targets_ms: Optional[Dict[str, float]] = None,
+        size_hints: Optional[Dict[str, int]] = None
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+        
+        self.slots = slots
+        # Bytes previstos por engine antes da primeira carga (padrão model_size_hints())
+        self.size_hints = model_size_hints() if size_hints is None else size_hints
+        self.budget_bytes = budget_bytes
+        self.cache_dir = cache_dir
+        self.ready_timeout = ready_timeout
+        # Com orçamento, cargas em série: as decisões de despejo e a medição
+        # de RSS por modelo só fazem sentido uma de cada vez
+        self._load_lock = threading.Lock() if budget_bytes else None
+        # Com orçamento, o warm-up para quando o orçamento enche
+        self.filled = False
+        self._executor = ThreadPoolExecutor(max_workers=len(slots), thread_name_prefix='model-load')
+        # Inferência fora do event loop, uma thread por engine (os modelos
+        # não são thread-safe; engines diferentes rodam em paralelo), com
+        # fila por prioridade e descarte de carga (EngineQueue)
+        self.queues = {name: EngineQueue(name, queue_targets_ms) for name in slots}
+    
+    def resident_bytes(self, exclude: Optional[str] = None) -> int:
+        return sum(slot.size_bytes or 0 for name, slot in self.slots.items()
+                   if slot.resident and name != exclude)
+    
+    def expected_bytes(self, name: str) -> int:
+        """Tamanho medido, dica ou o maior engine já medido (0 se nada se sabe)"""
+        slot = self.slots[name]
+        if slot.size_bytes:
+            return slot.size_bytes
+        if name in self.size_hints:
+            return self.size_hints[name]
+        return max((other.size_bytes or 0 for other in self.slots.values()), default=0)
+    
+    def _make_room(self, name: str, needed: int):
+        """Descarregar engines LRU ociosos até `needed` bytes caberem no orçamento"""
+        candidates = sorted(
+            (slot for other, slot in self.slots.items()
+             if other != name and slot.state == 'ready' and not slot.in_use),
+            key=lambda slot: slot.last_used
+        )
+        for slot in candidates:
+            if self.resident_bytes(exclude=name) + needed <= self.budget_bytes:
+                return
+            slot.unload(self.cache_dir)
+        if self.resident_bytes(exclude=name) + needed > self.budget_bytes:
+            logger.warning(f"Memory budget exceeded loading {name}: "
+                           f"{(self.resident_bytes(exclude=name) + needed) / 2**20:.0f} MB "
+                           f"> {self.budget_bytes / 2**20:.0f} MB (engines in use)")
+    
+    def load(self, name: str, evict: bool = True) -> bool:
+        """
+        Carregar um engine respeitando o orçamento; bloqueante
+        
+        evict=False (warm-up): não despeja nada, nem antes nem depois; False
+        se o engine não cabe no que sobra do orçamento.
+        """
+        slot = self.slots[name]
+        if self._load_lock is None:
+            slot.load()
+            return True
+        with self._load_lock:
+            if slot.state not in ModelSlot.LOADABLE:
+                return True
+            needed = self.expected_bytes(name)
+            if evict:
+                self._make_room(name, needed)
+            elif self.resident_bytes() + needed > self.budget_bytes:
+                return False
+            slot.load()
+            if slot.state == 'ready':
+                if evict:
+                    self._make_room(name, slot.size_bytes or 0)
+                elif self.resident_bytes() > self.budget_bytes:
+                    logger.warning(f"{name} is larger than expected: "
+                                   f"{self.resident_bytes() / 2**20:.0f} MB resident "
+                                   f"> {self.budget_bytes / 2**20:.0f} MB budget")
+            return True
+    
+    def fill(self):
+        """Carregar em série, sem despejar, até o próximo engine não caber"""
+        for name in self.slots:
+            if not self.load(name, evict=False):
+                break
+        self.filled = True
+    
+    def warm_up(self):
+        """Pré-carregar: em paralelo sem orçamento, em série até encher com orçamento"""
+        if self._load_lock is None:
+            for name in self.slots:
+                self._executor.submit(self.load, name)
+            return
+        self._executor.submit(self.fill)
+    
+    @contextlib.asynccontextmanager
+    async def use(self, name: str):
+        """
+        Engine pronto durante o bloco (não é despejado enquanto em uso)
+        
+        Espera a carga até ready_timeout ou até o prazo da requisição
+        (BUDGET), o que vier antes; no segundo caso, DeadlineExceeded.
+        """
+        slot = self.slots[name]
+        if slot.state in ModelSlot.LOADABLE:
+            asyncio.get_running_loop().run_in_executor(self._executor, self.load, name)
+        remaining = BUDGET.get().remaining()
+        timeout = self.ready_timeout if remaining is None else max(min(self.ready_timeout, remaining), 0)
+        with tracer.span('engine.wait', engine=name, state=slot.state):
+            try:
+                engine = await slot.wait(timeout)
+            except EngineNotReady:
+                if timeout < self.ready_timeout:
+                    raise DeadlineExceeded(name, 'load')
+                raise
+        with slot._lock:
+            if slot.state != 'ready':
+                engine = None
+            else:
+                slot.in_use += 1
+        try:
+            yield engine
+        finally:
+            if engine is not None:
+                with slot._lock:
+                    slot.in_use -= 1
+                    slot.last_used = time.monotonic()
+    
+    async def run(self, name: str, fn: Callable, *args, **kwargs):
+        """
+        Chamar fn (método síncrono do engine) na thread de inferência do engine
+        
+        Roda com uma cópia do contexto: spans e o perfil da requisição
+        continuam na thread de inferência. A fila ordena pela prioridade
+        do BUDGET atual e pode recusar (Overloaded) ou descartar a chamada
+        com prazo vencido (DeadlineExceeded).
+        """
+        submitted = time.perf_counter_ns()
+        
+        def timed():
+            queued_ms = (time.perf_counter_ns() - submitted) / 1e6
+            tracer.start_profile()
+            try:
+                start = time.perf_counter()
+                with tracer.span(f'{name}.run', queue_ms=round(queued_ms, 3)):
+                    result = fn(*args, **kwargs)
+                return result, (time.perf_counter() - start) * 1000
+            finally:
+                tracer.stop_profile()
+        
+        context = contextvars.copy_context()
+        future = self.queues[name].submit(functools.partial(context.run, timed), BUDGET.get())
+        result, elapsed_ms = await asyncio.wrap_future(future)
+        spent = INFERENCE_MS.get()
+        if spent is not None:
+            spent.append(elapsed_ms)
+        return result
+    
+    def status(self) -> Dict[str, Any]:
+        rss = process_rss()
+        return {
+            'budget_mb': round(self.budget_bytes / 2**20, 1) if self.budget_bytes else None,
+            'resident_mb': round(self.resident_bytes() / 2**20, 1),
+            'process_rss_mb': round(rss / 2**20, 1) if rss is not None else None,
+            'weight_cache': self.cache_dir,
+            'queues': {name: queue.status() for name, queue in self.queues.items()},
+        }
+
+# ============================================================================
+# CACHE DE RESULTADOS (hash de conteúdo, coalescência de requisições)
+# ============================================================================
+
+HASH_CHUNK = 1 << 20
+# Tempo de inferência (ms) das chamadas ModelManager.run da tarefa atual
+INFERENCE_MS: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    'inference_ms', default=None)
+
+class ContentHasher:
+    """
+    blake2b do conteúdo de arquivos e quadros
+    
+    O hash de um arquivo é lembrado por (caminho, tamanho, mtime, inode):
+    perguntas repetidas sobre o mesmo arquivo não o relêem, e um arquivo
+    regravado no mesmo caminho gera outra chave.
+    """
+    
+    def __init__(self, max_files: int = 4096):
+        self.max_files = max_files
+        self._files: 'OrderedDict[Tuple, str]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def file(self, path: str) -> str:
+        st = os.stat(path)
+        signature = (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            digest = self._files.get(signature)
+            if digest is not None:
+                self._files.move_to_end(signature)
+                return digest
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._files[signature] = digest
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return digest
+    
+    @staticmethod
+    def array(data: np.ndarray) -> str:
+        h = hashlib.blake2b(f'{data.dtype.str}{data.shape}'.encode(), digest_size=16)
+        h.update(memoryview(np.ascontiguousarray(data)).cast('B'))
+        return h.hexdigest()
+    
+    async def digest(self, source: Union[str, np.ndarray]) -> str:
+        """Hash de um caminho ou array; arquivos e quadros grandes numa thread"""
+        if isinstance(source, np.ndarray):
+            if source.nbytes <= HASH_CHUNK:
+                return self.array(source)
+            return await asyncio.get_running_loop().run_in_executor(None, self.array, source)
+        return await asyncio.get_running_loop().run_in_executor(None, self.file, source)
+
+@dataclass
+class CacheEntry:
+    value: Dict[str, Any]
+    size: int
+    compute_ms: float
+    expires: float
+
+@dataclass
+class _Flight:
+    """Inferência em andamento de uma chave do cache e quantos a esperam"""
+    task: asyncio.Future
+    budget: RequestBudget
+    waiters: int = 0
+
+class ResultCache:
+    """
+    Cache LRU de resultados por (engine, hash do conteúdo, parâmetros)
+    
+    Entradas expiram após ttl segundos; max_entries e max_bytes (tamanho
+    do JSON) limitam o total. Requisições idênticas simultâneas esperam a
+    mesma inferência em vez de rodar o modelo de novo (single-flight),
+    desde que ela rode com orçamento (BUDGET) ao menos tão bom quanto o
+    delas: uma interativa não entra na fila atrás de uma de fundo nem herda
+    um prazo mais curto. Erros não são guardados e chegam a todas as
+    requisições coalescidas, menos os de orçamento (Overloaded,
+    DeadlineExceeded), que fazem a coalescida rodar com o próprio.
+    max_entries=0 desliga o cache (a coalescência continua).
+    """
+    
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1024, max_bytes: int = 64 * 2**20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hasher = ContentHasher()
+        self._entries: 'OrderedDict[Tuple, CacheEntry]' = OrderedDict()
+        self._inflight: Dict[Tuple, List[_Flight]] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0,
+                      'evicted': 0, 'uncacheable': 0, 'budget_reruns': 0,
+                      'saved_ms': 0.0, 'compute_ms': 0.0}
+    
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        """KIACHA_CACHE_TTL (s), KIACHA_CACHE_ENTRIES, KIACHA_CACHE_MB"""
+        return cls(ttl=float(os.environ.get('KIACHA_CACHE_TTL', 60)),
+                   max_entries=int(os.environ.get('KIACHA_CACHE_ENTRIES', 1024)),
+                   max_bytes=int(float(os.environ.get('KIACHA_CACHE_MB', 64)) * 2**20))
+    
+    async def key(self, engine: str, source: Union[str, np.ndarray], **params) -> Tuple:
+        digest = await self.hasher.digest(source)
+        return (engine, digest) + tuple(sorted((k, _freeze(v)) for k, v in params.items()))
+    
+    def _lookup(self, key: Tuple) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            self._drop(key)
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+    
+    def _drop(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+    
+    def _store(self, key: Tuple, value: Dict[str, Any], compute_ms: float):
+        if self.max_entries <= 0:
+            return
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = CacheEntry(value, size, compute_ms, time.monotonic() + self.ttl)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats['evicted'] += 1
+    
+    async def get_or_compute(
+        self,
+        key: Tuple,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Dict[str, Any]], bool] = lambda value: True
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        (resultado, 'hit' | 'coalesced' | 'miss'); compute é uma corrotina
+        
+        A inferência roda numa tarefa própria, que quem espera só observa
+        (shield): cancelar a requisição que a disparou não derruba as
+        coalescidas. A tarefa só é cancelada quando ninguém mais espera.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            self.stats['hits'] += 1
+            self.stats['saved_ms'] += entry.compute_ms
+            return entry.value, 'hit'
+        
+        budget = BUDGET.get()
+        flight = next((f for f in self._inflight.get(key, ())
+                       if not f.task.done() and f.budget.covers(budget)), None)
+        if flight is not None:
+            self.stats['coalesced'] += 1
+            try:
+                value, compute_ms = await self._wait(flight)
+            except (Overloaded, DeadlineExceeded):
+                # Recusa pelo orçamento de outra requisição: tentar com o próprio
+                # (conta como miss abaixo, não como coalescida)
+                self.stats['coalesced'] -= 1
+                self.stats['budget_reruns'] += 1
+            else:
+                self.stats['saved_ms'] += compute_ms
+                return value, 'coalesced'
+        
+        self.stats['misses'] += 1
+        # A tarefa copia o contexto atual (orçamento, trace) da requisição
+        flight = _Flight(asyncio.ensure_future(self._compute(key, compute, cacheable)), budget)
+        flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        self._inflight.setdefault(key, []).append(flight)
+        value, _ = await self._wait(flight)
+        return value, 'miss'
+    
+    async def _wait(self, flight: '_Flight') -> Tuple[Dict[str, Any], float]:
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+    
+    async def _compute(self, key: Tuple, compute: Callable[[], Any],
+                       cacheable: Callable[[Dict[str, Any]], bool]) -> Tuple[Dict[str, Any], float]:
+        spent = []
+        INFERENCE_MS.set(spent)
+        value = await compute()
+        # Tempo nos modelos, sem a espera na fila da thread de inferência
+        compute_ms = sum(spent)
+        self.stats['compute_ms'] += compute_ms
+        if cacheable(value):
+            self._store(key, value, compute_ms)
+        else:
+            self.stats['uncacheable'] += 1
+        return value, compute_ms
+    
+    def _finish(self, key: Tuple, flight: '_Flight'):
+        flights = self._inflight.get(key, [])
+        if flight in flights:
+            flights.remove(flight)
+            if not flights:
+                del self._inflight[key]
+        # Erro sem ninguém esperando (todos cancelaram) não vira aviso no log
+        if not flight.task.cancelled():
+            flight.task.exception()
+    
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+    
+    def status(self) -> Dict[str, Any]:
+        requests = self.stats['hits'] + self.stats['coalesced'] + self.stats['misses']
+        served = self.stats['hits'] + self.stats['coalesced']
+        return {
+            'entries': len(self._entries),
+            'size_kb': round(self.bytes / 1024, 1),
+            'ttl_s': self.ttl,
+            'max_entries': self.max_entries,
+            'max_mb': round(self.max_bytes / 2**20, 1),
+            'requests': requests,
+            'hit_rate': round(served / requests, 3) if requests else None,
+            'inflight': sum(len(flights) for flights in self._inflight.values()),
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.stats.items()},
+        }
+
+def _freeze(value):
+    """Parâmetro em forma hashable (listas viram tuplas)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
 # ============================================================================
 # ORQUESTRADOR MULTIMODAL
 # ============================================================================
 
+def _has_modalities(result: Dict[str, Any]) -> bool:
+    """Só guardar resultados com saída (engine indisponível não vira cache)"""
+    return bool(result.get('modalities'))
+
 class MultimodalPerceptionEngine:
     """Orquestrador principal de percepção multimodal"""
     
-    def __init__(self):
-        self.vision = VisionEngine() if YOLO_AVAILABLE else None
-        self.audio = AudioEngine() if WHISPER_AVAILABLE else None
-        self.embedding = EmbeddingEngine() if SENTENCE_TRANSFORMERS_AVAILABLE else None
+    def __init__(
+        self,
+        lazy: bool = False,
+        ready_timeout: float = 30.0,
+        factories: Optional[Dict[str, Callable[[], Any]]] = None,
+        memory_budget_mb: Optional[float] = None,
+        weight_cache_dir: Optional[str] = None,
+        result_cache: Optional[ResultCache] = None,
+        queue_targets_ms: Optional[Dict[str, float]] = None,
+        admission: Optional[AdmissionControl] = None
+    ):
+        """
+        Args:
+            lazy: Não carregar modelos no construtor; chamar start_warmup()
+                  depois de abrir a porta
+            ready_timeout: Quanto uma requisição espera por um engine em
+                           carregamento antes de receber 503
+            factories: Construtores alternativos por engine ('vision',
+                       'audio', 'embedding'), ex. backends de teste
+            memory_budget_mb: Orçamento para os modelos residentes
+                              (padrão KIACHA_MODEL_BUDGET_MB; vazio = sem limite)
+            weight_cache_dir: Onde manter pesos despejados em arquivo mmap
+                              (padrão KIACHA_MODEL_CACHE_DIR)
+            result_cache: Cache de resultados por conteúdo (padrão
+                          ResultCache.from_env())
+            queue_targets_ms: Espera máxima prevista na fila de cada
+                              engine por prioridade (padrão queue_targets())
+            admission: Vagas de requisições no servidor (padrão
+                       AdmissionControl.from_env())
+        """
+        factories = factories or {}
+        if memory_budget_mb is None and os.environ.get('KIACHA_MODEL_BUDGET_MB'):
+            memory_budget_mb = float(os.environ['KIACHA_MODEL_BUDGET_MB'])
+        if weight_cache_dir is None:
+            weight_cache_dir = os.environ.get('KIACHA_MODEL_CACHE_DIR') or None
+        self.ready_timeout = ready_timeout
+        self.slots = {
+            'vision': ModelSlot('vision', factories.get('vision', VisionEngine),
+                                'vision' in factories or YOLO_AVAILABLE),
+            'audio': ModelSlot('audio', factories.get('audio', AudioEngine),
+                               'audio' in factories or WHISPER_AVAILABLE),
+            'embedding': ModelSlot('embedding', factories.get('embedding', EmbeddingEngine),
+                                   'embedding' in factories or SENTENCE_TRANSFORMERS_AVAILABLE),
+        }
+        self.models = ModelManager(
+            self.slots,
+            budget_bytes=int(memory_budget_mb * 2**20) if memory_budget_mb else None,
+            cache_dir=weight_cache_dir,
+            ready_timeout=ready_timeout,
+            queue_targets_ms=queue_targets_ms
+        )
+        self.cache = result_cache or ResultCache.from_env()
+        self.admission = admission or AdmissionControl.from_env()
+        self._warming = False
+        
+        if not lazy:
+            self.models.fill()
+            logger.info("✓ Multimodal Perception Engine initialized")
+    
+    @property
+    def vision(self) -> Optional[VisionEngine]:
+        return self.slots['vision'].engine if self.slots['vision'].state == 'ready' else None
+    
+    @property
+    def audio(self) -> Optional[AudioEngine]:
+        return self.slots['audio'].engine if self.slots['audio'].state == 'ready' else None
+    
+    @property
+    def embedding(self) -> Optional[EmbeddingEngine]:
+        return self.slots['embedding'].engine if self.slots['embedding'].state == 'ready' else None
+    
+    def start_warmup(self):
+        """Carregar os modelos em threads de fundo (respeitando o orçamento)"""
+        if self._warming:
+            return
+        self._warming = True
+        self.models.warm_up()
+        logger.info("Warming up perception engines in the background...")
+    
+    def use(self, name: str):
+        """async with engine.use('vision') as vision: ... (None se indisponível)"""
+        return self.models.use(name)
+    
+    @property
+    def ready(self) -> bool:
+        """Warm-up concluído (com orçamento, engines fora da memória contam como prontos)"""
+        if self.models.budget_bytes:
+            return self.models.filled and not any(s.state == 'loading' for s in self.slots.values())
+        return all(slot.settled for slot in self.slots.values())
+    
+    def status(self) -> Dict[str, Any]:
+        return {name: slot.status() for name, slot in self.slots.items()}
+    
+    async def _cached(self, engine: str, source: Union[str, np.ndarray], compute, **params) -> Dict[str, Any]:
+        try:
+            with tracer.span('cache.hash'):
+                key = await self.cache.key(engine, source, **params)
+        except OSError:
+            # Arquivo inexistente ou ilegível: o engine reporta o erro como antes
+            return await compute()
+        with tracer.span('cache.lookup') as span:
+            result, status = await self.cache.get_or_compute(key, compute, _has_modalities)
+            span.set(status=status)
+        return dict(result, cache=status)
+    
+    async def process_image(
+        self,
+        image: ImageInput,
+        confidence_threshold: float = 0.5,
+        classes: Optional[List[str]] = None,
+        top_k: Optional[int] = None,
+        layout: str = 'rows',
+        tiled: bool = False,
+        stream: Optional[str] = None,
+        track: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Processar imagem completa (caminho ou quadro decodificado)
+        
+        layout='columns' devolve as detecções como arrays paralelos
+        (ver ColumnarVisionResult), mais barato para muitas caixas.
+        tiled/stream: ver VisionEngine.detect_tiled.
+        track: quadros do mesmo stream passam pela sessão de vídeo
+        (VisionStream): detecção só em keyframes, rastreamento entre eles.
+        Exige stream e um quadro decodificado (ValueError caso contrário).
         
-        logger.info("✓ Multimodal Perception Engine initialized")
+        Fora do modo track, o resultado vem do cache (self.cache) quando a
+        mesma imagem já foi processada com os mesmos parâmetros; o campo
+        'cache' diz se foi hit, coalesced ou miss.
+        """
+        options = {'confidence_threshold': confidence_threshold, 'classes': classes,
+                   'top_k': top_k, 'layout': layout, 'tiled': tiled, 'stream': stream}
+        if track and stream is None:
+            raise ValueError('track requires a stream id')
+        if track and not isinstance(image, np.ndarray):
+            raise ValueError('track requires a decoded frame, not an image path')
+        with tracer.request('process_image', tiled=tiled, track=track):
+            if track:
+                return await self._process_image(image, track=True, **options)
+            return await self._cached('vision', image, lambda: self._process_image(image, **options),
+                                      **options)
     
-    async def process_image(self, image_path: str) -> Dict[str, Any]:
-        """Processar imagem completa"""
+    async def _process_image(
+        self,
+        image: ImageInput,
+        confidence_threshold: float,
+        classes: Optional[List[str]],
+        top_k: Optional[int],
+        layout: str,
+        tiled: bool,
+        stream: Optional[str],
+        track: bool = False
+    ) -> Dict[str, Any]:
         result = {
             'timestamp': datetime.now().isoformat(),
-            'image_path': image_path,
             'modalities': {}
         }
+        if isinstance(image, str):
+            result['image_path'] = image
+        else:
+            result['frame_shape'] = list(image.shape)
         
         # Visão
-        if self.vision:
-            vision_result = self.vision.detect_objects(image_path)
-            if vision_result:
-                result['modalities']['vision'] = vision_result.to_dict()
+        async with self.use('vision') as vision:
+            if vision:
+                options = {'confidence_threshold': confidence_threshold,
+                           'classes': classes, 'top_k': top_k, 'tiled': tiled}
+                if track:
+                    vision_result = await self.models.run(
+                        'vision', vision.open_stream(stream, **options).process, image)
+                else:
+                    vision_result = await self.models.run(
+                        'vision', vision.detect_objects, image, stream=stream, **options)
+                if vision_result:
+                    with tracer.span('vision.serialize', boxes=len(vision_result.columns)):
+                        result['modalities']['vision'] = vision_result.to_dict(layout)
         
         return result
     
-    async def process_audio(self, audio_path: str) -> Dict[str, Any]:
-        """Processar áudio completo"""
+    async def process_audio(
+        self,
+        audio: AudioInput,
+        language: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Processar áudio completo (caminho ou PCM decodificado), com cache"""
+        with tracer.request('process_audio'):
+            return await self._cached('audio', audio, lambda: self._process_audio(audio, language),
+                                      language=language)
+    
+    async def _process_audio(self, audio: AudioInput, language: Optional[str]) -> Dict[str, Any]:
         result = {
             'timestamp': datetime.now().isoformat(),
-            'audio_path': audio_path,
             'modalities': {}
         }
+        if isinstance(audio, str):
+            result['audio_path'] = audio
+        else:
+            result['audio_samples'] = len(audio)
         
         # Áudio
-        if self.audio:
-            transcription = self.audio.transcribe(audio_path)
-            if transcription:
-                result['modalities']['audio'] = transcription.to_dict()
-                
-                # Embedding do texto transcrito
-                if self.embedding:
-                    embedding = self.embedding.embed_text(transcription.text)
-                    if embedding:
-                        result['modalities']['embedding'] = {
-                            'dimension': embedding.dimension,
-                            'model': embedding.model
-                        }
+        async with self.use('audio') as audio_engine:
+            transcription = (await self.models.run('audio', audio_engine.transcribe, audio, language)
+                             if audio_engine else None)
+        if transcription:
+            result['modalities']['audio'] = transcription.to_dict()
+            
+            # Embedding do texto transcrito
+            async with self.use('embedding') as embedder:
+                embedding = (await self.models.run('embedding', embedder.embed_text, transcription.text)
+                             if embedder else None)
+            if embedding:
+                result['modalities']['embedding'] = {
+                    'dimension': embedding.dimension,
+                    'model': embedding.model
+                }
         
         return result
     
@@ -513,7 +2293,16 @@ class MultimodalPerceptionEngine:
         audio_path: Optional[str] = None,
         text: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Processar múltiplas modalidades juntas"""
+        """Processar múltiplas modalidades juntas (spans de cada uma aninhados)"""
+        with tracer.request('process_multimodal'):
+            return await self._process_multimodal(image_path, audio_path, text)
+    
+    async def _process_multimodal(
+        self,
+        image_path: Optional[str],
+        audio_path: Optional[str],
+        text: Optional[str]
+    ) -> Dict[str, Any]:
         result = {
             'timestamp': datetime.now().isoformat(),
             'modalities': {}
@@ -527,8 +2316,10 @@ class MultimodalPerceptionEngine:
         if audio_path:
             tasks.append(self.process_audio(audio_path))
         
-        if text and self.embedding:
-            embedding = self.embedding.embed_text(text)
+        if text:
+            async with self.use('embedding') as embedder:
+                embedding = (await self.models.run('embedding', embedder.embed_text, text)
+                             if embedder else None)
             if embedding:
                 result['modalities']['text_embedding'] = {
                     'dimension': embedding.dimension,
@@ -543,63 +2334,301 @@ class MultimodalPerceptionEngine:
         return result
 
 # ============================================================================
-# REST API SERVER
+# TRANSPORTE BINÁRIO (quadros de câmera / microfone)
 # ============================================================================
 
-async def start_api_server(host: str = '127.0.0.1', port: int = 5555):
-    """Iniciar servidor REST para integração com Brain"""
+def _flag(value) -> bool:
+    return str(value or '').lower() in ('1', 'true', 'yes')
+
+def vision_options(params: Dict) -> Dict[str, Any]:
+    """Opções de detecção a partir de JSON, query string ou meta de quadro"""
+    classes = params.get('classes')
+    if isinstance(classes, str):
+        classes = [c.strip() for c in classes.split(',') if c.strip()]
+    top_k = params.get('top_k')
+    layout = params.get('layout', 'rows')
+    if layout not in ('rows', 'columns'):
+        raise ValueError(f'unknown layout {layout!r}')
+    return {
+        'confidence_threshold': float(params.get('confidence', 0.5)),
+        'classes': classes or None,
+        'top_k': int(top_k) if top_k not in (None, '') else None,
+        'layout': layout,
+        'tiled': _flag(params.get('tiled')),
+        'track': _flag(params.get('track')),
+        'stream': params.get('stream'),
+    }
+
+async def process_frame(
+    engine: MultimodalPerceptionEngine,
+    frame: 'transport.Frame'
+) -> Tuple[int, Dict[str, Any]]:
+    """Decodificar um quadro (sem cópia) e despachar; retorna (status, corpo)"""
     try:
-        from aiohttp import web
+        with tracer.span('frame.decode', bytes=len(frame.payload)):
+            data = transport.decode_frame(frame)
+    except transport.FrameError as e:
+        return 400, {'error': str(e)}
+    
+    try:
+        if frame.kind == transport.KIND_IMAGE:
+            return 200, await engine.process_image(data, **vision_options(frame.meta))
+        return 200, await engine.process_audio(data, frame.meta.get('language'))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    except EngineNotReady as e:
+        return 503, {'error': str(e), 'engine': e.name, 'retry_after': e.retry_after}
+    except Overloaded as e:
+        return 429, e.to_dict()
+    except DeadlineExceeded as e:
+        return 504, e.to_dict()
+
+async def admitted_frame(
+    engine: MultimodalPerceptionEngine,
+    frame: 'transport.Frame'
+) -> Tuple[int, Dict[str, Any]]:
+    """process_frame com prioridade e prazo do meta ('priority', 'deadline_ms')"""
+    try:
+        budget = engine.admission.budget(frame.meta.get('priority'), frame.meta.get('deadline_ms'))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    try:
+        with engine.admission.admit(budget):
+            return await process_frame(engine, frame)
+    except Overloaded as e:
+        return 429, e.to_dict()
+
+async def start_frame_server(engine: MultimodalPerceptionEngine, socket_path: str):
+    """Servidor de quadros com prefixo de tamanho em um Unix socket"""
+    
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    frame = await transport.read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                with tracer.request('frame', force=_flag(frame.meta.get('trace')),
+                                    profile=_flag(frame.meta.get('profile'))) as span:
+                    status, body = await admitted_frame(engine, frame)
+                    span.set(status=status)
+                writer.write(transport.encode_response(status, body))
+                await writer.drain()
+        except transport.FrameError as e:
+            # Cabeçalho inválido: o fluxo perdeu o alinhamento, fechar
+            writer.write(transport.encode_response(400, {'error': str(e)}))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+    logger.info(f"✓ Frame socket listening on {socket_path}")
+    return server
+
+# ============================================================================
+# REST API SERVER
+# ============================================================================
+
+def create_app(engine: MultimodalPerceptionEngine):
+    """Aplicação aiohttp (rotas e middlewares) sobre um engine já criado"""
+    from aiohttp import web
+    
+    @web.middleware
+    async def not_ready_middleware(request, handler):
+        """Engine ainda carregando -> 503 com Retry-After"""
+        try:
+            return await handler(request)
+        except EngineNotReady as e:
+            return web.json_response(
+                {'error': str(e), 'engine': e.name, 'engines': engine.status()},
+                status=503,
+                headers={'Retry-After': str(int(e.retry_after))}
+            )
+    
+    def retry_headers(body: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        if 'retry_after' not in body:
+            return None
+        return {'Retry-After': str(max(1, math.ceil(body['retry_after'])))}
+    
+    @web.middleware
+    async def admission_middleware(request, handler):
+        """
+        Prioridade e prazo da requisição; 429 + Retry-After sob carga
         
-        engine = MultimodalPerceptionEngine()
+        X-Kiacha-Priority: interactive | background (ou ?priority=)
+        X-Kiacha-Deadline-Ms: orçamento em ms a partir da chegada (ou
+        ?deadline_ms=); trabalho vencido é descartado antes da inferência
+        (504). /health e /cache não passam pela admissão.
+        """
+        if request.path in ('/health', '/cache'):
+            return await handler(request)
+        try:
+            budget = engine.admission.budget(
+                request.headers.get('X-Kiacha-Priority') or request.query.get('priority'),
+                request.headers.get('X-Kiacha-Deadline-Ms') or request.query.get('deadline_ms'))
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        try:
+            with engine.admission.admit(budget):
+                return await handler(request)
+        except Overloaded as e:
+            body = e.to_dict()
+            return web.json_response(body, status=429, headers=retry_headers(body))
+        except DeadlineExceeded as e:
+            return web.json_response(e.to_dict(), status=504)
+    
+    @web.middleware
+    async def trace_middleware(request, handler):
+        """
+        Raiz do trace da requisição (amostrada por KIACHA_TRACE_SAMPLE)
         
-        async def handle_image(request):
-            """POST /vision - Processar imagem"""
-            data = await request.json()
-            image_path = data.get('image_path')
-            
-            if not image_path:
-                return web.json_response({'error': 'image_path required'}, status=400)
-            
-            result = await engine.process_image(image_path)
-            return web.json_response(result)
+        X-Kiacha-Trace: 1 / ?trace=1 força o trace; X-Kiacha-Profile: 1 /
+        ?profile=1 também grava um perfil. O id vai em X-Kiacha-Trace-Id.
+        """
+        force = _flag(request.headers.get('X-Kiacha-Trace') or request.query.get('trace'))
+        profile = _flag(request.headers.get('X-Kiacha-Profile') or request.query.get('profile'))
+        with tracer.request(f'{request.method} {request.path}', force=force, profile=profile) as span:
+            trace_id = tracer.current_id()
+            response = await handler(request)
+            span.set(status=response.status)
+        if trace_id is not None:
+            response.headers['X-Kiacha-Trace-Id'] = str(trace_id)
+        return response
+    
+    async def read_binary_frame(request, kind: int, part_name: str):
+        """Quadro de um corpo application/octet-stream ou multipart/form-data"""
+        params = dict(request.query)
+        payload = None
+        if request.content_type.startswith('multipart/'):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == part_name:
+                    payload = await part.read()
+                elif part.name:
+                    params[part.name] = await part.text()
+        else:
+            payload = await request.read()
+        if not payload:
+            raise transport.FrameError(f'{part_name} payload required')
+        fmt, a, b = transport.params_from_query(kind, params)
+        meta = {k: params[k] for k in ('confidence', 'language', 'classes', 'top_k', 'layout',
+                                       'tiled', 'track', 'stream')
+                if k in params}
+        return transport.Frame(kind, fmt, a, b, meta, payload)
+    
+    async def handle_frame(request, kind: int, part_name: str):
+        try:
+            frame = await read_binary_frame(request, kind, part_name)
+        except transport.FrameError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        status, body = await process_frame(engine, frame)
+        return web.json_response(body, status=status, headers=retry_headers(body))
+    
+    async def handle_image_frame(request):
+        """POST /vision/frame - Imagem crua ou JPEG/PNG no corpo (sem arquivo)"""
+        return await handle_frame(request, transport.KIND_IMAGE, 'image')
+    
+    async def handle_audio_pcm(request):
+        """POST /audio/pcm - Buffer PCM no corpo (sem arquivo)"""
+        return await handle_frame(request, transport.KIND_AUDIO, 'audio')
+    
+    async def handle_image(request):
+        """POST /vision - Processar imagem"""
+        data = await request.json()
+        image_path = data.get('image_path')
         
-        async def handle_audio(request):
-            """POST /audio - Processar áudio"""
-            data = await request.json()
-            audio_path = data.get('audio_path')
-            
-            if not audio_path:
-                return web.json_response({'error': 'audio_path required'}, status=400)
-            
-            result = await engine.process_audio(audio_path)
-            return web.json_response(result)
+        if not image_path:
+            return web.json_response({'error': 'image_path required'}, status=400)
         
-        async def handle_multimodal(request):
-            """POST /multimodal - Processar múltiplas modalidades"""
-            data = await request.json()
-            
-            result = await engine.process_multimodal(
-                image_path=data.get('image_path'),
-                audio_path=data.get('audio_path'),
-                text=data.get('text')
-            )
-            return web.json_response(result)
-        
-        async def handle_health(request):
-            """GET /health - Status do servidor"""
-            return web.json_response({
-                'status': 'healthy',
-                'vision_available': engine.vision is not None,
-                'audio_available': engine.audio is not None,
-                'embedding_available': engine.embedding is not None
-            })
-        
-        app = web.Application()
-        app.router.add_post('/vision', handle_image)
-        app.router.add_post('/audio', handle_audio)
-        app.router.add_post('/multimodal', handle_multimodal)
-        app.router.add_get('/health', handle_health)
+        try:
+            result = await engine.process_image(image_path, **vision_options(data))
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response(result)
+    
+    async def handle_audio(request):
+        """POST /audio - Processar áudio"""
+        data = await request.json()
+        audio_path = data.get('audio_path')
+        
+        if not audio_path:
+            return web.json_response({'error': 'audio_path required'}, status=400)
+        
+        result = await engine.process_audio(audio_path)
+        return web.json_response(result)
+    
+    async def handle_multimodal(request):
+        """POST /multimodal - Processar múltiplas modalidades"""
+        data = await request.json()
+        
+        result = await engine.process_multimodal(
+            image_path=data.get('image_path'),
+            audio_path=data.get('audio_path'),
+            text=data.get('text')
+        )
+        return web.json_response(result)
+    
+    async def handle_health(request):
+        """GET /health - Status do servidor e prontidão por engine"""
+        return web.json_response({
+            'status': 'healthy',
+            'ready': engine.ready,
+            'engines': engine.status(),
+            'memory': engine.models.status(),
+            'admission': engine.admission.status(),
+            'cache': engine.cache.status(),
+            'trace': tracer.status(),
+            'vision_available': engine.vision is not None,
+            'audio_available': engine.audio is not None,
+            'embedding_available': engine.embedding is not None
+        })
+    
+    async def handle_cache(request):
+        """GET /cache - Taxa de acerto e tempo poupado; DELETE /cache - Esvaziar"""
+        if request.method == 'DELETE':
+            engine.cache.clear()
+        return web.json_response(engine.cache.status())
+    
+    app = web.Application(client_max_size=transport.MAX_PAYLOAD,
+                          middlewares=[trace_middleware, admission_middleware, not_ready_middleware])
+    app.router.add_post('/vision', handle_image)
+    app.router.add_post('/vision/frame', handle_image_frame)
+    app.router.add_post('/audio', handle_audio)
+    app.router.add_post('/audio/pcm', handle_audio_pcm)
+    app.router.add_post('/multimodal', handle_multimodal)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/cache', handle_cache)
+    app.router.add_delete('/cache', handle_cache)
+    return app
+
+async def start_api_server(
+    host: str = '127.0.0.1',
+    port: int = 5555,
+    socket_path: Optional[str] = None,
+    ready_timeout: Optional[float] = None
+):
+    """Iniciar servidor REST para integração com Brain
+
+    A porta abre antes dos modelos carregarem; o warm-up roda em paralelo
+    e cada requisição espera até ready_timeout (KIACHA_READY_TIMEOUT,
+    padrão 30 s) pelo seu engine antes de receber 503.
+
+    socket_path: Unix socket para o protocolo binário de quadros
+    (padrão KIACHA_PERCEPTION_SOCKET ou perception_transport.DEFAULT_SOCKET_PATH;
+    string vazia desativa)
+    """
+    try:
+        from aiohttp import web
+        
+        if ready_timeout is None:
+            ready_timeout = float(os.environ.get('KIACHA_READY_TIMEOUT', 30))
+        engine = MultimodalPerceptionEngine(lazy=True, ready_timeout=ready_timeout)
+        
+        app = create_app(engine)
         
         runner = web.AppRunner(app)
         await runner.setup()
@@ -608,6 +2637,14 @@ async def start_api_server(host: str = '127.0.0.1', port: int = 5555):
         
         logger.info(f"✓ Multimodal API server listening on {host}:{port}")
         
+        if socket_path is None:
+            socket_path = os.environ.get('KIACHA_PERCEPTION_SOCKET', transport.DEFAULT_SOCKET_PATH)
+        if socket_path and hasattr(asyncio, 'start_unix_server'):
+            await start_frame_server(engine, socket_path)
+        
+        # Só agora carregar os modelos: a porta já aceita /health
+        engine.start_warmup()
+        
         # Manter servidor rodando
         while True:
             await asyncio.sleep(3600)
@@ -620,10 +2657,17 @@ async def start_api_server(host: str = '127.0.0.1', port: int = 5555):
 # ============================================================================
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='KIACHA Multimodal Perception Engine')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    args = parser.parse_args()
+    
     logger.info("Starting KIACHA Multimodal Perception Engine...")
     
     # Iniciar servidor REST
     try:
-        asyncio.run(start_api_server())
+        asyncio.run(start_api_server(args.host, args.port))
     except KeyboardInterrupt:
         logger.info("Shutting down...")
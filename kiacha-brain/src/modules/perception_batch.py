@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+KIACHA OS - Processamento em lote (offline) para o Perception Engine
+
+Backfill de detecções, transcrições e embeddings sobre arquivos de imagens,
+gravações e textos, sem passar pelo servidor REST. Os arquivos vêm de
+diretórios (recursivo) ou manifestos (um caminho por linha, ou JSONL com
+"path"), são agrupados em lotes por engine e distribuídos num pool de
+processos; cada worker carrega os modelos uma vez.
+
+Saída:
+    jsonl   um registro por arquivo (padrão)
+    npz     partes colunares (part-00000.npz...): arrays paralelos por
+            campo, caixas e embeddings concatenados com o índice do registro
+
+A própria saída é o checkpoint: ao reiniciar, arquivos já gravados são
+pulados (uma linha JSONL cortada por uma interrupção é descartada) e o
+trabalho continua de onde parou.
+
+Uso:
+    python3 perception_batch.py run ~/Pictures ~/Recordings -o backfill.jsonl -w 4
+    python3 perception_batch.py run --manifest files.txt -o backfill/ --format npz
+    python3 perception_batch.py benchmark --workers 1,2,4 --stub-ms 40
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.m4a', '.opus'}
+TEXT_EXTENSIONS = {'.txt', '.md'}
+# Engine que processa cada tipo de arquivo
+KIND_ENGINE = {'image': 'vision', 'audio': 'audio', 'text': 'embedding'}
+
+# ============================================================================
+# ENTRADAS
+# ============================================================================
+
+def kind_of(path: str) -> Optional[str]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in AUDIO_EXTENSIONS:
+        return 'audio'
+    if ext in TEXT_EXTENSIONS:
+        return 'text'
+    return None
+
+def read_manifest(path: str) -> List[str]:
+    """Caminhos de um manifesto: texto (um por linha) ou JSONL com "path" """
+    base = os.path.dirname(os.path.abspath(path))
+    paths = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                line = json.loads(line)['path']
+            paths.append(os.path.join(base, line))
+    return paths
+
+def discover(inputs: Iterable[str], manifests: Iterable[str] = ()) -> List[str]:
+    """Arquivos suportados em diretórios/arquivos e manifestos, em ordem estável"""
+    found = set()
+    candidates = [p for m in manifests for p in read_manifest(m)]
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                candidates.extend(os.path.join(root, name) for name in files)
+        else:
+            candidates.append(entry)
+    for path in candidates:
+        if kind_of(path) and os.path.isfile(path):
+            found.add(os.path.abspath(path))
+    return sorted(found)
+
+def make_batches(paths: List[str], batch_size: int) -> List[Tuple[str, List[str]]]:
+    """Lotes de um único tipo de arquivo: [(kind, [paths]), ...]"""
+    by_kind: Dict[str, List[str]] = {}
+    for path in paths:
+        by_kind.setdefault(kind_of(path), []).append(path)
+    return [(kind, group[i:i + batch_size])
+            for kind, group in by_kind.items()
+            for i in range(0, len(group), batch_size)]
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+@dataclass
+class BatchOptions:
+    confidence_threshold: float = 0.5
+    classes: Optional[List[str]] = None
+    top_k: Optional[int] = None
+    language: Optional[str] = None
+    layout: str = 'rows'
+    # Engines simulados que gastam stub_ms de CPU por item (benchmark);
+    # stub_rate (iterações por ms) é calibrado no processo pai
+    stub_ms: Optional[float] = None
+    stub_rate: Optional[float] = None
+
+# Estado de cada processo do pool: opções e engines carregados uma vez
+_options = BatchOptions()
+_engines: Dict[str, Any] = {}
+
+def _perception():
+    try:
+        from . import perception
+    except ImportError:
+        import perception
+    return perception
+
+def _init_worker(options: BatchOptions):
+    global _options
+    _options = options
+    # Uma linha de log por detecção não faz sentido em lote
+    logging.getLogger(_perception().__name__).setLevel(logging.WARNING)
+
+def _engine(name: str):
+    engine = _engines.get(name)
+    if engine is None:
+        if _options.stub_ms is not None:
+            engine = _StubEngine(name, _options.stub_ms, _options.stub_rate or _StubEngine.calibrate())
+        else:
+            perception = _perception()
+            factory = {'vision': perception.VisionEngine, 'audio': perception.AudioEngine,
+                       'embedding': perception.EmbeddingEngine}[name]
+            engine = factory()
+        if getattr(engine, 'model', None) is None:
+            # Sem modelo não há o que gravar; o lote falha e fica para a
+            # próxima execução em vez de virar registros de erro
+            raise RuntimeError(f'{name} engine unavailable')
+        _engines[name] = engine
+    return engine
+
+def _embedding_dict(embedding) -> Optional[Dict[str, Any]]:
+    if embedding is None:
+        return None
+    return {'model': embedding.model, 'dimension': embedding.dimension, 'vector': embedding.vector}
+
+def process_batch(kind: str, paths: List[str]) -> Dict[str, Any]:
+    """Processar um lote no worker; retorna registros e tempo gasto"""
+    start = time.perf_counter()
+    records = []
+    for path in paths:
+        st = os.stat(path)
+        records.append({'path': path, 'kind': kind, 'size': st.st_size,
+                        'mtime_ns': st.st_mtime_ns, 'status': 'ok'})
+
+    if kind == 'image':
+        results = _engine('vision').detect_batch(paths, _options.confidence_threshold,
+                                                 _options.classes, _options.top_k)
+        for record, result in zip(records, results):
+            record['vision'] = result.to_dict(_options.layout) if result else None
+    elif kind == 'audio':
+        audio = _engine('audio')
+        transcripts = [audio.transcribe(path, _options.language) for path in paths]
+        texts = [t.text for t in transcripts if t]
+        embeddings = iter(_engine('embedding').embed_batch(texts) or [None] * len(texts)) if texts else iter(())
+        for record, transcript in zip(records, transcripts):
+            record['audio'] = transcript.to_dict() if transcript else None
+            record['embedding'] = _embedding_dict(next(embeddings)) if transcript else None
+    else:
+        texts = []
+        for path in paths:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                texts.append(f.read())
+        embeddings = _engine('embedding').embed_batch(texts) or [None] * len(texts)
+        for record, embedding in zip(records, embeddings):
+            record['embedding'] = _embedding_dict(embedding)
+
+    output = KIND_ENGINE[kind]
+    for record in records:
+        if record.get(output) is None:
+            record['status'] = 'error'
+            record['error'] = f'{output} failed'
+    return {'records': records, 'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+class _StubEngine:
+    """Engine simulado: stub_ms de CPU por item, saída no formato real"""
+
+    DIMENSION = 384
+    _work = np.random.default_rng(0).random(4096)
+
+    def __init__(self, name: str, stub_ms: float, rate: float):
+        self.name = name
+        self.stub_ms = stub_ms
+        self.rate = rate
+        self.model = 'stub'
+        self.model_name = 'stub'
+
+    @classmethod
+    def calibrate(cls, seconds: float = 0.2) -> float:
+        """Iterações de trabalho por ms neste processo, sem concorrência"""
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            np.sqrt(cls._work).sum()
+            count += 1
+        return count / (seconds * 1000)
+
+    def _busy(self, items: float):
+        # Quantidade fixa de trabalho (não um prazo nem sleep): com mais
+        # workers que núcleos, o tempo cresce como com um modelo de verdade
+        for _ in range(int(self.rate * self.stub_ms * items)):
+            np.sqrt(self._work).sum()
+
+    def detect_batch(self, images, confidence_threshold=0.5, classes=None, top_k=None):
+        perception = _perception()
+        self._busy(len(images))
+        empty = perception.postprocess_boxes(np.empty((0, 4)), np.empty(0), np.empty(0), {})
+        return [perception.ColumnarVisionResult(perception.datetime.now(), (640, 480, 3), empty,
+                                                confidence_threshold, self.stub_ms)
+                for _ in images]
+
+    def transcribe(self, audio, language=None):
+        self._busy(1)
+        return _perception().AudioTranscription('stub transcript', language or 'en', 0.85, 1.0, self.stub_ms)
+
+    def embed_batch(self, texts):
+        perception = _perception()
+        self._busy(len(texts) * 0.1)
+        return [perception.Embedding(text, [0.0] * self.DIMENSION, 'stub', self.DIMENSION) for text in texts]
+
+# ============================================================================
+# SAÍDA E CHECKPOINT
+# ============================================================================
+
+class JsonlWriter:
+    """Um registro JSON por linha; append + fsync por lote"""
+
+    def __init__(self, path: str, retry_errors: bool = False):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            self._recover(retry_errors)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _recover(self, retry_errors: bool):
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                valid_end += len(line)
+                if not (retry_errors and record.get('status') == 'error'):
+                    self.done.add(record['path'])
+        if valid_end < os.path.getsize(self.path):
+            logger.warning(f"Dropping a partial record at the end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def write(self, records: List[Dict[str, Any]]):
+        self._file.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(r['path'] for r in records)
+
+    def close(self):
+        self._file.close()
+
+class NpzWriter:
+    """
+    Partes colunares part-NNNNN.npz num diretório, gravadas de forma atômica
+
+    Campos por registro: path, kind, status, error, size, mtime_ns, text.
+    Detecções: det_record (índice do registro), det_boxes (M, 4),
+    det_scores, det_class_ids; class_names é o JSON da tabela de classes.
+    Embeddings: emb_record e emb_vectors (K, D) float32.
+    """
+
+    def __init__(self, path: str, retry_errors: bool = False):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.done: Set[str] = set()
+        self.parts = 0
+        for name in sorted(os.listdir(path)):
+            if name.startswith('part-') and name.endswith('.npz'):
+                with np.load(os.path.join(path, name)) as part:
+                    ok = part['status'] != 'error' if retry_errors else slice(None)
+                    self.done.update(part['path'][ok].tolist())
+                self.parts = max(self.parts, int(name[5:10]) + 1)
+
+    def write(self, records: List[Dict[str, Any]]):
+        columns: Dict[str, list] = {k: [] for k in ('det_record', 'det_boxes', 'det_scores',
+                                                    'det_class_ids', 'emb_record', 'emb_vectors')}
+        class_names: Dict[int, str] = {}
+        for i, record in enumerate(records):
+            vision = (record.get('vision') or {}).get('columns')
+            if vision:
+                columns['det_record'].extend([i] * len(vision['scores']))
+                columns['det_boxes'].extend(vision['boxes'])
+                columns['det_scores'].extend(vision['scores'])
+                columns['det_class_ids'].extend(vision['class_ids'])
+                class_names.update({int(k): v for k, v in vision['class_names'].items()})
+            embedding = record.get('embedding')
+            if embedding:
+                columns['emb_record'].append(i)
+                columns['emb_vectors'].append(embedding['vector'])
+
+        arrays = {
+            'path': np.array([r['path'] for r in records]),
+            'kind': np.array([r['kind'] for r in records]),
+            'status': np.array([r['status'] for r in records]),
+            'error': np.array([r.get('error', '') for r in records]),
+            'size': np.array([r['size'] for r in records], dtype=np.int64),
+            'mtime_ns': np.array([r['mtime_ns'] for r in records], dtype=np.int64),
+            'text': np.array([(r.get('audio') or {}).get('text', '') for r in records]),
+            'det_record': np.array(columns['det_record'], dtype=np.int32),
+            'det_boxes': np.array(columns['det_boxes'], dtype=np.float32).reshape(-1, 4),
+            'det_scores': np.array(columns['det_scores'], dtype=np.float32),
+            'det_class_ids': np.array(columns['det_class_ids'], dtype=np.int32),
+            'class_names': np.array(json.dumps(class_names)),
+            'emb_record': np.array(columns['emb_record'], dtype=np.int32),
+            'emb_vectors': (np.array(columns['emb_vectors'], dtype=np.float32) if columns['emb_vectors']
+                            else np.empty((0, 0), dtype=np.float32)),
+        }
+        final = os.path.join(self.path, f'part-{self.parts:05d}.npz')
+        tmp = final + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, final)
+        self.parts += 1
+        self.done.update(r['path'] for r in records)
+
+    def close(self):
+        pass
+
+def open_writer(path: str, fmt: str, retry_errors: bool = False):
+    return (NpzWriter if fmt == 'npz' else JsonlWriter)(path, retry_errors)
+
+# ============================================================================
+# EXECUÇÃO
+# ============================================================================
+
+@dataclass
+class RunStats:
+    total: int = 0
+    skipped: int = 0
+    processed: int = 0
+    errors: int = 0
+    failed_batches: int = 0
+    seconds: float = 0.0
+    workers: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def items_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+def _limit_threads(workers: int):
+    """Dividir os núcleos entre os workers (BLAS/OpenMP/torch herdam do ambiente)"""
+    threads = str(max(1, (os.cpu_count() or 1) // workers))
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ.setdefault(var, threads)
+
+def run(
+    paths: List[str],
+    writer,
+    options: BatchOptions,
+    workers: int = 1,
+    batch_size: int = 16,
+    progress_every: float = 10.0
+) -> RunStats:
+    """Processar os arquivos ainda não presentes na saída; grava lote a lote"""
+    stats = RunStats(total=len(paths))
+    pending = [p for p in paths if p not in writer.done]
+    stats.skipped = len(paths) - len(pending)
+    if stats.skipped:
+        logger.info(f"Resuming: {stats.skipped} of {len(paths)} files already in the output")
+    batches = make_batches(pending, batch_size)
+    if not batches:
+        return stats
+
+    import multiprocessing
+    _limit_threads(workers)
+    start = last_report = time.perf_counter()
+    queue = iter(batches)
+    # spawn: os workers não herdam threads nem estado de torch do processo pai
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(options,)) as pool:
+        running = {}
+
+        def submit():
+            batch = next(queue, None)
+            if batch is not None:
+                running[pool.submit(process_batch, *batch)] = batch
+
+        # Poucos lotes em voo por worker: memória limitada e checkpoints frequentes
+        for _ in range(workers * 2):
+            submit()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, batch = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stats.failed_batches += 1
+                    logger.error(f"Batch of {len(batch)} {kind} files failed: {e}")
+                else:
+                    writer.write(result['records'])
+                    stats.processed += len(batch)
+                    stats.errors += sum(r['status'] == 'error' for r in result['records'])
+                    stats.workers[result['pid']] = stats.workers.get(result['pid'], 0) + len(batch)
+                submit()
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                last_report = now
+                logger.info(f"  {stats.processed}/{len(pending)} files, "
+                            f"{stats.processed / (now - start):.1f} files/s")
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+def benchmark(workers: List[int], files: int = 192, batch_size: int = 8, stub_ms: float = 40.0):
+    """Vazão com 1..N workers sobre engines simulados (CPU real por item)"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, 'data')
+        os.makedirs(data)
+        kinds = ['.jpg', '.wav', '.jpg', '.txt']
+        for i in range(files):
+            with open(os.path.join(data, f'item_{i:05d}{kinds[i % len(kinds)]}'), 'wb') as f:
+                f.write(b'kiacha ' * 64)
+        paths = discover([data])
+        options = BatchOptions(stub_ms=stub_ms, stub_rate=_StubEngine.calibrate())
+
+        logger.info(f"[Batch] benchmark ({files} files, batches of {batch_size}, "
+                    f"simulated {stub_ms:.0f} ms of CPU per item, {os.cpu_count()} CPUs)")
+        base = None
+        for count in workers:
+            output = os.path.join(tmp, f'out_{count}.jsonl')
+            writer = open_writer(output, 'jsonl')
+            stats = run(paths, writer, options, workers=count, batch_size=batch_size)
+            writer.close()
+            base = base or stats.items_per_second
+            results.append((count, stats))
+            logger.info(f"  {count:2d} workers  {stats.seconds:6.2f} s  {stats.items_per_second:7.1f} files/s  "
+                        f"speedup {stats.items_per_second / base:4.2f}x")
+
+        # Retomada: metade da saída some (simulando interrupção) e roda de novo
+        output = os.path.join(tmp, f'out_{workers[-1]}.jsonl')
+        with open(output, 'rb') as f:
+            lines = f.readlines()
+        with open(output, 'wb') as f:
+            f.writelines(lines[:len(lines) // 2])
+            f.write(lines[len(lines) // 2][:10])
+        writer = open_writer(output, 'jsonl')
+        stats = run(paths, writer, options, workers=workers[-1], batch_size=batch_size)
+        writer.close()
+        logger.info(f"  resume after interruption: {stats.skipped} skipped, {stats.processed} processed")
+    return results
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='KIACHA offline bulk perception')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='process files, resuming from existing output')
+    run_parser.add_argument('inputs', nargs='*', help='files or directories (recursive)')
+    run_parser.add_argument('--manifest', action='append', default=[],
+                            help='file list: one path per line, or JSONL with "path"')
+    run_parser.add_argument('-o', '--output', required=True)
+    run_parser.add_argument('--format', choices=('jsonl', 'npz'), default='jsonl')
+    run_parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    run_parser.add_argument('-b', '--batch-size', type=int, default=16)
+    run_parser.add_argument('--confidence', type=float, default=0.5)
+    run_parser.add_argument('--classes', help='comma separated class names to keep')
+    run_parser.add_argument('--top-k', type=int)
+    run_parser.add_argument('--language')
+    run_parser.add_argument('--retry-errors', action='store_true',
+                            help='reprocess files recorded with status "error"')
+    run_parser.add_argument('--stub-ms', type=float, help=argparse.SUPPRESS)
+
+    bench_parser = sub.add_parser('benchmark', help='throughput with 1..N workers on simulated engines')
+    bench_parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    bench_parser.add_argument('--files', type=int, default=192)
+    bench_parser.add_argument('--batch-size', type=int, default=8)
+    bench_parser.add_argument('--stub-ms', type=float, default=40.0)
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        benchmark([int(n) for n in args.workers.split(',')], args.files, args.batch_size, args.stub_ms)
+        return 0
+
+    paths = discover(args.inputs, args.manifest)
+    if not paths:
+        logger.error("No supported files found")
+        return 1
+    options = BatchOptions(
+        confidence_threshold=args.confidence,
+        classes=[c.strip() for c in args.classes.split(',')] if args.classes else None,
+        top_k=args.top_k,
+        language=args.language,
+        layout='columns' if args.format == 'npz' else 'rows',
+        stub_ms=args.stub_ms,
+        stub_rate=_StubEngine.calibrate() if args.stub_ms is not None else None,
+    )
+    writer = open_writer(args.output, args.format, args.retry_errors)
+    logger.info(f"{len(paths)} files, {args.workers} workers, batches of {args.batch_size} -> {args.output}")
+    try:
+        stats = run(paths, writer, options, args.workers, args.batch_size)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun the same command to resume")
+        return 130
+    finally:
+        writer.close()
+
+    logger.info(f"✓ {stats.processed} processed, {stats.skipped} already done, {stats.errors} errors, "
+                f"{stats.failed_batches} failed batches, {stats.items_per_second:.1f} files/s")
+    return 1 if stats.failed_batches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1184 @@
+#!/usr/bin/env python3
+"""
+KIACHA OS - Suite de benchmarks do Perception Engine
+
+Mede VisionEngine, AudioEngine, EmbeddingEngine e o servidor (socket de
+quadros e aiohttp) sobre corpora sintéticos gerados com semente fixa:
+quadros com objetos retangulares, clipes de áudio e frases. Sem pesos
+locais, os engines usam modelos simulados com a interface real e
+latência configurável (sleep, como uma GPU: não disputa o GIL), então a
+suite roda offline e o que varia entre execuções é só o custo do código
+em volta do modelo.
+
+Cenários:
+    latency   chamadas isoladas por engine (p50/p90/p99)
+    batch     vazão de detect_batch / embed_batch por tamanho de lote
+    load      clientes concorrentes no socket de quadros e no HTTP (p50/p99)
+    overload  comandos de voz com prazo contra embeddings em massa: fila
+              única x prioridades x prioridades com descarte (p50/p99)
+    memory    RSS ao carregar cada engine e pico de heap Python por chamada
+
+Cenários de componente (sempre com modelos simulados, qualquer backend):
+    startup      tempo de import e time-to-first-request: carga no construtor x warm-up paralelo
+    postprocess  pós-processamento de detecções: laço por caixa x vetorizado
+    tiles        quadro 4K com objetos pequenos: imagem inteira x tiles
+    stream       vídeo sintético: detecção em todo quadro x VisionStream
+    cache        rajadas sobre os mesmos arquivos: sem cache x coalescência x cache
+
+Backends:
+    stub      sempre modelos simulados (padrão; resultados comparáveis entre máquinas)
+    real      modelos reais, só para engines com pesos já em disco (nada é baixado)
+    auto      real quando há pesos locais, simulado nos demais
+
+O resultado é JSON (stdout ou -o), com ambiente e configuração, para
+acompanhar regressões; --compare aponta métricas que pioraram além da
+tolerância em relação a uma execução anterior.
+
+Uso:
+    python3 perception_bench.py -o bench.json
+    python3 perception_bench.py --scenarios latency,load --concurrency 1,8,32
+    python3 perception_bench.py --backend auto -o real.json
+    python3 perception_bench.py --scenarios startup,tiles,stream
+    python3 perception_bench.py -o new.json --compare bench.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from . import perception
+    from . import perception_transport as transport
+except ImportError:
+    import perception
+    import perception_transport as transport
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+SCENARIOS = ('latency', 'batch', 'load', 'overload', 'memory',
+             'startup', 'postprocess', 'tiles', 'stream', 'cache')
+ENGINES = ('vision', 'audio', 'embedding')
+# ms por chamada de um item nos modelos simulados
+DEFAULT_STUB_MS = {'vision': 20.0, 'audio': 60.0, 'embedding': 3.0}
+
+# ============================================================================
+# CORPORA SINTÉTICOS
+# ============================================================================
+
+WORDS = ('open', 'close', 'the', 'door', 'window', 'lights', 'kitchen', 'music', 'volume',
+         'timer', 'minutes', 'call', 'message', 'weather', 'today', 'tomorrow', 'battery',
+         'network', 'update', 'system', 'screen', 'brightness', 'camera', 'photo', 'please')
+
+def synthetic_images(count: int, width: int = 640, height: int = 480, objects: int = 6,
+                     seed: int = 0) -> List[np.ndarray]:
+    """
+    Quadros HxWx3 uint8 BGR com objetos retangulares
+
+    Cada objeto tem valor único no canal 0 (o que o detector simulado
+    procura); os canais 1 e 2 têm textura, para o hash de conteúdo e a
+    decodificação terem o custo de um quadro de verdade.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = np.zeros((height, width, 3), np.uint8)
+        image[:, :, 1:] = rng.integers(0, 256, (height, width, 2), dtype=np.uint8)
+        for value in range(1, objects + 1):
+            w, h = rng.integers(24, max(25, width // 4)), rng.integers(24, max(25, height // 4))
+            x, y = rng.integers(0, width - w), rng.integers(0, height - h)
+            image[y:y + h, x:x + w, 0] = value
+        images.append(image)
+    return images
+
+def synthetic_audio(count: int, seconds: float = 5.0, seed: int = 0) -> List[np.ndarray]:
+    """Clipes mono float32 a 16 kHz: tons com envelope de sílabas + ruído"""
+    rng = np.random.default_rng(seed)
+    rate = transport.WHISPER_SAMPLE_RATE
+    t = np.arange(int(seconds * rate), dtype=np.float32) / rate
+    clips = []
+    for _ in range(count):
+        tone = np.sin(2 * np.pi * rng.uniform(120, 300) * t)
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(2, 5) * t)
+        noise = rng.standard_normal(len(t)).astype(np.float32) * 0.05
+        clips.append((0.3 * tone * envelope + noise).astype(np.float32))
+    return clips
+
+def synthetic_texts(count: int, seed: int = 0, min_words: int = 4, max_words: int = 24) -> List[str]:
+    rng = np.random.default_rng(seed)
+    return [' '.join(rng.choice(WORDS, rng.integers(min_words, max_words + 1)))
+            for _ in range(count)]
+
+def corpus_digest(images: Sequence[np.ndarray], clips: Sequence[np.ndarray], texts: Sequence[str]) -> str:
+    """Hash dos corpora: execuções só são comparáveis com as mesmas entradas"""
+    h = hashlib.blake2b(digest_size=8)
+    for array in list(images) + list(clips):
+        h.update(memoryview(np.ascontiguousarray(array)).cast('B'))
+    for text in texts:
+        h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+# ============================================================================
+# MODELOS SIMULADOS
+# ============================================================================
+
+@dataclass
+class StubLatency:
+    """Custo simulado: ms para um item, lote de n custa ms * n ** batch_exponent"""
+    ms: float
+    batch_exponent: float = 0.8
+
+    def cost_ms(self, items: int = 1) -> float:
+        return self.ms * items ** self.batch_exponent
+
+    def wait(self, items: int = 1):
+        time.sleep(self.cost_ms(items) / 1000)
+
+class StubTensor(np.ndarray):
+    """ndarray com .cpu()/.numpy() como um tensor (sem torch)"""
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.view(np.ndarray)
+
+class StubDetector:
+    """
+    Interface do YOLO; acha os objetos de synthetic_images
+
+    Cada objeto é uma região com valor único (1-255) no canal 0 e só é
+    "visto" se tiver ao menos min_pixels depois de a imagem ser reduzida
+    para imgsz.
+    """
+    names = {0: 'object'}
+
+    def __init__(self, latency: StubLatency, min_pixels: float = 8):
+        self.latency = latency
+        self.min_pixels = min_pixels
+        self.calls = 0
+
+    def __call__(self, images, conf=0.25, imgsz=640, **_):
+        images = [images] if isinstance(images, np.ndarray) else images
+        self.calls += len(images)
+        self.latency.wait(len(images))
+        return [self._detect(image, min(1.0, imgsz / max(image.shape[:2]))) for image in images]
+
+    def _detect(self, image: np.ndarray, scale: float):
+        ys, xs = np.nonzero(image[:, :, 0])
+        values = image[ys, xs, 0]
+        order = np.argsort(values, kind='stable')
+        ys, xs, values = ys[order], xs[order], values[order]
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else []
+        boxes = np.array([[xs[a:b].min(), ys[a:b].min(), xs[a:b].max() + 1, ys[a:b].max() + 1, 0.9, 0]
+                          for a, b in zip(starts, list(starts[1:]) + [len(values)])],
+                         dtype=np.float32).reshape(-1, 6)
+        visible = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) * scale >= self.min_pixels
+        result = type('Result', (), {})()
+        result.boxes = type('Boxes', (), {'data': boxes[visible].view(StubTensor)})()
+        return result
+
+class StubWhisper:
+    """Interface do Whisper: texto determinístico a partir do próprio áudio"""
+
+    def __init__(self, latency: StubLatency):
+        self.latency = latency
+        self.device = 'cpu'
+
+    def transcribe(self, audio: np.ndarray, language: Optional[str] = None, **_) -> Dict[str, Any]:
+        self.latency.wait()
+        seed = int.from_bytes(hashlib.blake2b(memoryview(audio[:4096]).cast('B'), digest_size=8).digest(), 'little')
+        rng = np.random.default_rng(seed)
+        text = ' '.join(rng.choice(WORDS, max(1, int(len(audio) / transport.WHISPER_SAMPLE_RATE * 2))))
+        return {'text': text, 'language': language or 'en', 'segments': []}
+
+class StubEncoder:
+    """Interface do SentenceTransformer: vetor unitário derivado do texto"""
+
+    def __init__(self, latency: StubLatency, dimension: int = 384):
+        self.latency = latency
+        self.dimension = dimension
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, sentences, convert_to_numpy: bool = True, **_):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.latency.wait(len(texts))
+        vectors = np.stack([self._vector(t) for t in texts]) if texts else np.empty((0, self.dimension), np.float32)
+        return vectors[0] if single else vectors
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+def local_weights() -> Dict[str, Optional[str]]:
+    """Pesos já em disco por engine (None: o pacote falta ou teria que baixar)"""
+    home_cache = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    yolo = os.environ.get('KIACHA_BENCH_YOLO', 'yolov8n.pt')
+    whisper = os.path.join(home_cache, 'whisper', os.environ.get('KIACHA_BENCH_WHISPER', 'base') + '.pt')
+    hub = os.environ.get('HF_HUB_CACHE') or os.path.join(
+        os.environ.get('HF_HOME', os.path.join(home_cache, 'huggingface')), 'hub')
+    embedder = os.path.join(hub, 'models--' + os.environ.get(
+        'KIACHA_BENCH_EMBEDDING', 'BAAI/bge-small-en-v1.5').replace('/', '--'))
+    return {
+        'vision': yolo if perception.YOLO_AVAILABLE and os.path.exists(yolo) else None,
+        'audio': whisper if perception.WHISPER_AVAILABLE and os.path.exists(whisper) else None,
+        'embedding': embedder if perception.SENTENCE_TRANSFORMERS_AVAILABLE and os.path.isdir(embedder) else None,
+    }
+
+def engine_factories(backend: str, stub_ms: Dict[str, float],
+                     batch_exponent: float = 0.8) -> Tuple[Dict[str, Callable[[], Any]], Dict[str, str]]:
+    """(construtor por engine, backend escolhido por engine)"""
+    weights = local_weights() if backend != 'stub' else {}
+    factories, chosen = {}, {}
+    for name in ENGINES:
+        if weights.get(name):
+            path = weights[name]
+            if name == 'vision':
+                factories[name] = lambda path=path: perception.VisionEngine(path)
+            elif name == 'audio':
+                factories[name] = lambda: perception.AudioEngine(os.environ.get('KIACHA_BENCH_WHISPER', 'base'))
+            else:
+                factories[name] = lambda: perception.EmbeddingEngine(
+                    os.environ.get('KIACHA_BENCH_EMBEDDING', 'BAAI/bge-small-en-v1.5'))
+            chosen[name] = 'real'
+        elif backend == 'real':
+            chosen[name] = 'unavailable'
+        else:
+            latency = StubLatency(stub_ms[name], batch_exponent)
+            factories[name] = {
+                'vision': lambda latency=latency: perception.VisionEngine('stub', model=StubDetector(latency)),
+                'audio': lambda latency=latency: perception.AudioEngine('stub', model=StubWhisper(latency)),
+                'embedding': lambda latency=latency: perception.EmbeddingEngine('stub', model=StubEncoder(latency)),
+            }[name]
+            chosen[name] = 'stub'
+    return factories, chosen
+
+def build_engines(factories: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Construir cada engine medindo tempo de carga, RSS e bytes do modelo"""
+    engines, loading = {}, {}
+    for name, factory in factories.items():
+        rss = perception.process_rss()
+        start = time.perf_counter()
+        engine = factory()
+        elapsed = time.perf_counter() - start
+        if getattr(engine, 'model', None) is None:
+            logger.warning(f"{name} engine has no model, skipped")
+            continue
+        after = perception.process_rss()
+        model_bytes = perception.model_bytes(engine)
+        engines[name] = engine
+        loading[name] = {
+            'load_ms': elapsed * 1000,
+            'rss_delta_mb': (after - rss) / 2**20 if rss is not None and after is not None else None,
+            'model_mb': model_bytes / 2**20 if model_bytes else None,
+        }
+    return engines, loading
+
+# ============================================================================
+# CENÁRIOS
+# ============================================================================
+
+def summarize(samples_ms: Sequence[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if not len(samples):
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {'count': int(len(samples)), 'mean_ms': float(samples.mean()), 'min_ms': float(samples.min()),
+            'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99), 'max_ms': float(samples.max())}
+
+def _calls(engines: Dict[str, Any], corpora: Dict[str, list]) -> Dict[str, Callable[[int], Any]]:
+    """Uma chamada isolada por engine sobre o i-ésimo item do corpus"""
+    calls = {}
+    if 'vision' in engines:
+        images = corpora['images']
+        calls['vision'] = lambda i: engines['vision'].detect_objects(images[i % len(images)], 0.25)
+    if 'audio' in engines:
+        clips = corpora['audio']
+        calls['audio'] = lambda i: engines['audio'].transcribe(clips[i % len(clips)], 'en')
+    if 'embedding' in engines:
+        texts = corpora['texts']
+        calls['embedding'] = lambda i: engines['embedding'].embed_text(texts[i % len(texts)])
+    return calls
+
+def _stub_ms(engine) -> Optional[float]:
+    latency = getattr(engine.model, 'latency', None)
+    return latency.cost_ms() if latency else None
+
+def bench_latency(engines: Dict[str, Any], corpora: Dict[str, list],
+                  iterations: int = 50, warmup: int = 3) -> Dict[str, Any]:
+    """
+    Latência de uma chamada por engine, sem concorrência
+
+    Com modelos simulados, overhead_p50_ms é o que passa do custo
+    simulado: código do engine e a geração da saída do próprio stub.
+    """
+    results = {}
+    for name, call in _calls(engines, corpora).items():
+        for i in range(warmup):
+            call(i)
+        samples, failed = [], 0
+        for i in range(iterations):
+            start = time.perf_counter()
+            failed += call(i) is None
+            samples.append((time.perf_counter() - start) * 1000)
+        stats = summarize(samples)
+        model_ms = _stub_ms(engines[name])
+        stats.update(errors=failed, model_ms=model_ms,
+                     overhead_p50_ms=stats['p50_ms'] - model_ms if model_ms is not None else None)
+        results[name] = stats
+        logger.info(f"  {name:10s} p50 {stats['p50_ms']:8.2f} ms | p99 {stats['p99_ms']:8.2f} ms"
+                    + (f" | overhead {stats['overhead_p50_ms']:6.2f} ms" if model_ms is not None else ''))
+    return results
+
+def bench_batch(engines: Dict[str, Any], corpora: Dict[str, list],
+                sizes: Sequence[int] = (1, 4, 16), rounds: int = 3) -> Dict[str, Any]:
+    """Itens por segundo de detect_batch / embed_batch por tamanho de lote"""
+    results = {}
+    jobs = []
+    if 'vision' in engines:
+        jobs.append(('vision', corpora['images'], lambda items: engines['vision'].detect_batch(items, 0.25)))
+    if 'embedding' in engines:
+        jobs.append(('embedding', corpora['texts'], engines['embedding'].embed_batch))
+    for name, items, run in jobs:
+        results[name] = {}
+        for size in sizes:
+            batch = [items[i % len(items)] for i in range(size)]
+            run(batch)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                output = run(batch)
+            elapsed = (time.perf_counter() - start) / rounds
+            failed = size if output is None else sum(r is None for r in output)
+            results[name][str(size)] = {'items_per_s': size / elapsed, 'batch_ms': elapsed * 1000,
+                                        'item_ms': elapsed * 1000 / size, 'errors': failed}
+            logger.info(f"  {name:10s} batch {size:3d}: {size / elapsed:8.1f} items/s "
+                        f"({elapsed * 1000 / size:6.2f} ms/item)")
+    return results
+
+def bench_memory(engines: Dict[str, Any], corpora: Dict[str, list], loading: Dict[str, Dict[str, Any]],
+                 iterations: int = 10) -> Dict[str, Any]:
+    """RSS da carga (build_engines) e pico de heap Python (tracemalloc) por chamada"""
+    results = {}
+    for name, call in _calls(engines, corpora).items():
+        call(0)
+        tracemalloc.start()
+        try:
+            peaks = []
+            for i in range(iterations):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                call(i)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        finally:
+            tracemalloc.stop()
+        results[name] = dict(loading.get(name, {}), call_peak_mb=max(peaks) / 2**20,
+                             call_mean_mb=float(np.mean(peaks)) / 2**20)
+        rss = results[name].get('rss_delta_mb')
+        logger.info(f"  {name:10s} load RSS {rss if rss is not None else float('nan'):7.1f} MB | "
+                    f"peak heap per call {results[name]['call_peak_mb']:7.2f} MB")
+    rss = perception.process_rss()
+    results['process_rss_mb'] = rss / 2**20 if rss is not None else None
+    return results
+
+# ---------------------------------------------------------------------------
+# Carga concorrente
+# ---------------------------------------------------------------------------
+
+def load_requests(corpora: Dict[str, list], count: int, audio_share: float, seed: int = 0) -> List[Tuple]:
+    """
+    (tipo, fmt, a, b, payload) por requisição
+
+    Cada quadro leva o número da requisição no canal 2, então nenhum
+    resultado sai do cache nem é coalescido: mede-se o caminho completo.
+    """
+    rng = np.random.default_rng(seed)
+    images, clips = corpora['images'], corpora['audio']
+    requests = []
+    for i in range(count):
+        if rng.random() < audio_share:
+            clip = clips[i % len(clips)].copy()
+            clip[:2] = (i % 997) / 1e4, (i // 997) / 1e4
+            requests.append(('audio', transport.AUDIO_F32LE, transport.WHISPER_SAMPLE_RATE, 1, clip.tobytes()))
+        else:
+            frame = images[i % len(images)].copy()
+            frame[0, :2, 2] = i % 256, i // 256
+            height, width = frame.shape[:2]
+            requests.append(('vision', transport.IMAGE_BGR24, width, height, frame.tobytes()))
+    return requests
+
+async def _closed_loop(requests: List[Tuple], concurrency: int, send) -> Dict[str, Any]:
+    """concurrency clientes, cada um manda a próxima requisição ao receber a resposta"""
+    pending = iter(requests)
+    samples: Dict[str, List[float]] = {'vision': [], 'audio': []}
+    errors: Dict[int, int] = {}
+
+    async def client(index: int):
+        async with send(index) as request:
+            for kind, fmt, a, b, payload in pending:
+                start = time.perf_counter()
+                status = await request(kind, fmt, a, b, payload)
+                if status == 200:
+                    samples[kind].append((time.perf_counter() - start) * 1000)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done = sum(len(s) for s in samples.values())
+    return {
+        'concurrency': concurrency,
+        'requests_per_s': done / elapsed,
+        'all': summarize(samples['vision'] + samples['audio']),
+        **{kind: summarize(s) for kind, s in samples.items() if s},
+        'errors': {str(k): v for k, v in errors.items()},
+    }
+
+def _socket_sender(path: str):
+    import contextlib
+
+    @contextlib.asynccontextmanager
+    async def connect(_):
+        reader, writer = await asyncio.open_unix_connection(path)
+
+        async def request(kind, fmt, a, b, payload):
+            code = transport.KIND_IMAGE if kind == 'vision' else transport.KIND_AUDIO
+            writer.write(transport.encode_frame(code, fmt, a, b, payload))
+            writer.write(payload)
+            await writer.drain()
+            _, status, size = transport.RESPONSE_HEADER.unpack(
+                await reader.readexactly(transport.RESPONSE_HEADER.size))
+            await reader.readexactly(size)
+            return status
+
+        try:
+            yield request
+        finally:
+            writer.close()
+    return connect
+
+def _http_sender(base_url: str, session):
+    import contextlib
+
+    @contextlib.asynccontextmanager
+    async def connect(_):
+        async def request(kind, fmt, a, b, payload):
+            if kind == 'vision':
+                url = f'{base_url}/vision/frame?format=bgr24&width={a}&height={b}'
+            else:
+                url = f'{base_url}/audio/pcm?format=f32le&sample_rate={a}&channels={b}'
+            async with session.post(url, data=payload,
+                                    headers={'Content-Type': 'application/octet-stream'}) as response:
+                await response.read()
+                return response.status
+        yield request
+    return connect
+
+def bench_load(factories: Dict[str, Callable[[], Any]], corpora: Dict[str, list],
+               concurrency: Sequence[int] = (1, 4, 16), requests: int = 120,
+               audio_share: float = 0.2, seed: int = 0) -> Dict[str, Any]:
+    """Carga concorrente no socket de quadros e no servidor HTTP, p50/p99 por nível"""
+    import tempfile
+
+    workload = load_requests(corpora, requests, audio_share, seed)
+
+    def unavailable():
+        raise RuntimeError('no local weights')
+
+    async def run() -> Dict[str, Any]:
+        # Sem armazenar resultados: os níveis repetem as mesmas requisições
+        engine = perception.MultimodalPerceptionEngine(
+            factories={name: factories.get(name, unavailable) for name in ENGINES},
+            result_cache=perception.ResultCache(max_entries=0))
+        results: Dict[str, Any] = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, 'bench.sock')
+            server = await perception.start_frame_server(engine, socket_path)
+            try:
+                results['socket'] = [await _closed_loop(workload, c, _socket_sender(socket_path))
+                                     for c in concurrency]
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        try:
+            import aiohttp
+            from aiohttp import web
+        except ImportError:
+            results['http'] = {'skipped': 'aiohttp not installed'}
+            return results
+        runner = web.AppRunner(perception.create_app(engine))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            limit = aiohttp.TCPConnector(limit=max(concurrency))
+            async with aiohttp.ClientSession(connector=limit) as session:
+                sender = _http_sender(f'http://{host}:{port}', session)
+                results['http'] = [await _closed_loop(workload, c, sender) for c in concurrency]
+        finally:
+            await runner.cleanup()
+        return results
+
+    results = asyncio.run(run())
+    for transport_name, levels in results.items():
+        if isinstance(levels, dict):
+            logger.info(f"  {transport_name:6s} skipped: {levels['skipped']}")
+            continue
+        for level in levels:
+            overall = level['all']
+            logger.info(f"  {transport_name:6s} x{level['concurrency']:<3d} {level['requests_per_s']:7.1f} req/s | "
+                        f"p50 {overall.get('p50_ms', float('nan')):8.2f} ms | "
+                        f"p99 {overall.get('p99_ms', float('nan')):8.2f} ms | errors {sum(level['errors'].values())}")
+    return results
+
+# ---------------------------------------------------------------------------
+# Sobrecarga: voz interativa x embeddings em massa
+# ---------------------------------------------------------------------------
+
+OVERLOAD_MODES = {
+    # Fila única por ordem de chegada (comportamento antes das prioridades)
+    'fifo': {'interactive': float('inf'), 'background': float('inf')},
+    'priority': {'interactive': 250.0, 'background': 5000.0},
+    'priority+shedding': {'interactive': 250.0, 'background': 200.0},
+}
+
+def bench_overload(factories: Dict[str, Callable[[], Any]], corpora: Dict[str, list],
+                   background_clients: int = 16, bulk_size: int = 32, commands: int = 40,
+                   interval_ms: float = 150.0, deadline_ms: float = 1000.0,
+                   seed: int = 0) -> Dict[str, Any]:
+    """
+    Comandos de voz (áudio + embedding da transcrição, com prazo) chegando
+    enquanto background_clients jobs de embed_batch(bulk_size) ocupam a
+    fila do engine de embeddings
+
+    Compara fila única, prioridades e prioridades com descarte de carga
+    (jobs de fundo recusados com 429 esperam Retry-After e tentam de novo).
+    """
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(interval_ms / 1000, commands))
+    clips = [clip.copy() for clip in (corpora['audio'] * commands)[:commands]]
+    for i, clip in enumerate(clips):
+        clip[0] = i / 1e4
+    texts = corpora['texts']
+
+    async def run(mode: str) -> Dict[str, Any]:
+        fifo = mode == 'fifo'
+        engine = perception.MultimodalPerceptionEngine(
+            factories=factories, result_cache=perception.ResultCache(max_entries=0),
+            queue_targets_ms=OVERLOAD_MODES[mode],
+            admission=perception.AdmissionControl(max_inflight=4 * (background_clients + commands)))
+        latencies: List[float] = []
+        outcomes: Dict[str, int] = {}
+        bulk = {'done': 0, 'shed': 0}
+        stop = asyncio.Event()
+
+        def count(key: str):
+            outcomes[key] = outcomes.get(key, 0) + 1
+
+        async def background(index: int):
+            budget = engine.admission.budget('interactive' if fifo else 'background')
+            batch = [texts[(index + j) % len(texts)] for j in range(bulk_size)]
+            while not stop.is_set():
+                try:
+                    with engine.admission.admit(budget):
+                        async with engine.use('embedding') as embedder:
+                            await engine.models.run('embedding', embedder.embed_batch, batch)
+                    bulk['done'] += 1
+                except perception.Overloaded as e:
+                    bulk['shed'] += 1
+                    await asyncio.sleep(e.retry_after)
+
+        async def command(index: int):
+            await asyncio.sleep(arrivals[index])
+            budget = engine.admission.budget('interactive', None if fifo else deadline_ms)
+            start = time.perf_counter()
+            try:
+                with engine.admission.admit(budget):
+                    await engine.process_audio(clips[index])
+            except perception.Overloaded:
+                count('429')
+            except perception.DeadlineExceeded:
+                count('504')
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+                count('200')
+
+        workers = [asyncio.create_task(background(i)) for i in range(background_clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(command(i) for i in range(commands)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*workers)
+        queue = engine.models.queues['embedding'].status()['classes']
+        return {
+            'interactive': dict(summarize(latencies), outcomes=outcomes),
+            'background': {'jobs_per_s': bulk['done'] / elapsed, 'shed': bulk['shed']},
+            'embedding_queue': queue,
+        }
+
+    results = {}
+    for mode in OVERLOAD_MODES:
+        results[mode] = result = asyncio.run(run(mode))
+        interactive = result['interactive']
+        logger.info(f"  {mode:18s} interactive p50 {interactive.get('p50_ms', float('nan')):7.1f} ms | "
+                    f"p99 {interactive.get('p99_ms', float('nan')):7.1f} ms | {interactive['outcomes']} | "
+                    f"background {result['background']['jobs_per_s']:5.1f} jobs/s, "
+                    f"{result['background']['shed']} shed")
+    return results
+
+# ============================================================================
+# COMPONENTES
+# ============================================================================
+
+HEAVY_MODULES = ('ultralytics', 'whisper', 'cv2', 'PIL', 'sentence_transformers')
+
+def _time_import(statement: str) -> float:
+    """ms para executar um import num interpretador novo"""
+    code = ("import time; t = time.perf_counter(); " + statement +
+            "; print((time.perf_counter() - t) * 1000)")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def bench_startup(load_seconds: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Tempo de import e time-to-first-request: carga sequencial no construtor
+    (comportamento antigo) vs porta aberta + warm-up paralelo
+
+    Os modelos são simulados (sleep, que libera o GIL como o carregamento de
+    pesos do torch) para o resultado não depender dos pacotes instalados.
+    """
+    load_seconds = load_seconds or {'vision': 0.6, 'audio': 0.9, 'embedding': 0.3}
+
+    installed = [m for m in HEAVY_MODULES if importlib.util.find_spec(m) is not None]
+    lazy_ms = _time_import('import perception')
+    eager_ms = _time_import('import perception' + ''.join(f'; import {m}' for m in installed))
+
+    class StubVision:
+        model = 'stub'
+
+        def __init__(self):
+            time.sleep(load_seconds['vision'])
+
+        def detect_objects(self, image, confidence_threshold=0.5, **options):
+            columns = perception.postprocess_boxes(np.empty((0, 4)), np.empty(0), np.empty(0), {})
+            return perception.ColumnarVisionResult(datetime.now(), (image.shape[1], image.shape[0], 3),
+                                                   columns, confidence_threshold, 0.0)
+
+    def stub(name):
+        def factory():
+            time.sleep(load_seconds[name])
+            return type(f'Stub{name.title()}', (), {'model': 'stub'})()
+        return factory
+
+    factories = {'vision': StubVision, 'audio': stub('audio'), 'embedding': stub('embedding')}
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+    async def first_requests(lazy: bool) -> Tuple[float, float, float]:
+        start = time.perf_counter()
+        engine = perception.MultimodalPerceptionEngine(lazy=lazy, factories=factories)
+        if lazy:
+            engine.start_warmup()
+        accepting = time.perf_counter() - start
+        await engine.process_image(frame)
+        first = time.perf_counter() - start
+        while not engine.ready:
+            await asyncio.sleep(0.005)
+        return accepting, first, time.perf_counter() - start
+
+    eager = asyncio.run(first_requests(False))
+    lazy = asyncio.run(first_requests(True))
+
+    logger.info("[Startup] benchmark")
+    logger.info(f"  import perception:           {lazy_ms:8.1f} ms "
+                f"(with eager imports of {', '.join(installed) or 'nothing installed'}: {eager_ms:.1f} ms)")
+    logger.info(f"  simulated model loads:       " +
+                ', '.join(f"{k} {v:.1f}s" for k, v in load_seconds.items()))
+    for label, (accepting, first, ready) in (('sequential, in __init__', eager),
+                                              ('parallel warm-up', lazy)):
+        logger.info(f"  {label:24s} port open {accepting * 1000:7.0f} ms | "
+                    f"first /vision {first * 1000:7.0f} ms | all ready {ready * 1000:7.0f} ms")
+    return {'import_ms': lazy_ms, 'eager_import_ms': eager_ms,
+            **{label: {'port_open_ms': accepting * 1000, 'first_request_ms': first * 1000,
+                       'ready_ms': ready * 1000}
+               for label, (accepting, first, ready) in (('eager', eager), ('lazy', lazy))}}
+
+def bench_postprocess(sizes: Tuple[int, ...] = (10, 100, 1000), repeat: int = 200) -> Dict[int, Dict[str, float]]:
+    """
+    Pós-processamento de detecções: laço por caixa (antigo) vs vetorizado
+
+    Simula a saída do YOLO (Boxes com xyxy/conf/cls/data); usa tensores torch
+    quando instalado, senão arrays NumPy com a mesma interface.
+    """
+    torch = perception._import('torch') if importlib.util.find_spec('torch') else None
+    rng = np.random.default_rng(0)
+    names = {i: f'class_{i}' for i in range(80)}
+
+    class Boxes:
+        def __init__(self, data):
+            self.data = data
+
+        def __len__(self):
+            return len(self.data)
+
+        def __getitem__(self, i):
+            return Boxes(self.data[i][None])
+
+        xyxy = property(lambda self: self.data[:, :4])
+        conf = property(lambda self: self.data[:, 4])
+        cls = property(lambda self: self.data[:, 5])
+
+    def per_box(boxes) -> List[Dict]:
+        detections = []
+        for box in boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            conf = box.conf[0].item()
+            class_name = names[int(box.cls[0].item())]
+            detections.append(perception.VisionDetection(class_name, conf, (x1, y1, x2, y2),
+                                                         (x2 - x1) * (y2 - y1)))
+        return [d.to_dict() for d in detections]
+
+    def vectorized(boxes, layout):
+        data = boxes.data.cpu().numpy()
+        columns = perception.postprocess_boxes(data[:, :4], data[:, 4], data[:, 5], names, 0.0)
+        return columns.to_rows() if layout == 'rows' else columns.to_dict()
+
+    def timed(fn, *args) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(*args)
+        return (time.perf_counter() - start) / repeat * 1e6
+
+    results = {}
+    logger.info(f"[Postprocess] benchmark ({'torch' if torch else 'numpy stand-in'} tensors, "
+                f"{repeat} runs, microseconds per image)")
+    for n in sizes:
+        xy = rng.uniform(0, 600, (n, 2))
+        wh = rng.uniform(5, 200, (n, 2))
+        data = np.column_stack([xy, xy + wh, rng.uniform(0, 1, n), rng.integers(0, 80, n)]).astype(np.float32)
+        boxes = Boxes(torch.from_numpy(data) if torch else data.view(StubTensor))
+        assert len(per_box(boxes)) == len(vectorized(boxes, 'rows')) == n
+        results[n] = {
+            'per_box_us': timed(per_box, boxes),
+            'vectorized_rows_us': timed(vectorized, boxes, 'rows'),
+            'vectorized_columns_us': timed(vectorized, boxes, 'columns'),
+        }
+        r = results[n]
+        logger.info(f"  {n:5d} boxes  per-box {r['per_box_us']:9.1f} | "
+                    f"vectorized rows {r['vectorized_rows_us']:8.1f} | "
+                    f"columns {r['vectorized_columns_us']:8.1f}")
+    return results
+
+def bench_tiles(objects: int = 60, object_size: int = 24, infer_ms: float = 25.0) -> Dict[str, Any]:
+    """
+    Quadro 4K com objetos pequenos: imagem inteira vs tiles (e tiles parados)
+
+    O modelo é simulado (StubDetector): objetos com menos de 8 px depois
+    da redução para imgsz se perdem, como acontece com o YOLO.
+    """
+    rng = np.random.default_rng(0)
+    height, width = 2160, 3840
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    truth = []
+    # Uma célula por objeto, sem sobreposição (oclusão mudaria o recall)
+    cell = object_size * 4
+    cells = rng.choice((width // cell) * (height // cell), objects, replace=False)
+    for value, index in enumerate(cells.tolist(), 1):
+        x = index % (width // cell) * cell + int(rng.integers(0, cell - object_size))
+        y = index // (width // cell) * cell + int(rng.integers(0, cell - object_size))
+        frame[y:y + object_size, x:x + object_size] = (value, 255, 255)
+        truth.append((x, y, x + object_size, y + object_size))
+    truth = np.array(truth, dtype=np.float32)
+
+    model = StubDetector(StubLatency(infer_ms, 1.0))
+    engine = perception.VisionEngine(model_name='stub', model=model)
+
+    def recall(data: np.ndarray) -> float:
+        found = sum(bool(((np.abs(data[:, :4] - box) <= 1).all(axis=1)).any()) for box in truth)
+        return found / len(truth)
+
+    def run(label: str, fn) -> Dict[str, Any]:
+        model.calls = 0
+        start = time.perf_counter()
+        data = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        row = {'ms': elapsed, 'inferences': model.calls, 'detections': len(data), 'recall': recall(data)}
+        logger.info(f"  {label:28s} {elapsed:8.1f} ms | {row['inferences']:3d} inferences | "
+                    f"{row['detections']:3d} boxes | recall {row['recall']:.0%}")
+        return row
+
+    # Segundo quadro: o objeto 1 anda 40 px para a direita
+    moved = frame.copy()
+    x0, y0, x1, y1 = truth[0].astype(int)
+    nx = min(x0 + 40, width - object_size)
+    moved[y0:y1, x0:x1] = 0
+    moved[y0:y1, nx:nx + object_size] = (1, 255, 255)
+
+    logger.info(f"[Tiles] benchmark ({width}x{height}, {objects} objects of {object_size}px, "
+                f"simulated {infer_ms:.0f} ms per model input)")
+    results = {
+        'full_frame': run('full frame (imgsz 640)', lambda: engine._boxes(engine.model(frame)[0])),
+        'tiled_first': run('tiled, first frame', lambda: engine.detect_tiled(frame, stream='cam')[0]),
+        'tiled_static': run('tiled, unchanged frame', lambda: engine.detect_tiled(frame, stream='cam')[0]),
+    }
+    truth[0, [0, 2]] = nx, nx + object_size
+    results['tiled_moved'] = run('tiled, one object moved', lambda: engine.detect_tiled(moved, stream='cam')[0])
+    return results
+
+def bench_stream(frames: int = 240, infer_ms: float = 25.0) -> Dict[str, Any]:
+    """
+    Vídeo 1280x720 sintético: detecção em todo quadro vs VisionStream
+
+    Três objetos texturizados (dois se movendo, um parado), uma pausa de
+    movimento no meio e um quarto objeto que entra na metade do vídeo.
+    Mede chamadas ao modelo (StubDetector), tempo por quadro e IoU médio
+    das caixas com a posição real.
+    """
+    rng = np.random.default_rng(0)
+    height, width, size = 720, 1280, 64
+    # Fundo estático texturizado só nos canais 1-2 (o canal 0 identifica objetos)
+    background = np.zeros((height, width, 3), np.uint8)
+    background[:, :, 1:] = rng.integers(0, 120, (height // 16, width // 16, 2)).repeat(16, 0).repeat(16, 1)
+    texture = rng.integers(120, 250, (size // 8, size // 8, 2), dtype=np.uint8).repeat(8, 0).repeat(8, 1)
+    # (valor, x, y, vx, vy, primeiro quadro)
+    objects = [(1, 100, 100, 3.0, 1.0, 0), (2, 900, 500, -2.0, -1.5, 0),
+               (3, 600, 300, 0.0, 0.0, 0), (4, 200, 560, 2.5, 0.0, frames // 2)]
+    pause = range(frames // 4, frames // 4 + 30)
+
+    def render(index: int) -> Tuple[np.ndarray, np.ndarray]:
+        frame = background.copy()
+        moving = sum(1 for i in range(index) if i not in pause)
+        truth = []
+        for value, x, y, vx, vy, first in objects:
+            if index < first:
+                continue
+            steps = moving - sum(1 for i in range(first) if i not in pause)
+            x0 = int(np.clip(x + vx * steps, 0, width - size))
+            y0 = int(np.clip(y + vy * steps, 0, height - size))
+            frame[y0:y0 + size, x0:x0 + size, 0] = value
+            frame[y0:y0 + size, x0:x0 + size, 1:] = texture
+            truth.append((x0, y0, x0 + size, y0 + size))
+        # Ruído de sensor
+        frame[:, :, 1:] += rng.integers(0, 3, (height, width, 2), dtype=np.uint8)
+        return frame, np.array(truth, np.float32)
+
+    video = [render(i) for i in range(frames)]
+
+    def mean_iou(boxes: np.ndarray, truth: np.ndarray) -> float:
+        if len(truth) == 0:
+            return 1.0
+        if len(boxes) == 0:
+            return 0.0
+        return float(perception.box_iou(truth, boxes).max(axis=1).mean())
+
+    def run(label: str, process) -> Dict[str, Any]:
+        model = StubDetector(StubLatency(infer_ms, 1.0))
+        engine = perception.VisionEngine(model_name='stub', model=model)
+        step = process(engine)
+        ious, modes = [], {}
+        start = time.perf_counter()
+        for frame, truth in video:
+            result = step(frame)
+            ious.append(mean_iou(result.columns.boxes, truth))
+            mode = result.stream['mode'] if result.stream else 'detect'
+            modes[mode] = modes.get(mode, 0) + 1
+        elapsed = (time.perf_counter() - start) * 1000
+        row = {'ms_per_frame': elapsed / frames, 'inferences': model.calls,
+               'mean_iou': float(np.mean(ious)), 'min_iou': float(np.min(ious)), 'modes': modes}
+        logger.info(f"  {label:22s} {row['ms_per_frame']:6.1f} ms/frame | "
+                    f"{model.calls:3d} inferences | IoU mean {row['mean_iou']:.3f} "
+                    f"min {row['min_iou']:.3f} | " + ', '.join(f"{k} {v}" for k, v in sorted(modes.items())))
+        return row
+
+    logger.info(f"[Stream] benchmark ({width}x{height}, {frames} frames, "
+                f"simulated {infer_ms:.0f} ms per inference)")
+    return {
+        'every_frame': run('detect every frame', lambda engine: engine.detect_objects),
+        'stream': run('VisionStream', lambda engine: engine.open_stream('bench').process),
+    }
+
+def bench_cache(files: int = 24, requests: int = 480, burst: int = 8,
+                infer_ms: float = 20.0) -> Dict[str, Dict[str, Any]]:
+    """
+    Vários componentes perguntando pelos mesmos arquivos: sem cache, só
+    coalescência, cache + coalescência
+
+    Requisições chegam em rajadas de `burst` simultâneas, com popularidade
+    Zipf sobre `files` arquivos (metade imagens, metade áudio). Os engines
+    são simulados e custam infer_ms por chamada.
+    """
+    calls = {'vision': 0, 'audio': 0}
+
+    class StubVision:
+        def detect_objects(self, image, confidence_threshold=0.5, **options):
+            calls['vision'] += 1
+            time.sleep(infer_ms / 1000)
+            columns = perception.postprocess_boxes(np.array([[0, 0, 10, 10]]), np.array([0.9]), np.array([0]),
+                                                   {0: 'object'}, confidence_threshold)
+            return perception.ColumnarVisionResult(datetime.now(), (640, 480, 3), columns,
+                                                   confidence_threshold, infer_ms)
+
+    class StubAudio:
+        def transcribe(self, audio, language=None):
+            calls['audio'] += 1
+            time.sleep(infer_ms / 1000)
+            return perception.AudioTranscription('stub', language or 'en', 0.85, 1.0, infer_ms)
+
+    class StubEmbedding:
+        def embed_text(self, text):
+            return None
+
+    factories = {'vision': StubVision, 'audio': StubAudio, 'embedding': StubEmbedding}
+    rng = np.random.default_rng(0)
+    weights = 1.0 / np.arange(1, files + 1)
+    picks = rng.choice(files, requests, p=weights / weights.sum())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(files):
+            path = os.path.join(tmp, f'input_{i}.{"jpg" if i % 2 == 0 else "wav"}')
+            with open(path, 'wb') as f:
+                f.write(rng.bytes(256 * 1024))
+            paths.append(path)
+
+        async def run(engine, direct: bool) -> float:
+            def request(i):
+                path = paths[i]
+                if path.endswith('.jpg'):
+                    if direct:
+                        return engine._process_image(path, 0.5, None, None, 'rows', False, None)
+                    return engine.process_image(path)
+                return engine._process_audio(path, None) if direct else engine.process_audio(path)
+
+            start = time.perf_counter()
+            for offset in range(0, requests, burst):
+                await asyncio.gather(*(request(i) for i in picks[offset:offset + burst]))
+            return time.perf_counter() - start
+
+        results = {}
+        logger.info(f"[Cache] benchmark ({requests} requests over {files} files, bursts of {burst}, "
+                    f"simulated {infer_ms:.0f} ms per inference)")
+        for label, cache, direct in (('no cache', None, True),
+                                     ('coalescing only', perception.ResultCache(max_entries=0), False),
+                                     ('cache + coalescing', perception.ResultCache(ttl=300), False)):
+            calls.update(vision=0, audio=0)
+            engine = perception.MultimodalPerceptionEngine(factories=factories, result_cache=cache)
+            elapsed = asyncio.run(run(engine, direct))
+            status = engine.cache.status() if cache else {}
+            results[label] = {'seconds': elapsed, 'inferences': sum(calls.values()), **status}
+            logger.info(f"  {label:20s} {elapsed * 1000:7.0f} ms | {sum(calls.values()):4d} inferences | "
+                        f"hit rate {status.get('hit_rate') or 0:.0%} "
+                        f"(hits {status.get('hits', 0)}, coalesced {status.get('coalesced', 0)}) | "
+                        f"saved {status.get('saved_ms', 0):.0f} ms of inference")
+    return results
+
+COMPONENT_BENCHES = {
+    'startup': bench_startup,
+    'postprocess': bench_postprocess,
+    'tiles': bench_tiles,
+    'stream': bench_stream,
+    'cache': bench_cache,
+}
+
+# ============================================================================
+# RESULTADOS
+# ============================================================================
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    """Métricas numéricas por caminho ('latency.vision.p50_ms', 'load.socket.x16.all.p99_ms'...)"""
+    flat = {}
+    items = results.items() if isinstance(results, dict) else (
+        (f"x{level['concurrency']}", level) for level in results)
+    for key, value in items:
+        path = f'{prefix}{key}'
+        if isinstance(value, (dict, list)):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    Métricas que pioraram mais que tolerance (fração) em relação à base
+
+    p50/p99 e *_mb: menor é melhor; *_per_s: maior é melhor (média,
+    mínimo e máximo ficam no JSON, mas são ruidosos demais para alarme). Engines com
+    backend diferente entre as duas execuções não são comparados (nem a
+    carga, que mistura engines).
+    """
+    backends = current.get('backends', {})
+    same = {name for name, backend in backends.items() if baseline.get('backends', {}).get(name) == backend}
+    old, new = flatten(baseline.get('results', {})), flatten(current.get('results', {}))
+    regressions = []
+    for path, value in new.items():
+        parts = path.split('.')
+        if path not in old or (parts[1] in ENGINES and parts[1] not in same):
+            continue
+        if parts[0] == 'load' and len(same) < len(backends):
+            continue
+        before = old[path]
+        if path.endswith(('p50_ms', 'p99_ms', '_mb')):
+            worse = value > before * (1 + tolerance) and value - before > 0.05
+        elif path.endswith('_per_s'):
+            worse = value < before * (1 - tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append({'metric': path, 'baseline': before, 'current': value,
+                                'change': (value - before) / before if before else None})
+    return regressions
+
+def run_suite(backend: str = 'stub', scenarios: Sequence[str] = SCENARIOS,
+              stub_ms: Optional[Dict[str, float]] = None, batch_exponent: float = 0.8,
+              iterations: int = 50, batch_sizes: Sequence[int] = (1, 4, 16),
+              concurrency: Sequence[int] = (1, 4, 16), requests: int = 120,
+              audio_share: float = 0.2, seed: int = 0) -> Dict[str, Any]:
+    """Rodar os cenários e devolver o documento de resultados"""
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'unknown scenarios {sorted(unknown)}')
+    stub_ms = dict(DEFAULT_STUB_MS, **(stub_ms or {}))
+    corpora = {
+        'images': synthetic_images(16, seed=seed),
+        'audio': synthetic_audio(4, seed=seed),
+        'texts': synthetic_texts(64, seed=seed),
+    }
+    factories, backends = engine_factories(backend, stub_ms, batch_exponent)
+    # Uma linha de log por chamada distorce a medida e esconde a tabela
+    logging.getLogger(perception.__name__).setLevel(logging.WARNING)
+    engines, loading = build_engines(factories)
+
+    results: Dict[str, Any] = {}
+    if not engines:
+        logger.warning("No engine available for this backend; nothing to measure")
+        scenarios = ()
+    for scenario in scenarios:
+        logger.info(f"[Bench] {scenario} ({', '.join(f'{k}={v}' for k, v in backends.items())})")
+        if scenario == 'latency':
+            results[scenario] = bench_latency(engines, corpora, iterations)
+        elif scenario == 'batch':
+            results[scenario] = bench_batch(engines, corpora, batch_sizes)
+        elif scenario == 'load':
+            results[scenario] = bench_load(factories, corpora, concurrency, requests, audio_share, seed)
+        elif scenario == 'overload':
+            results[scenario] = bench_overload(factories, corpora, seed=seed)
+        elif scenario == 'memory':
+            results[scenario] = bench_memory(engines, corpora, loading)
+        else:
+            results[scenario] = COMPONENT_BENCHES[scenario]()
+
+    return {
+        'schema': SCHEMA_VERSION,
+        'timestamp': datetime.now().isoformat(),
+        'environment': environment(),
+        'backends': backends,
+        'config': {
+            'seed': seed, 'stub_ms': stub_ms, 'batch_exponent': batch_exponent,
+            'iterations': iterations, 'batch_sizes': list(batch_sizes),
+            'concurrency': list(concurrency), 'requests': requests, 'audio_share': audio_share,
+            'corpus': corpus_digest(corpora['images'], corpora['audio'], corpora['texts']),
+        },
+        'results': results,
+    }
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+def _stub_spec(value: str) -> Dict[str, float]:
+    """'vision=25,audio=80' -> {'vision': 25.0, 'audio': 80.0}"""
+    spec = {}
+    for item in value.split(','):
+        name, _, ms = item.partition('=')
+        if name not in ENGINES:
+            raise argparse.ArgumentTypeError(f'unknown engine {name!r}')
+        spec[name] = float(ms)
+    return spec
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='KIACHA perception benchmark suite')
+    parser.add_argument('--backend', choices=('stub', 'real', 'auto'), default='stub')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--stub-ms', type=_stub_spec, default={},
+                        help='simulated ms per item, e.g. vision=25,audio=80,embedding=3')
+    parser.add_argument('--batch-exponent', type=float, default=0.8,
+                        help='simulated batch of n costs ms * n ** exponent')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--batch-sizes', type=_ints, default=[1, 4, 16])
+    parser.add_argument('--concurrency', type=_ints, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=120, help='requests per concurrency level')
+    parser.add_argument('--audio-share', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='previous results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    document = run_suite(args.backend, [s for s in args.scenarios.split(',') if s], args.stub_ms,
+                         args.batch_exponent, args.iterations, args.batch_sizes, args.concurrency,
+                         args.requests, args.audio_share, args.seed)
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('corpus') != document['config']['corpus']:
+            logger.warning("Baseline was run on a different corpus; comparison may be meaningless")
+        document['regressions'] = compare(baseline, document, args.tolerance)
+        for r in document['regressions']:
+            logger.warning(f"Regression: {r['metric']} {r['baseline']:.2f} -> {r['current']:.2f}")
+        status = 1 if document['regressions'] else 0
+        if not status:
+            logger.info(f"✓ No regressions beyond {args.tolerance:.0%}")
+
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        logger.info(f"✓ Results written to {args.output}")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+KIACHA OS - Tracing por estágio para o Perception Engine
+
+Spans com perf_counter_ns por estágio (decodificação, pré-processamento,
+inferência, serialização...) agrupados por requisição. Só requisições
+amostradas pagam pelos spans; nas outras, span() é uma leitura de
+contextvar e um context manager vazio.
+
+Cada requisição amostrada é anexada a um arquivo no formato Chrome trace
+(array JSON de eventos "X", aberto em chrome://tracing ou
+ui.perfetto.dev). O array fica sem o "]" final, o que os dois aceitam, e
+o arquivo pode ser lido enquanto o servidor grava. Spans no event loop
+ficam numa linha por requisição; spans nas threads de inferência ficam
+na linha da thread.
+
+Opcionalmente, uma requisição pode ser perfilada (cProfile, ou
+pyinstrument se instalado e KIACHA_PROFILER=pyinstrument) em todas as
+threads por onde passa; o resultado vai para KIACHA_PROFILE_DIR.
+
+Ambiente:
+    KIACHA_TRACE_SAMPLE    fração de requisições rastreadas (0 = só forçadas)
+    KIACHA_TRACE_FILE      arquivo de saída (padrão /tmp/kiacha-perception-trace.json)
+    KIACHA_TRACE_MAX_MB    tamanho para rotacionar o arquivo (padrão 64)
+    KIACHA_PROFILE_DIR     destino dos perfis (padrão /tmp/kiacha-profiles)
+    KIACHA_PROFILER        cprofile | pyinstrument
+
+Executar este arquivo mede o custo de um span amostrado e não amostrado.
+"""
+
+import contextvars
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_FILE = os.path.join(tempfile.gettempdir(), 'kiacha-perception-trace.json')
+DEFAULT_PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'kiacha-profiles')
+# Linhas virtuais (tid) das requisições no event loop, longe dos idents reais
+REQUEST_TID_BASE = 1 << 40
+
+# ============================================================================
+# SPANS
+# ============================================================================
+
+class Trace:
+    """Eventos de uma requisição amostrada"""
+
+    __slots__ = ('id', 'name', 'events', 'origin', 'tid', 'profile', 'profilers', 'lock')
+
+    def __init__(self, trace_id: int, name: str, profile: bool):
+        self.id = trace_id
+        self.name = name
+        self.events: List[tuple] = []
+        self.origin = threading.get_ident()
+        self.tid = REQUEST_TID_BASE + trace_id
+        self.profile = profile
+        self.profilers: List[tuple] = []
+        self.lock = threading.Lock()
+
+    def thread_tid(self) -> int:
+        if threading.get_ident() == self.origin:
+            return self.tid
+        return threading.get_native_id()
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('perception_trace', default=None)
+
+class _NullSpan:
+    """Span de requisição não amostrada: não faz nada"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL = _NullSpan()
+
+class Span:
+    __slots__ = ('trace', 'name', 'args', 'start')
+
+    def __init__(self, trace: Trace, name: str, args: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        # list.append é atômico; spans de outras threads podem chegar juntos
+        self.trace.events.append((self.name, self.start, end - self.start,
+                                  self.trace.thread_tid(), self.args))
+        return False
+
+    def set(self, **args):
+        """Anexar argumentos ao span (aparecem em "args" no trace)"""
+        self.args.update(args)
+
+class _Request:
+    """Raiz de uma requisição (ou span comum, se já houver uma em andamento)"""
+
+    __slots__ = ('tracer', 'name', 'force', 'profile', 'args', 'trace', 'token', 'span')
+
+    def __init__(self, tracer: 'Tracer', name: str, force: bool, profile: bool, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.force = force
+        self.profile = profile
+        self.args = args
+        self.trace = None
+        self.token = None
+        self.span = _NULL
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self.span = Span(parent, self.name, self.args).__enter__()
+            return self.span
+        if not (self.force or self.profile or self.tracer.sampled()):
+            return _NULL
+        self.trace = Trace(next(self.tracer._ids), self.name, self.profile)
+        self.token = _current.set(self.trace)
+        self.span = Span(self.trace, self.name, self.args).__enter__()
+        if self.profile:
+            self.tracer.start_profile(self.trace)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.__exit__(exc_type, exc, tb)
+        if self.trace is not None:
+            _current.reset(self.token)
+            if self.trace.profile:
+                self.tracer.stop_profile(self.trace)
+            self.tracer.export(self.trace)
+        return False
+
+# ============================================================================
+# TRACER
+# ============================================================================
+
+class Tracer:
+    """
+    Amostragem, exportação (Chrome trace) e perfis por requisição
+
+    sample_rate: fração de requisições raiz rastreadas; requisições com
+    force/profile são sempre rastreadas.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        path: str = DEFAULT_TRACE_FILE,
+        max_bytes: int = 64 * 2**20,
+        profile_dir: str = DEFAULT_PROFILE_DIR,
+        profiler: str = 'cprofile'
+    ):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.max_bytes = max_bytes
+        self.profile_dir = profile_dir
+        self.profiler = profiler
+        self.exported = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._named_threads = set()
+        self._pid = os.getpid()
+        # perf_counter_ns é relativo; o trace usa microssegundos de relógio
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        return cls(
+            sample_rate=float(os.environ.get('KIACHA_TRACE_SAMPLE', 0)),
+            path=os.environ.get('KIACHA_TRACE_FILE', DEFAULT_TRACE_FILE),
+            max_bytes=int(float(os.environ.get('KIACHA_TRACE_MAX_MB', 64)) * 2**20),
+            profile_dir=os.environ.get('KIACHA_PROFILE_DIR', DEFAULT_PROFILE_DIR),
+            profiler=os.environ.get('KIACHA_PROFILER', 'cprofile'),
+        )
+
+    def sampled(self) -> bool:
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def request(self, name: str, force: bool = False, profile: bool = False, **args):
+        """
+        with tracer.request('POST /vision'): ...
+
+        Raiz de uma requisição, decidida por amostragem; dentro de outra
+        requisição vira um span filho (ex.: process_image dentro de
+        process_multimodal).
+        """
+        return _Request(self, name, force, profile, args)
+
+    @staticmethod
+    def span(name: str, **args):
+        """Span de um estágio; vazio fora de uma requisição amostrada"""
+        trace = _current.get()
+        if trace is None:
+            return _NULL
+        return Span(trace, name, args)
+
+    @staticmethod
+    def current_id() -> Optional[int]:
+        trace = _current.get()
+        return trace.id if trace is not None else None
+
+    # ------------------------------------------------------------------
+    # Perfis
+    # ------------------------------------------------------------------
+
+    def start_profile(self, trace: Optional[Trace] = None):
+        """Perfilar a thread atual até stop_profile (threads de inferência incluídas)"""
+        trace = trace or _current.get()
+        if trace is None or not trace.profile:
+            return
+        if self.profiler == 'pyinstrument' and importlib.util.find_spec('pyinstrument'):
+            import pyinstrument
+            profiler = pyinstrument.Profiler()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+        try:
+            if hasattr(profiler, 'enable'):
+                profiler.enable()
+            else:
+                profiler.start()
+        except ValueError as e:
+            # Só um perfilador ativo por vez em algumas versões do Python
+            logger.warning(f"Profiler not started: {e}")
+            return
+        with trace.lock:
+            trace.profilers.append((threading.get_ident(), profiler))
+
+    def stop_profile(self, trace: Optional[Trace] = None):
+        """Parar o perfil da thread atual e gravá-lo em profile_dir"""
+        trace = trace or _current.get()
+        if trace is None or not trace.profile:
+            return
+        ident = threading.get_ident()
+        with trace.lock:
+            found = [p for t, p in trace.profilers if t == ident]
+            trace.profilers = [(t, p) for t, p in trace.profilers if t != ident]
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for index, profiler in enumerate(found):
+            base = os.path.join(self.profile_dir, f'trace-{trace.id}-{threading.current_thread().name}-{index}')
+            if hasattr(profiler, 'disable'):
+                profiler.disable()
+                profiler.dump_stats(base + '.prof')
+                logger.info(f"Profile written: {base}.prof (python -m pstats / snakeviz)")
+            else:
+                profiler.stop()
+                with open(base + '.html', 'w') as f:
+                    f.write(profiler.output_html())
+                logger.info(f"Profile written: {base}.html")
+
+    # ------------------------------------------------------------------
+    # Exportação
+    # ------------------------------------------------------------------
+
+    def _event(self, name: str, start_ns: int, dur_ns: int, tid: int, args: Dict[str, Any]) -> str:
+        return json.dumps({
+            'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X',
+            'ts': (self._epoch_ns + start_ns) / 1000, 'dur': dur_ns / 1000,
+            'pid': self._pid, 'tid': tid, 'args': args,
+        }, default=str)
+
+    def _thread_names(self, trace: Trace) -> List[str]:
+        names = []
+        threads = {t.native_id: t.name for t in threading.enumerate()}
+        for _, _, _, tid, _ in trace.events:
+            if tid in self._named_threads:
+                continue
+            self._named_threads.add(tid)
+            label = f'request {trace.id}: {trace.name}' if tid == trace.tid else threads.get(tid, str(tid))
+            names.append(json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': self._pid,
+                                     'tid': tid, 'args': {'name': label}}))
+        return names
+
+    def export(self, trace: Trace):
+        """Anexar os eventos da requisição ao arquivo de trace"""
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                    self._named_threads.clear()
+                new = not os.path.exists(self.path)
+                if new:
+                    self._named_threads.clear()
+                lines = self._thread_names(trace)
+                lines += [self._event(*event) for event in trace.events]
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    if new:
+                        f.write('[\n')
+                    f.write(''.join(line + ',\n' for line in lines))
+                self.exported += 1
+            except OSError as e:
+                logger.warning(f"Trace export failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {'sample_rate': self.sample_rate, 'file': self.path,
+                'exported_requests': self.exported, 'profile_dir': self.profile_dir}
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Ler um arquivo de trace gravado (sem o "]" final)"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read().rstrip().rstrip(',')
+    if not text.endswith(']'):
+        text += ']'
+    return json.loads(text)
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def benchmark(iterations: int = 200_000):
+    """Custo de span(): fora de requisição, requisição não amostrada e amostrada"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tracer = Tracer(sample_rate=0.0, path=os.path.join(tmp, 'trace.json'))
+
+        def spans(n):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                with tracer.span('stage'):
+                    pass
+            return (time.perf_counter_ns() - start) / n
+
+        def bare(n):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                pass
+            return (time.perf_counter_ns() - start) / n
+
+        loop_ns = bare(iterations)
+        rows = [('no request', spans(iterations) - loop_ns)]
+        with tracer.request('unsampled'):
+            rows.append(('unsampled request', spans(iterations) - loop_ns))
+        with tracer.request('sampled', force=True):
+            rows.append(('sampled request', spans(iterations // 10) - loop_ns))
+        start = time.perf_counter_ns()
+        with tracer.request('export', force=True):
+            for _ in range(20):
+                with tracer.span('stage'):
+                    pass
+        export_us = (time.perf_counter_ns() - start) / 1000
+        events = len(load_trace(tracer.path))
+
+    logger.info("[Trace] span overhead")
+    for label, ns in rows:
+        logger.info(f"  {label:20s} {ns:8.0f} ns per span")
+    logger.info(f"  request with 20 spans, exported: {export_us:.0f} us ({events} events in file)")
+    return rows
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+KIACHA OS - Transporte binário de quadros para o Perception Engine
+
+Protocolo com prefixo de tamanho (Unix socket) e decodificação zero-copy
+de imagens cruas e buffers PCM para arrays NumPy, sem passar pelo disco.
+
+Requisição (little endian, 24 bytes de cabeçalho):
+    magic       4s   b'KPF1'
+    kind        u8   1 = imagem, 2 = áudio
+    fmt         u8   formato do payload (ver IMAGE_FORMATS / AUDIO_FORMATS)
+    flags       u16  reservado
+    a           u32  largura (imagem) ou sample rate (áudio)
+    b           u32  altura (imagem) ou canais (áudio)
+    meta_len    u32  tamanho do JSON de opções (confidence, language...)
+    payload_len u32  tamanho do payload
+    meta, payload
+
+Resposta: magic b'KPR1', status u32 (códigos HTTP), tamanho u32, JSON.
+
+Executar este arquivo roda o benchmark contra o caminho antigo
+(gravar arquivo e reler no servidor).
+"""
+
+import functools
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _optional(module: str):
+    """Import adiado de OpenCV/PIL (só quando chega uma imagem codificada)"""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        return None
+
+# ============================================================================
+# FORMATO DE FIO
+# ============================================================================
+
+REQUEST_MAGIC = b'KPF1'
+RESPONSE_MAGIC = b'KPR1'
+REQUEST_HEADER = struct.Struct('<4sBBHIIII')
+RESPONSE_HEADER = struct.Struct('<4sII')
+
+KIND_IMAGE = 1
+KIND_AUDIO = 2
+
+# Imagem: ENCODED = JPEG/PNG; os demais são quadros crus HxWxC
+IMAGE_ENCODED, IMAGE_RGB24, IMAGE_BGR24, IMAGE_GRAY8 = 0, 1, 2, 3
+AUDIO_S16LE, AUDIO_F32LE = 1, 2
+
+IMAGE_FORMATS = {
+    'encoded': IMAGE_ENCODED, 'jpeg': IMAGE_ENCODED, 'jpg': IMAGE_ENCODED, 'png': IMAGE_ENCODED,
+    'rgb24': IMAGE_RGB24, 'bgr24': IMAGE_BGR24, 'gray8': IMAGE_GRAY8,
+}
+AUDIO_FORMATS = {'s16le': AUDIO_S16LE, 'f32le': AUDIO_F32LE}
+
+# Whisper trabalha com mono float32 a 16 kHz
+WHISPER_SAMPLE_RATE = 16000
+
+# Limite de payload aceito pelo servidor (um quadro 4K RGB tem ~25 MB)
+MAX_PAYLOAD = 64 * 1024 * 1024
+MAX_META = 64 * 1024
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'kiacha-perception.sock')
+
+
+class FrameError(ValueError):
+    """Quadro malformado ou formato não suportado"""
+
+
+@dataclass
+class Frame:
+    """Requisição decodificada (payload ainda não convertido)"""
+    kind: int
+    fmt: int
+    a: int
+    b: int
+    meta: Dict[str, Any]
+    payload: Any  # bytes, bytearray ou memoryview
+
+
+def encode_frame(kind: int, fmt: int, a: int, b: int, payload, meta: Optional[Dict] = None) -> bytes:
+    """Cabeçalho + meta (o payload é enviado à parte para evitar cópia)"""
+    meta_bytes = json.dumps(meta).encode('utf-8') if meta else b''
+    header = REQUEST_HEADER.pack(REQUEST_MAGIC, kind, fmt, 0, a, b, len(meta_bytes), len(payload))
+    return header + meta_bytes
+
+
+def parse_header(raw: bytes) -> Tuple[int, int, int, int, int, int]:
+    magic, kind, fmt, _, a, b, meta_len, payload_len = REQUEST_HEADER.unpack(raw)
+    if magic != REQUEST_MAGIC:
+        raise FrameError('bad frame magic')
+    if kind not in (KIND_IMAGE, KIND_AUDIO):
+        raise FrameError(f'unknown frame kind {kind}')
+    if meta_len > MAX_META or payload_len > MAX_PAYLOAD:
+        raise FrameError('frame too large')
+    return kind, fmt, a, b, meta_len, payload_len
+
+
+def parse_meta(raw) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    try:
+        meta = json.loads(bytes(raw))
+    except ValueError as e:
+        raise FrameError(f'bad frame meta: {e}')
+    if not isinstance(meta, dict):
+        raise FrameError('frame meta must be a JSON object')
+    return meta
+
+
+async def read_frame(reader) -> Frame:
+    """Ler um quadro de um asyncio.StreamReader"""
+    kind, fmt, a, b, meta_len, payload_len = parse_header(
+        await reader.readexactly(REQUEST_HEADER.size))
+    meta = parse_meta(await reader.readexactly(meta_len) if meta_len else b'')
+    payload = await reader.readexactly(payload_len)
+    return Frame(kind, fmt, a, b, meta, payload)
+
+
+def encode_response(status: int, body: Dict[str, Any]) -> bytes:
+    data = json.dumps(body).encode('utf-8')
+    return RESPONSE_HEADER.pack(RESPONSE_MAGIC, status, len(data)) + data
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    """recv_into num buffer gravável (arrays NumPy sobre ele não são read-only)"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:], size - got)
+        if not n:
+            raise ConnectionError('connection closed mid-frame')
+        got += n
+    return buf
+
+
+def recv_frame(sock: socket.socket) -> Frame:
+    """Versão síncrona de read_frame"""
+    kind, fmt, a, b, meta_len, payload_len = parse_header(
+        bytes(_recv_exactly(sock, REQUEST_HEADER.size)))
+    meta = parse_meta(_recv_exactly(sock, meta_len) if meta_len else b'')
+    return Frame(kind, fmt, a, b, meta, _recv_exactly(sock, payload_len))
+
+# ============================================================================
+# DECODIFICAÇÃO ZERO-COPY
+# ============================================================================
+
+def decode_image(payload, fmt: int, width: int = 0, height: int = 0) -> np.ndarray:
+    """
+    Payload -> array HxWx3 uint8 em ordem BGR (convenção do YOLO/OpenCV
+    para entradas NumPy)
+
+    Quadros crus viram views sobre o buffer recebido, sem cópia: BGR24 é
+    usado como está e RGB24 é invertido por stride. Só GRAY8 (replicação
+    de canal) e imagens codificadas alocam.
+    """
+    if fmt == IMAGE_ENCODED:
+        buf = np.frombuffer(payload, dtype=np.uint8)
+        cv2 = _optional('cv2')
+        if cv2 is not None:
+            image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            if image is None:
+                raise FrameError('could not decode image')
+            return image
+        pil = _optional('PIL.Image')
+        if pil is not None:
+            try:
+                rgb = np.asarray(pil.open(io.BytesIO(payload)).convert('RGB'))
+            except Exception as e:
+                raise FrameError(f'could not decode image: {e}')
+            return rgb[..., ::-1]
+        raise FrameError('encoded images need opencv-python or pillow')
+
+    channels = {IMAGE_RGB24: 3, IMAGE_BGR24: 3, IMAGE_GRAY8: 1}.get(fmt)
+    if channels is None:
+        raise FrameError(f'unknown image format {fmt}')
+    expected = width * height * channels
+    if not width or not height or len(payload) != expected:
+        raise FrameError(f'raw frame is {len(payload)} bytes, expected {width}x{height}x{channels}')
+    pixels = np.frombuffer(payload, dtype=np.uint8).reshape(height, width, channels)
+    if fmt == IMAGE_BGR24:
+        return pixels
+    if fmt == IMAGE_RGB24:
+        return pixels[..., ::-1]
+    return np.repeat(pixels, 3, axis=2)
+
+
+def decode_pcm(payload, fmt: int, sample_rate: int, channels: int = 1) -> np.ndarray:
+    """
+    Payload PCM -> mono float32 a 16 kHz (entrada do Whisper)
+
+    F32LE mono a 16 kHz é devolvido como view do buffer; S16LE exige uma
+    conversão, e downmix/resample só acontecem quando necessários.
+    """
+    channels = channels or 1
+    if fmt == AUDIO_F32LE:
+        samples = np.frombuffer(payload, dtype='<f4')
+    elif fmt == AUDIO_S16LE:
+        samples = np.frombuffer(payload, dtype='<i2').astype(np.float32)
+        samples *= 1.0 / 32768.0
+    else:
+        raise FrameError(f'unknown audio format {fmt}')
+    if len(samples) % channels:
+        raise FrameError('PCM payload is not a whole number of frames')
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    if sample_rate and sample_rate != WHISPER_SAMPLE_RATE:
+        samples = resample(samples, sample_rate, WHISPER_SAMPLE_RATE)
+    return samples
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Reamostragem linear (suficiente para ASR)"""
+    n_out = int(round(len(samples) * dst_rate / src_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def decode_frame(frame: Frame) -> np.ndarray:
+    if frame.kind == KIND_IMAGE:
+        return decode_image(frame.payload, frame.fmt, frame.a, frame.b)
+    return decode_pcm(frame.payload, frame.fmt, frame.a, frame.b)
+
+
+def params_from_query(kind: int, params) -> Tuple[int, int, int]:
+    """(fmt, a, b) a partir de parâmetros HTTP (query string ou campos multipart)"""
+    try:
+        if kind == KIND_IMAGE:
+            fmt = IMAGE_FORMATS[params.get('format', 'encoded').lower()]
+            return fmt, int(params.get('width', 0)), int(params.get('height', 0))
+        fmt = AUDIO_FORMATS[params.get('format', 's16le').lower()]
+        return fmt, int(params.get('sample_rate', WHISPER_SAMPLE_RATE)), int(params.get('channels', 1))
+    except KeyError as e:
+        raise FrameError(f'unknown format {e}')
+    except ValueError as e:
+        raise FrameError(f'bad frame parameter: {e}')
+
+# ============================================================================
+# CLIENTE (Unix socket)
+# ============================================================================
+
+class PerceptionSocketClient:
+    """Cliente síncrono do socket de quadros; uma conexão, várias requisições"""
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, timeout: Optional[float] = 30.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def request(self, kind: int, fmt: int, a: int, b: int, payload,
+                meta: Optional[Dict] = None) -> Tuple[int, Dict[str, Any]]:
+        self.sock.sendall(encode_frame(kind, fmt, a, b, payload, meta))
+        self.sock.sendall(payload)
+        magic, status, size = RESPONSE_HEADER.unpack(_recv_exactly(self.sock, RESPONSE_HEADER.size))
+        if magic != RESPONSE_MAGIC:
+            raise FrameError('bad response magic')
+        return status, json.loads(bytes(_recv_exactly(self.sock, size)))
+
+    def detect(self, image: np.ndarray, fmt: str = 'bgr24', **options) -> Tuple[int, Dict[str, Any]]:
+        """Enviar um quadro HxWxC (uint8, C-contíguo) para detecção"""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        return self.request(KIND_IMAGE, IMAGE_FORMATS[fmt], width, height,
+                            memoryview(image).cast('B'), options)
+
+    def transcribe(self, pcm: np.ndarray, sample_rate: int = WHISPER_SAMPLE_RATE,
+                   channels: int = 1, **options) -> Tuple[int, Dict[str, Any]]:
+        """Enviar PCM int16 ou float32 intercalado para transcrição"""
+        fmt = AUDIO_F32LE if pcm.dtype == np.float32 else AUDIO_S16LE
+        pcm = np.ascontiguousarray(pcm, dtype='<f4' if fmt == AUDIO_F32LE else '<i2')
+        return self.request(KIND_AUDIO, fmt, sample_rate, channels,
+                            memoryview(pcm).cast('B'), options)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def _framed_roundtrip(kind: int, fmt: int, a: int, b: int, payload, iterations: int) -> float:
+    """ms por quadro: envio por socket + recv_frame + decode_frame"""
+    server, client = socket.socketpair()
+
+    def send():
+        header = encode_frame(kind, fmt, a, b, payload)
+        for _ in range(iterations):
+            client.sendall(header)
+            client.sendall(payload)
+
+    sender = threading.Thread(target=send)
+    start = time.perf_counter()
+    sender.start()
+    for _ in range(iterations):
+        decode_frame(recv_frame(server))
+    sender.join()
+    elapsed = time.perf_counter() - start
+    server.close()
+    client.close()
+    return elapsed * 1000 / iterations
+
+
+def _file_roundtrip(write, read, iterations: int) -> float:
+    """ms por quadro: cliente grava arquivo, servidor relê do caminho"""
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for i in range(iterations):
+            path = os.path.join(tmp, f'frame{i}')
+            write(path)
+            read(path)
+            os.unlink(path)
+        return (time.perf_counter() - start) * 1000 / iterations
+
+
+def benchmark(iterations: int = 30):
+    """Quadro 1280x720 RGB e 10 s de PCM: arquivo em disco vs quadro binário"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    pcm = (rng.standard_normal(10 * WHISPER_SAMPLE_RATE) * 3000).astype('<i2')
+    rows = []
+
+    def write_raw(path):
+        with open(path, 'wb') as f:
+            f.write(memoryview(frame).cast('B'))
+
+    def read_raw(path):
+        with open(path, 'rb') as f:
+            decode_image(f.read(), IMAGE_RGB24, 1280, 720)
+
+    rows.append(('image raw RGB, file', _file_roundtrip(write_raw, read_raw, iterations)))
+    Image = _optional('PIL.Image')
+    if Image is not None:
+        # Caminho atual: cliente salva PNG, servidor faz Image.open
+        def write_png(path):
+            Image.fromarray(frame).save(path, format='PNG', compress_level=1)
+
+        def read_png(path):
+            np.asarray(Image.open(path).convert('RGB'))
+
+        rows.append(('image PNG, file + Image.open', _file_roundtrip(write_png, read_png, iterations)))
+    rows.append(('image raw RGB, framed socket',
+                 _framed_roundtrip(KIND_IMAGE, IMAGE_RGB24, 1280, 720,
+                                   memoryview(frame).cast('B'), iterations)))
+
+    def write_wav(path):
+        with wave.open(path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(WHISPER_SAMPLE_RATE)
+            w.writeframes(pcm.tobytes())
+
+    def read_wav(path):
+        with wave.open(path, 'rb') as w:
+            decode_pcm(w.readframes(w.getnframes()), AUDIO_S16LE, w.getframerate(), w.getnchannels())
+
+    rows.append(('audio 10 s WAV, file + wave', _file_roundtrip(write_wav, read_wav, iterations)))
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        # O que whisper.load_audio faz com um caminho
+        def read_ffmpeg(path):
+            out = subprocess.run([ffmpeg, '-nostdin', '-threads', '0', '-i', path, '-f', 's16le',
+                                  '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(WHISPER_SAMPLE_RATE), '-'],
+                                 capture_output=True, check=True).stdout
+            decode_pcm(out, AUDIO_S16LE, WHISPER_SAMPLE_RATE)
+
+        rows.append(('audio 10 s WAV, file + ffmpeg', _file_roundtrip(write_wav, read_ffmpeg, iterations)))
+    rows.append(('audio 10 s s16le, framed socket',
+                 _framed_roundtrip(KIND_AUDIO, AUDIO_S16LE, WHISPER_SAMPLE_RATE, 1,
+                                   memoryview(pcm).cast('B'), iterations)))
+
+    logger.info("[Transport] input path benchmark (ms per request, lower is better)")
+    for label, ms in rows:
+        logger.info(f"  {label:34s} {ms:8.2f} ms")
+    return rows
+
+
+if __name__ == '__main__':
+    benchmark()
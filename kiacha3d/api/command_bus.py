@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+command_bus.py - Frame-budgeted command queue for the 3D engine
+
+Provides:
+- One queue for REST commands, VoiceCommand and GestureData events
+- Coalescing of redundant commands while they wait (ten zooms become one
+  factor, pans add up, last write wins for toggles)
+- A fixed-tick scheduler that applies commands within a per-tick time budget
+- Queue depth, latency and tick overrun metrics
+
+Voice and gesture recognizers plug in through their callbacks:
+
+    recognizer.register_callback(api.command_bus.submit_voice)
+    gestures.register_callback(api.command_bus.submit_gesture)
+
+Events are duck-typed (VoiceCommand: action/target/parameters/confidence,
+GestureData: gesture/confidence/hand_position) so this module does not pull
+in the audio or camera stacks.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the bus is at max_depth and cannot coalesce a command"""
+
+
+@dataclass
+class Command:
+    """A scene command waiting to be applied"""
+    action: str
+    target: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    source: str = "rest"  # rest | voice | gesture
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    merged: int = 1  # how many submitted commands this one stands for
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "command": self.action,
+            "target": self.target,
+            "params": self.params,
+            "source": self.source,
+            "merged": self.merged,
+        }
+
+
+# Merge rules: combine a newer command's params into a queued one with the
+# same coalesce_key(). Actions without a rule are never coalesced.
+def _merge_zoom(old: Dict, new: Dict) -> Dict:
+    return {**old, "factor": float(old.get("factor", 1.0)) * float(new.get("factor", 1.0))}
+
+
+def _merge_pan(old: Dict, new: Dict) -> Dict:
+    a, b = old.get("delta", [0, 0, 0]), new.get("delta", [0, 0, 0])
+    return {**old, "delta": [float(x) + float(y) for x, y in zip(a, b)]}
+
+
+def _merge_rotate(old: Dict, new: Dict) -> Dict:
+    return {**old, "degrees": float(old.get("degrees", 0)) + float(new.get("degrees", 0))}
+
+
+def _last_wins(old: Dict, new: Dict) -> Dict:
+    return {**old, **new}
+
+
+MERGE_RULES: Dict[str, Callable[[Dict, Dict], Dict]] = {
+    "zoom": _merge_zoom,
+    "pan": _merge_pan,
+    "rotate": _merge_rotate,
+    "wireframe": _last_wins,
+    "lighting": _last_wins,
+    "pick": _last_wins,
+}
+
+# Params that select what a command acts on rather than how much: commands
+# only merge when these match too (param -> default the handler assumes)
+MERGE_KEYS: Dict[str, Dict[str, Any]] = {
+    "rotate": {"axis": "y", "object_id": None},
+}
+
+
+def coalesce_key(action: str, target: Optional[str], params: Dict[str, Any]) -> Tuple:
+    """Commands with equal keys are merged while they wait"""
+    selectors = MERGE_KEYS.get(action, {})
+    return (action, target) + tuple(params.get(name, default) for name, default in selectors.items())
+
+
+# Voice "pan" uses direction words (see kiacha3d_commands.json)
+PAN_DIRECTIONS = {
+    "left": (-1, 0, 0), "right": (1, 0, 0),
+    "up": (0, 1, 0), "down": (0, -1, 0),
+    "forward": (0, 0, -1), "back": (0, 0, 1),
+}
+
+# GestureType value -> (action, target, params)
+GESTURE_COMMANDS: Dict[str, Tuple[str, Optional[str], Dict[str, Any]]] = {
+    "pinch": ("zoom", "camera", {"factor": 1.05}),
+    "open_palm": ("zoom", "camera", {"factor": 0.95}),
+    "point": ("pick", None, {}),
+    "thumbs_up": ("lighting", None, {"mode": "on"}),
+    "thumbs_down": ("lighting", None, {"mode": "off"}),
+}
+
+
+class CommandBus:
+    """Coalescing command queue drained on a fixed tick"""
+
+    def __init__(self, tick_hz: float = 60.0, budget_ms: float = 4.0,
+                 max_depth: int = 1024, min_confidence: float = 0.5,
+                 viewport: Tuple[int, int] = (640, 480)):
+        self.tick_interval = 1.0 / tick_hz
+        self.budget = budget_ms / 1000.0
+        self.max_depth = max_depth
+        self.min_confidence = min_confidence
+        self.viewport = viewport
+        self.handlers: Dict[str, Callable[[Command], Any]] = {}
+
+        self._queue: deque = deque()
+        self._coalescible: Dict[Tuple, Command] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self._counters = {
+            "submitted": 0, "coalesced": 0, "applied": 0, "errors": 0,
+            "rejected": 0, "ticks": 0, "tick_overruns": 0, "late_ticks": 0,
+        }
+        self._max_depth_seen = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_tick_ms = 0.0
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+
+    def register(self, action: str, handler: Callable[[Command], Any]):
+        """Register the function that applies `action` to the scene"""
+        self.handlers[action] = handler
+
+    def submit(self, action: str, target: Optional[str] = None,
+               params: Optional[Dict[str, Any]] = None, source: str = "rest") -> Command:
+        """Queue a command, merging it into a waiting one when possible"""
+        if action not in self.handlers:
+            raise KeyError(action)
+        params = dict(params or {})
+        rule = MERGE_RULES.get(action)
+        key = coalesce_key(action, target, params)
+        with self._lock:
+            self._counters["submitted"] += 1
+            if rule is not None:
+                queued = self._coalescible.get(key)
+                if queued is not None:
+                    queued.params = rule(queued.params, params)
+                    queued.merged += 1
+                    self._counters["coalesced"] += 1
+                    return queued
+            if len(self._queue) >= self.max_depth:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"command queue full ({self.max_depth})")
+            command = Command(action=action, target=target, params=params, source=source)
+            self._queue.append(command)
+            if rule is not None:
+                self._coalescible[key] = command
+            self._max_depth_seen = max(self._max_depth_seen, len(self._queue))
+            return command
+
+    def submit_voice(self, voice_command) -> Optional[Command]:
+        """VoiceRecognizer callback"""
+        action = voice_command.action
+        if action == "unknown" or voice_command.confidence < self.min_confidence:
+            return None
+        params = dict(voice_command.parameters or {})
+        if action == "pan" and "direction" in params and "delta" not in params:
+            unit = PAN_DIRECTIONS.get(params.pop("direction"), (0, 0, 0))
+            distance = float(params.pop("distance", 1.0))
+            params["delta"] = [c * distance for c in unit]
+        if action == "load_model" and "filepath" not in params:
+            params["filepath"] = params.pop("filename", None)
+        return self._submit_event(action, voice_command.target, params, "voice")
+
+    def submit_gesture(self, gesture_data) -> Optional[Command]:
+        """GestureRecognizer callback"""
+        gesture = getattr(gesture_data.gesture, "value", gesture_data.gesture)
+        mapping = GESTURE_COMMANDS.get(gesture)
+        if mapping is None or gesture_data.confidence < self.min_confidence:
+            return None
+        action, target, params = mapping
+        params = dict(params)
+        if action == "pick":
+            x, y = gesture_data.hand_position
+            w, h = self.viewport
+            params["ndc"] = [2.0 * x / w - 1.0, 1.0 - 2.0 * y / h]
+        return self._submit_event(action, target, params, "gesture")
+
+    def _submit_event(self, action, target, params, source) -> Optional[Command]:
+        # Recognizer threads must never see exceptions from the bus
+        try:
+            return self.submit(action, target, params, source)
+        except KeyError:
+            logger.debug(f"[CommandBus] No handler for {source} action '{action}'")
+        except QueueFull as e:
+            logger.warning(f"[CommandBus] Dropped {source} command: {e}")
+        return None
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def tick(self) -> int:
+        """Apply queued commands until the budget is spent; returns count applied"""
+        start = time.perf_counter()
+        deadline = start + self.budget
+        applied = 0
+        while True:
+            with self._lock:
+                if not self._queue:
+                    break
+                command = self._queue.popleft()
+                key = coalesce_key(command.action, command.target, command.params)
+                if self._coalescible.get(key) is command:
+                    del self._coalescible[key]
+            self._apply(command)
+            applied += 1
+            if time.perf_counter() >= deadline:
+                break
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._counters["ticks"] += 1
+            if elapsed > self.budget:
+                self._counters["tick_overruns"] += 1
+            self._last_tick_ms = elapsed * 1000
+        return applied
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="command-bus", daemon=True)
+        self._thread.start()
+        logger.info(f"[CommandBus] Ticking at {1 / self.tick_interval:.0f} Hz, "
+                    f"budget {self.budget * 1000:.1f} ms")
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _loop(self):
+        next_tick = time.perf_counter()
+        while self._running:
+            self.tick()
+            next_tick += self.tick_interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind: count it and re-anchor instead of bursting
+                with self._lock:
+                    self._counters["late_ticks"] += 1
+                next_tick = time.perf_counter()
+
+    def _apply(self, command: Command):
+        wait = time.perf_counter() - command.enqueued_at
+        try:
+            self.handlers[command.action](command)
+            ok = True
+        except Exception as e:
+            ok = False
+            logger.error(f"[CommandBus] {command.action} failed: {e}")
+        with self._lock:
+            self._counters["applied" if ok else "errors"] += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self._counters["applied"] + self._counters["errors"]
+            return {
+                **self._counters,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_depth_seen,
+                "tick_hz": round(1 / self.tick_interval, 2),
+                "budget_ms": self.budget * 1000,
+                "last_tick_ms": round(self._last_tick_ms, 3),
+                "avg_wait_ms": round(self._wait_total / done * 1000, 3) if done else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+                "running": self._running,
+            }
@@ -11,7 +11,7 @@ Provides HTTP endpoints for:
 - AI autonomy control
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from typing import Dict, Any, List, Optional
 import json
 import logging
@@ -19,6 +19,14 @@ import threading
 from dataclasses import asdict, dataclass
 from datetime import datetime
 
+import numpy as np
+
+from command_bus import Command, CommandBus, QueueFull
+from mesh_loader import LoadJob, Mesh, MeshCache, MeshLoader
+from metrics import Metrics, instrument_flask
+from spatial_index import SpatialIndex, camera_ray, frustum_planes
+from transform_store import TransformStore, euler_to_matrices
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -30,30 +38,110 @@ class MockRenderer:
         self.lights = {}
         self.objects = {}
         self.wireframe = False
+        self.lighting_enabled = True
         
     def render_frame(self):
         pass
 
 class MockSceneManager:
     def __init__(self):
-        self.objects = {}
+        self.transforms = TransformStore()
+        self.objects = self.transforms.objects  # id -> dict-like ObjectView
         self.next_id = 1
+        self.spatial_index = SpatialIndex()
+        self.meshes: Dict[str, Mesh] = {}  # content hash -> geometry shared by instances
+        # Flask request threads, the mesh loader worker and the command bus
+        # tick all touch the scene; hold this around any multi-step read or write
+        self.lock = threading.RLock()
         
     def add_object(self, name: str):
-        obj_id = self.next_id
-        self.next_id += 1
-        self.objects[obj_id] = {
-            "id": obj_id,
-            "name": name,
-            "position": [0, 0, 0],
-            "rotation": [0, 0, 0],
-            "scale": [1, 1, 1]
-        }
-        return obj_id
+        with self.lock:
+            obj_id = self.next_id
+            self.next_id += 1
+            self.transforms.add(obj_id, name=name)
+            self.spatial_index.insert(obj_id, [0, 0, 0], [1, 1, 1])
+            return obj_id
+    
+    def get_object(self, obj_id: int) -> Optional[Dict[str, Any]]:
+        """Consistent copy of one object, or None"""
+        with self.lock:
+            obj = self.objects.get(obj_id)
+            return obj.to_dict() if obj is not None else None
+    
+    def list_objects(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [obj.to_dict() for obj in self.objects.values()]
+    
+    def update_object(self, obj_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply a partial update, keeping the spatial index in sync"""
+        with self.lock:
+            obj = self.objects.get(obj_id)
+            if obj is None:
+                return None
+            # Raises ValueError before anything is written if a transform is malformed
+            obj.update({k: v for k, v in data.items() if k != 'id'})
+            if 'position' in data or 'scale' in data:
+                self.spatial_index.update(obj_id, obj['position'], obj['scale'])
+            return obj.to_dict()
+    
+    def attach_mesh(self, obj_id: int, mesh: Mesh):
+        """Point an object at shared geometry and fit its bounds to the mesh"""
+        with self.lock:
+            obj = self.objects[obj_id]
+            self.meshes.setdefault(mesh.key, mesh)
+            obj['mesh'] = mesh.key
+            self.spatial_index.set_extent(obj_id, mesh.half_extent, obj['position'], obj['scale'])
+    
+    def remove_object(self, obj_id: int) -> bool:
+        with self.lock:
+            if obj_id not in self.objects:
+                return False
+            self.transforms.remove(obj_id)
+            self.spatial_index.remove(obj_id)
+            return True
+    
+    def transform_many(self, obj_ids: Optional[List[int]] = None, translate=None,
+                       rotate=None, scale=None) -> int:
+        """Vectorized translate/rotate/scale over many objects (all when obj_ids is None)"""
+        with self.lock:
+            return self._transform_many(obj_ids, translate, rotate, scale)
+    
+    def _transform_many(self, obj_ids, translate, rotate, scale) -> int:
+        slots = self.transforms.slots(obj_ids)
+        ops = {}
+        for name, value in (('translate', translate), ('rotate', rotate), ('scale', scale)):
+            if value is None:
+                continue
+            try:
+                arr = np.asarray(value, dtype=np.float64)
+                np.broadcast_to(arr, (len(slots), 3) if arr.ndim else ())
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be a number, [x, y, z] or one [x, y, z] per object")
+            ops[name] = arr
+        if 'translate' in ops:
+            self.transforms.translate_many(slots, ops['translate'])
+        if 'rotate' in ops:
+            self.transforms.rotate_many(slots, ops['rotate'])
+        if 'scale' in ops:
+            self.transforms.scale_many(slots, ops['scale'])
+        if 'translate' in ops or 'scale' in ops:
+            self.spatial_index.update_many(
+                self.transforms.ids(slots),
+                self.transforms.positions[slots],
+                self.transforms.scales[slots]
+            )
+        return len(slots)
+    
+    def model_matrices(self):
+        """(ids, N x 4 x 4 model matrices) for every object"""
+        with self.lock:
+            slots = self.transforms.slots()
+            return self.transforms.ids(slots), self.transforms.model_matrices(slots)
 
 
 class KiachaOS3DAPI:
-    def __init__(self, host: str = "0.0.0.0", port: int = 5000):
+    def __init__(self, host: str = "0.0.0.0", port: int = 5000,
+                 mesh_cache_dir: Optional[str] = None):
         self.app = Flask(__name__)
         self.host = host
         self.port = port
@@ -61,10 +149,17 @@ class KiachaOS3DAPI:
         # Initialize mock engine components
         self.renderer = MockRenderer()
         self.scene_manager = MockSceneManager()
+        self.mesh_loader = MeshLoader(MeshCache(cache_dir=mesh_cache_dir))
+        self.command_bus = CommandBus()
+        self.selected_id: Optional[int] = None
+        self.metrics = Metrics()
+        instrument_flask(self.app, self.metrics)
+        self._register_gauges()
         self.ai_enabled = False
         self.ai_autonomy_level = 0.5  # 0.0 to 1.0
         
         self._setup_routes()
+        self._register_commands()
         logger.info(f"[KiachaOS 3D API] Initialized on {host}:{port}")
         
     def _setup_routes(self):
@@ -78,7 +173,7 @@ class KiachaOS3DAPI:
         # Scene endpoints
         @self.app.route('/api/scene/objects', methods=['GET'])
         def get_objects():
-            return jsonify({"objects": list(self.scene_manager.objects.values())})
+            return jsonify({"objects": self.scene_manager.list_objects()})
         
         @self.app.route('/api/scene/objects', methods=['POST'])
         def create_object():
@@ -89,52 +184,117 @@ class KiachaOS3DAPI:
         
         @self.app.route('/api/scene/objects/<int:obj_id>', methods=['GET'])
         def get_object(obj_id):
-            obj = self.scene_manager.objects.get(obj_id)
+            obj = self.scene_manager.get_object(obj_id)
             if not obj:
                 return jsonify({"error": "Object not found"}), 404
             return jsonify(obj)
         
         @self.app.route('/api/scene/objects/<int:obj_id>', methods=['PUT'])
         def update_object(obj_id):
-            obj = self.scene_manager.objects.get(obj_id)
-            if not obj:
-                return jsonify({"error": "Object not found"}), 404
-            
             data = request.json
-            obj.update(data)
+            try:
+                obj = self.scene_manager.update_object(obj_id, data)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if obj is None:
+                return jsonify({"error": "Object not found"}), 404
             return jsonify(obj)
         
         @self.app.route('/api/scene/objects/<int:obj_id>', methods=['DELETE'])
         def delete_object(obj_id):
-            if obj_id in self.scene_manager.objects:
-                del self.scene_manager.objects[obj_id]
+            if self.scene_manager.remove_object(obj_id):
                 return '', 204
             return jsonify({"error": "Object not found"}), 404
         
+        @self.app.route('/api/scene/objects/bulk', methods=['POST'])
+        def bulk_transform():
+            """Translate/rotate/scale many objects in one vectorized step.
+            
+            Body: {"ids": [...] (optional, default all), "translate": [x,y,z],
+                   "rotate": [x,y,z] (degrees), "scale": factor or [x,y,z]}
+            Each value may also be a list with one [x,y,z] per id.
+            """
+            data = request.json or {}
+            try:
+                count = self.scene_manager.transform_many(
+                    data.get('ids'),
+                    translate=data.get('translate'),
+                    rotate=data.get('rotate'),
+                    scale=data.get('scale')
+                )
+            except KeyError as e:
+                return jsonify({"error": f"Object not found: {e.args[0]}"}), 404
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"updated": count})
+        
+        # Spatial queries
+        @self.app.route('/api/scene/pick', methods=['POST'])
+        def pick_objects():
+            """Objects under a ray, nearest first.
+            
+            Body: {"origin": [x,y,z], "direction": [x,y,z]} or
+                  {"ndc": [x,y]} to cast through the current camera.
+            """
+            data = request.json or {}
+            try:
+                with self.scene_manager.lock:
+                    if 'ndc' in data:
+                        origin, direction = camera_ray(self.renderer.camera, data['ndc'])
+                    else:
+                        origin, direction = data['origin'], data['direction']
+                    hits = self.scene_manager.spatial_index.ray_pick(
+                        origin, direction,
+                        max_distance=float(data.get('max_distance', float('inf'))),
+                        limit=data.get('limit')
+                    )
+                    objects = self.scene_manager.objects
+                    hits = [{"id": obj_id, "name": objects[obj_id]["name"], "distance": dist}
+                            for obj_id, dist in hits]
+            except KeyError as e:
+                return jsonify({"error": f"Missing field: {e.args[0]}"}), 400
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"hits": hits})
+        
+        @self.app.route('/api/scene/visible', methods=['POST'])
+        def visible_objects():
+            """Objects inside the camera frustum (body may override camera fields)"""
+            data = request.get_json(silent=True) or {}
+            with self.scene_manager.lock:
+                camera = {**self.renderer.camera, **data}
+            try:
+                ids = self.scene_manager.spatial_index.frustum_query(frustum_planes(camera))
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"ids": ids, "count": len(ids)})
+        
         # Camera endpoints
         @self.app.route('/api/camera', methods=['GET'])
         def get_camera():
-            return jsonify(self.renderer.camera)
+            with self.scene_manager.lock:
+                return jsonify(dict(self.renderer.camera))
         
         @self.app.route('/api/camera', methods=['PUT'])
         def update_camera():
             data = request.json
-            self.renderer.camera.update(data)
-            return jsonify(self.renderer.camera)
+            with self.scene_manager.lock:
+                self.renderer.camera.update(data)
+                return jsonify(dict(self.renderer.camera))
         
         @self.app.route('/api/camera/pan', methods=['POST'])
         def pan_camera():
             data = request.json
             delta = data.get('delta', [0, 0, 0])
             logger.info(f"[API] Camera pan: {delta}")
-            return jsonify({"status": "ok"})
+            return self._queue_command('pan', 'camera', {'delta': delta})
         
         @self.app.route('/api/camera/zoom', methods=['POST'])
         def zoom_camera():
             data = request.json
             factor = data.get('factor', 1.1)
             logger.info(f"[API] Camera zoom: {factor}")
-            return jsonify({"status": "ok"})
+            return self._queue_command('zoom', 'camera', {'factor': factor})
         
         # Lighting endpoints
         @self.app.route('/api/lights', methods=['GET'])
@@ -151,11 +311,29 @@ class KiachaOS3DAPI:
         # Model loading
         @self.app.route('/api/models/load', methods=['POST'])
         def load_model():
+            """Queue a background load; poll /api/models/jobs/<job_id> for the object id"""
             data = request.json
             filepath = data.get('filepath')
+            if not filepath:
+                return jsonify({"error": "filepath required"}), 400
             logger.info(f"[API] Loading model: {filepath}")
-            obj_id = self.scene_manager.add_object(filepath)
-            return jsonify({"id": obj_id, "filepath": filepath}), 201
+            job = self.mesh_loader.submit(filepath, on_done=self._add_loaded_model)
+            return jsonify(job.to_dict()), 202
+        
+        @self.app.route('/api/models/jobs/<job_id>', methods=['GET'])
+        def get_load_job(job_id):
+            job = self.mesh_loader.get_job(job_id)
+            if not job:
+                return jsonify({"error": "Job not found"}), 404
+            return jsonify(job.to_dict())
+        
+        @self.app.route('/api/models/cache', methods=['GET'])
+        def get_mesh_cache():
+            return jsonify({
+                **self.mesh_loader.cache.summary(),
+                "pending_jobs": self.mesh_loader.pending(),
+                "scene_meshes": len(self.scene_manager.meshes)
+            })
         
         # Rendering control
         @self.app.route('/api/render/wireframe', methods=['POST'])
@@ -193,29 +371,157 @@ class KiachaOS3DAPI:
         @self.app.route('/api/ai/suggest', methods=['POST'])
         def ai_suggest():
             """AI suggests scene improvements"""
+            zoom_fit = {"margin": 0.1}
+            bounds = self.scene_manager.spatial_index.bounds()
+            if bounds:
+                zoom_fit["bounds"] = {"min": bounds[0], "max": bounds[1]}
             suggestions = [
                 {"action": "adjust_lighting", "params": {"intensity": 0.8}},
                 {"action": "rotate_view", "params": {"angle": 30}},
-                {"action": "zoom_fit", "params": {"margin": 0.1}}
+                {"action": "zoom_fit", "params": zoom_fit}
             ]
             return jsonify({"suggestions": suggestions})
         
         # Command execution
         @self.app.route('/api/command', methods=['POST'])
         def execute_command():
+            """Queue a command for the next ticks.
+            
+            Body: {"command": "zoom", "target": "camera", "params": {"factor": 1.1}}
+            """
             data = request.json
             command = data.get('command')
             logger.info(f"[API] Executing command: {command}")
-            
-            result = {"command": command, "status": "executed"}
-            return jsonify(result)
+            return self._queue_command(command, data.get('target'), data.get('params'))
+        
+        @self.app.route('/api/command/stats', methods=['GET'])
+        def command_stats():
+            return jsonify(self.command_bus.stats())
+        
+        # Monitoring
+        @self.app.route('/api/metrics', methods=['GET'])
+        def metrics():
+            return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
         
         logger.info("[KiachaOS 3D API] Routes registered")
     
+    def _queue_command(self, action: str, target: Optional[str], params: Optional[Dict[str, Any]]):
+        try:
+            command = self.command_bus.submit(action, target, params)
+        except KeyError:
+            return jsonify({"error": f"Unknown command: {action}"}), 400
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        except QueueFull as e:
+            return jsonify({"error": str(e)}), 429
+        return jsonify({**command.to_dict(), "status": "queued",
+                        "queue_depth": self.command_bus.depth}), 202
+    
+    def _register_gauges(self):
+        """Scene-size gauges sampled on every /api/metrics scrape"""
+        gauges = [
+            ('scene_objects', 'Objects in the scene.', lambda: len(self.scene_manager.objects)),
+            ('scene_meshes', 'Distinct meshes referenced by the scene.',
+             lambda: len(self.scene_manager.meshes)),
+            ('scene_lights', 'Lights in the scene.', lambda: len(self.renderer.lights)),
+            ('mesh_cache_bytes', 'In-memory bytes held by the mesh cache.',
+             lambda: self.mesh_loader.cache.summary()['bytes']),
+            ('mesh_load_jobs_pending', 'Model loads queued or running.', self.mesh_loader.pending),
+            ('command_queue_depth', 'Commands waiting for a tick.', lambda: self.command_bus.depth),
+            ('command_tick_overruns', 'Command ticks that exceeded their budget.',
+             lambda: self.command_bus.stats()['tick_overruns']),
+        ]
+        for name, help_text, fn in gauges:
+            self.metrics.add_gauge(name, help_text, fn)
+    
+    def _register_commands(self):
+        """Scene actions applied by the command bus tick, each under the scene lock"""
+        handlers = {
+            'zoom': self._cmd_zoom,
+            'pan': self._cmd_pan,
+            'rotate': self._cmd_rotate,
+            'wireframe': self._cmd_wireframe,
+            'lighting': self._cmd_lighting,
+            'load_model': self._cmd_load_model,
+            'pick': self._cmd_pick,
+        }
+        for action, handler in handlers.items():
+            self.command_bus.register(action, self._locked(handler))
+    
+    def _locked(self, handler):
+        def apply(cmd: Command):
+            with self.scene_manager.lock:
+                return handler(cmd)
+        return apply
+    
+    def _camera_vectors(self):
+        camera = self.renderer.camera
+        return (np.asarray(camera.get('position', [0, 0, 5]), dtype=np.float64),
+                np.asarray(camera.get('target', [0, 0, 0]), dtype=np.float64))
+    
+    def _cmd_zoom(self, cmd: Command):
+        factor = float(cmd.params.get('factor', 1.1))
+        if factor <= 0:
+            raise ValueError("zoom factor must be positive")
+        position, target = self._camera_vectors()
+        self.renderer.camera['position'] = (target + (position - target) / factor).tolist()
+    
+    def _cmd_pan(self, cmd: Command):
+        delta = np.asarray(cmd.params.get('delta', [0, 0, 0]), dtype=np.float64).reshape(3)
+        position, target = self._camera_vectors()
+        self.renderer.camera['position'] = (position + delta).tolist()
+        self.renderer.camera['target'] = (target + delta).tolist()
+    
+    def _cmd_rotate(self, cmd: Command):
+        axis = 'xyz'.index(cmd.params.get('axis', 'y'))
+        euler = [0.0, 0.0, 0.0]
+        euler[axis] = float(cmd.params.get('degrees', 45))
+        if cmd.target == 'camera':
+            # Orbit the camera around its target
+            position, target = self._camera_vectors()
+            rotation = euler_to_matrices(np.array([euler]))[0]
+            self.renderer.camera['position'] = (target + rotation @ (position - target)).tolist()
+            return
+        obj_id = cmd.params.get('object_id', self.selected_id)
+        if obj_id is None:
+            logger.info("[API] Rotate ignored: no object selected")
+            return
+        self.scene_manager.transform_many([obj_id], rotate=euler)
+    
+    def _cmd_wireframe(self, cmd: Command):
+        self.renderer.wireframe = bool(cmd.params.get('enabled', False))
+    
+    def _cmd_lighting(self, cmd: Command):
+        self.renderer.lighting_enabled = cmd.params.get('mode', 'on') != 'off'
+    
+    def _cmd_load_model(self, cmd: Command):
+        filepath = cmd.params.get('filepath')
+        if not filepath:
+            raise ValueError("load_model needs a filepath")
+        self.mesh_loader.submit(filepath, on_done=self._add_loaded_model)
+    
+    def _cmd_pick(self, cmd: Command):
+        origin, direction = camera_ray(self.renderer.camera, cmd.params.get('ndc', [0, 0]))
+        hits = self.scene_manager.spatial_index.ray_pick(origin, direction, limit=1)
+        self.selected_id = hits[0][0] if hits else None
+    
+    def _add_loaded_model(self, job: LoadJob):
+        """Loader callback (worker thread): instantiate the parsed mesh in the scene"""
+        # One critical section, so no request sees the object without its mesh
+        with self.scene_manager.lock:
+            obj_id = self.scene_manager.add_object(job.filepath)
+            self.scene_manager.attach_mesh(obj_id, job.mesh)
+        job.result["id"] = obj_id
+    
     def run(self, debug: bool = False):
         """Start API server"""
         logger.info(f"[KiachaOS 3D API] Starting server on {self.host}:{self.port}")
-        self.app.run(host=self.host, port=self.port, debug=debug)
+        self.command_bus.start()
+        try:
+            # The reloader would fork a second process with its own bus
+            self.app.run(host=self.host, port=self.port, debug=debug, use_reloader=False)
+        finally:
+            self.command_bus.stop()
 
 
 if __name__ == "__main__":
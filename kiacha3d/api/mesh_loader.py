@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+mesh_loader.py - Background mesh loading with a content-addressed cache
+
+Provides:
+- OBJ and glTF 2.0 (.gltf / .glb) parsing into compact NumPy buffers
+  (float32 N x 3 vertices, uint32 triangle indices)
+- A mesh cache keyed by SHA-256 of the asset bytes, so identical assets
+  are parsed once and the same geometry is shared by every instance
+- Optional on-disk storage of parsed buffers, reopened memory-mapped
+- A thread pool that runs loads in the background and tracks job status
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".obj", ".gltf", ".glb")
+_HASH_CHUNK = 1 << 20
+
+# glTF accessor component types -> dtype
+_GLTF_COMPONENT = {
+    5120: np.int8, 5121: np.uint8, 5122: np.int16,
+    5123: np.uint16, 5125: np.uint32, 5126: np.float32,
+}
+_GLTF_WIDTH = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+
+@dataclass
+class Mesh:
+    """Parsed, immutable geometry shared by every instance of an asset"""
+    key: str
+    vertices: np.ndarray  # (N, 3) float32
+    indices: np.ndarray   # (M,) uint32, three per triangle
+    source: str = ""
+
+    @property
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self.vertices) == 0:
+            zero = np.zeros(3, dtype=np.float32)
+            return zero, zero
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    @property
+    def half_extent(self) -> List[float]:
+        """Per-axis extent around the local origin (conservative for off-center meshes)"""
+        lo, hi = self.bounds
+        return np.maximum(np.abs(lo), np.abs(hi)).tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return self.vertices.nbytes + self.indices.nbytes
+
+    def to_dict(self) -> Dict:
+        lo, hi = self.bounds
+        return {
+            "key": self.key,
+            "source": self.source,
+            "vertex_count": len(self.vertices),
+            "triangle_count": len(self.indices) // 3,
+            "bounds": {"min": lo.tolist(), "max": hi.tolist()},
+            "bytes": self.nbytes,
+            "memory_mapped": isinstance(self.vertices, np.memmap),
+        }
+
+
+# ----------------------------------------------------------------------
+# Hashing
+# ----------------------------------------------------------------------
+
+def _gltf_external_uris(path: str) -> List[str]:
+    with open(path, "rb") as f:
+        doc = json.load(f)
+    base = os.path.dirname(path)
+    return [os.path.join(base, b["uri"]) for b in doc.get("buffers", [])
+            if "uri" in b and not b["uri"].startswith("data:")]
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 over the asset and, for .gltf, its external buffers"""
+    h = hashlib.sha256()
+    paths = [path]
+    if path.lower().endswith(".gltf"):
+        paths += _gltf_external_uris(path)
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+# ----------------------------------------------------------------------
+# Parsers
+# ----------------------------------------------------------------------
+
+def parse_obj(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse Wavefront OBJ geometry; polygons are fan-triangulated"""
+    vlines = []
+    faces = []
+    for line in data.splitlines():
+        if line.startswith(b"v "):
+            vlines.append(line[2:])
+        elif line.startswith(b"f "):
+            faces.append(line[2:].split())
+
+    tokens = b" ".join(vlines).split()
+    if len(tokens) == 3 * len(vlines):
+        vertices = np.array(tokens, dtype=np.float32).reshape(-1, 3)
+    else:
+        # Some exporters append w or per-vertex colors
+        vertices = np.array([l.split()[:3] for l in vlines], dtype=np.float32).reshape(-1, 3)
+
+    n = len(vertices)
+    tris = []
+    for face in faces:
+        idx = []
+        for tok in face:
+            i = int(tok.split(b"/", 1)[0])
+            idx.append(i - 1 if i > 0 else n + i)
+        for k in range(1, len(idx) - 1):
+            tris.extend((idx[0], idx[k], idx[k + 1]))
+    indices = np.asarray(tris, dtype=np.int64)
+    if indices.size and (indices.min() < 0 or indices.max() >= n):
+        raise ValueError("OBJ face references a vertex that does not exist")
+    return vertices, indices.astype(np.uint32)
+
+
+def _read_accessor(doc: Dict, buffers: List[bytes], index: int) -> np.ndarray:
+    acc = doc["accessors"][index]
+    dtype = np.dtype(_GLTF_COMPONENT[acc["componentType"]])
+    width = _GLTF_WIDTH[acc["type"]]
+    count = acc["count"]
+    if "bufferView" not in acc:
+        return np.zeros((count, width), dtype=dtype)
+    view = doc["bufferViews"][acc["bufferView"]]
+    buf = buffers[view["buffer"]]
+    offset = view.get("byteOffset", 0) + acc.get("byteOffset", 0)
+    stride = view.get("byteStride", 0)
+    item = dtype.itemsize * width
+    if stride and stride != item:
+        raw = np.frombuffer(buf, dtype=np.uint8, count=stride * (count - 1) + item, offset=offset)
+        rows = np.lib.stride_tricks.as_strided(raw, shape=(count, item), strides=(stride, 1))
+        return rows.copy().view(dtype).reshape(count, width)
+    return np.frombuffer(buf, dtype=dtype, count=count * width, offset=offset).reshape(count, width)
+
+
+def _load_gltf_doc(path: str, data: bytes) -> Tuple[Dict, List[bytes]]:
+    if data[:4] == b"glTF":
+        _, _, length = struct.unpack_from("<4sII", data, 0)
+        pos, doc, bin_chunk = 12, None, b""
+        while pos < length:
+            chunk_len, chunk_type = struct.unpack_from("<II", data, pos)
+            chunk = data[pos + 8:pos + 8 + chunk_len]
+            if chunk_type == 0x4E4F534A:    # JSON
+                doc = json.loads(chunk)
+            elif chunk_type == 0x004E4942:  # BIN
+                bin_chunk = chunk
+            pos += 8 + chunk_len
+        if doc is None:
+            raise ValueError("GLB file has no JSON chunk")
+    else:
+        doc, bin_chunk = json.loads(data), b""
+
+    buffers = []
+    base = os.path.dirname(path)
+    for b in doc.get("buffers", []):
+        uri = b.get("uri")
+        if uri is None:
+            buffers.append(bin_chunk)
+        elif uri.startswith("data:"):
+            buffers.append(base64.b64decode(uri.split(",", 1)[1]))
+        else:
+            with open(os.path.join(base, uri), "rb") as f:
+                buffers.append(f.read())
+    return doc, buffers
+
+
+def parse_gltf(path: str, data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge all triangle primitives of a .gltf/.glb into one buffer pair"""
+    doc, buffers = _load_gltf_doc(path, data)
+    vertex_parts, index_parts, base = [], [], 0
+    for mesh in doc.get("meshes", []):
+        for prim in mesh.get("primitives", []):
+            if prim.get("mode", 4) != 4 or "POSITION" not in prim.get("attributes", {}):
+                continue
+            positions = _read_accessor(doc, buffers, prim["attributes"]["POSITION"])
+            if "indices" in prim:
+                idx = _read_accessor(doc, buffers, prim["indices"]).reshape(-1).astype(np.uint32)
+            else:
+                idx = np.arange(len(positions), dtype=np.uint32)
+            vertex_parts.append(positions.astype(np.float32, copy=False))
+            index_parts.append(idx + base)
+            base += len(positions)
+    if not vertex_parts:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros(0, dtype=np.uint32)
+    return np.concatenate(vertex_parts), np.concatenate(index_parts)
+
+
+def parse_mesh(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported model format: {ext or path}")
+    with open(path, "rb") as f:
+        data = f.read()
+    if ext == ".obj":
+        return parse_obj(data)
+    return parse_gltf(path, data)
+
+
+# ----------------------------------------------------------------------
+# Cache
+# ----------------------------------------------------------------------
+
+class MeshCache:
+    """Content-hash keyed mesh cache with optional memory-mapped disk tier"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._meshes: "OrderedDict[str, Mesh]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Mesh]:
+        with self._lock:
+            mesh = self._meshes.get(key)
+            if mesh is not None:
+                self._meshes.move_to_end(key)
+                self.stats["hits"] += 1
+                return mesh
+        mesh = self._load_disk(key)
+        if mesh is not None:
+            self.stats["disk_hits"] += 1
+            self._remember(mesh)
+            return mesh
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, vertices: np.ndarray, indices: np.ndarray, source: str = "") -> Mesh:
+        if self.cache_dir:
+            vpath, ipath = self._paths(key)
+            for path, arr in ((vpath, vertices), (ipath, indices)):
+                tmp = path + ".tmp.npy"
+                np.save(tmp, np.ascontiguousarray(arr))
+                os.replace(tmp, path)
+            mesh = self._load_disk(key, source)
+        else:
+            mesh = Mesh(key, vertices, indices, source)
+        self._remember(mesh)
+        return mesh
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._meshes), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "cache_dir": self.cache_dir, **self.stats}
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (os.path.join(self.cache_dir, f"{key}.vertices.npy"),
+                os.path.join(self.cache_dir, f"{key}.indices.npy"))
+
+    def _load_disk(self, key: str, source: str = "") -> Optional[Mesh]:
+        if not self.cache_dir:
+            return None
+        vpath, ipath = self._paths(key)
+        if not (os.path.exists(vpath) and os.path.exists(ipath)):
+            return None
+        return Mesh(key, np.load(vpath, mmap_mode="r"), np.load(ipath, mmap_mode="r"), source)
+
+    def _remember(self, mesh: Mesh):
+        with self._lock:
+            if mesh.key in self._meshes:
+                return
+            self._meshes[mesh.key] = mesh
+            # Memory-mapped buffers live in the page cache, not our budget
+            if not isinstance(mesh.vertices, np.memmap):
+                self._bytes += mesh.nbytes
+            while self._bytes > self.max_bytes and len(self._meshes) > 1:
+                _, old = self._meshes.popitem(last=False)
+                if not isinstance(old.vertices, np.memmap):
+                    self._bytes -= old.nbytes
+                self.stats["evictions"] += 1
+
+
+# ----------------------------------------------------------------------
+# Background loader
+# ----------------------------------------------------------------------
+
+@dataclass
+class LoadJob:
+    """Status of one background load"""
+    job_id: str
+    filepath: str
+    status: str = "queued"  # queued | loading | done | error
+    mesh: Optional[Mesh] = None
+    cached: bool = False
+    error: Optional[str] = None
+    result: Dict = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.job_id,
+            "filepath": self.filepath,
+            "status": self.status,
+            "cached": self.cached,
+            **self.result,
+        }
+        if self.mesh is not None:
+            data["mesh"] = self.mesh.to_dict()
+        if self.error:
+            data["error"] = self.error
+        if self.finished_at:
+            data["elapsed_ms"] = round((self.finished_at - self.submitted_at) * 1000, 2)
+        return data
+
+
+class MeshLoader:
+    """Thread pool that resolves file paths to cached Mesh objects"""
+
+    def __init__(self, cache: Optional[MeshCache] = None, max_workers: int = 2,
+                 max_jobs: int = 1024):
+        self.cache = cache or MeshCache()
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mesh-loader")
+        self._jobs: "OrderedDict[str, LoadJob]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, filepath: str,
+               on_done: Optional[Callable[[LoadJob], None]] = None) -> LoadJob:
+        """Queue a load; on_done runs in the worker once the mesh is ready"""
+        job = LoadJob(job_id=uuid.uuid4().hex[:12], filepath=filepath)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job, on_done)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[LoadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status in ("queued", "loading"))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job: LoadJob, on_done):
+        job.status = "loading"
+        try:
+            key = content_hash(job.filepath)
+            mesh = self.cache.get(key)
+            if mesh is not None:
+                job.cached = True
+            else:
+                mesh = self._parse_once(key, job.filepath)
+            job.mesh = mesh
+            if on_done:
+                on_done(job)
+            job.status = "done"
+            logger.info(f"[MeshLoader] {job.filepath}: {len(mesh.indices) // 3} triangles"
+                        f"{' (cached)' if job.cached else ''}")
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            logger.error(f"[MeshLoader] Failed to load {job.filepath}: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def _parse_once(self, key: str, filepath: str) -> Mesh:
+        """Parse unless another worker is already parsing the same content"""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            vertices, indices = parse_mesh(filepath)
+            mesh = self.cache.put(key, vertices, indices, source=filepath)
+            future.set_result(mesh)
+            return mesh
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        # Synthetic grid so the loader can be exercised without assets
+        n = 300
+        grid = np.stack(np.meshgrid(np.arange(n), np.arange(n), [0.0]), -1).reshape(-1, 3)
+        lines = [f"v {x} {y} {z}" for x, y, z in grid]
+        lines += [f"f {i + 1} {i + 2} {i + n + 2} {i + n + 1}"
+                  for i in range(n * (n - 1)) if (i + 1) % n]
+        fd, path = tempfile.mkstemp(suffix=".obj")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines))
+
+    loader = MeshLoader(MeshCache(cache_dir=tempfile.mkdtemp()))
+    for _ in range(2):
+        job = loader.submit(path)
+        while job.status in ("queued", "loading"):
+            time.sleep(0.005)
+        logger.info(json.dumps(job.to_dict(), indent=2))
+    loader.shutdown()
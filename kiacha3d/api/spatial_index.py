@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+spatial_index.py - Array-backed BVH over scene object bounds
+
+Provides:
+- Axis-aligned bounding boxes stored in contiguous NumPy arrays
+- A flat bounding volume hierarchy traversed level by level
+- Incremental refit when objects move or scale
+- Ray picking, frustum culling and scene bounds queries
+- Camera helpers (look-at, perspective, frustum planes, picking rays)
+
+Objects are treated as boxes with a local half extent (0.5 for the unit
+cube the mock scene uses) scaled by the object's scale. Rotation is folded
+in conservatively by bounding the scaled box with its enclosing sphere, so
+rotating an object never requires touching the index.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENT = (0.5, 0.5, 0.5)
+
+
+def _vec3(value, name: str) -> np.ndarray:
+    """Convert a JSON-style triple into a float64 vector"""
+    try:
+        vec = np.asarray(value, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a list of 3 numbers")
+    if vec.shape != (3,) or not np.all(np.isfinite(vec)):
+        raise ValueError(f"{name} must be a list of 3 finite numbers")
+    return vec
+
+
+class SpatialIndex:
+    """BVH over object AABBs with incremental refit
+
+    Object bounds live in slot-indexed arrays. The tree is a flat array of
+    nodes whose leaves reference contiguous runs of `_order`. Objects added
+    after the last build are kept in a pending set and tested brute force
+    until enough accumulate to justify a rebuild.
+    """
+
+    def __init__(self, leaf_size: int = 32, rebuild_ratio: float = 0.25,
+                 capacity: int = 1024):
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        self._lock = threading.RLock()
+
+        # Per-slot object data
+        self._centers = np.zeros((capacity, 3), dtype=np.float32)
+        self._half = np.zeros((capacity, 3), dtype=np.float32)
+        self._mins = np.zeros((capacity, 3), dtype=np.float32)
+        self._maxs = np.zeros((capacity, 3), dtype=np.float32)
+        self._extent = np.tile(np.asarray(DEFAULT_EXTENT, dtype=np.float32), (capacity, 1))
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._leaf_of = np.full(capacity, -1, dtype=np.int32)
+        self._slot_of: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._high_water = 0
+
+        # Tree state
+        self._order = np.zeros(0, dtype=np.int32)
+        self._node_min = np.zeros((0, 3), dtype=np.float32)
+        self._node_max = np.zeros((0, 3), dtype=np.float32)
+        self._node_left = np.zeros(0, dtype=np.int32)
+        self._node_right = np.zeros(0, dtype=np.int32)
+        self._node_start = np.zeros(0, dtype=np.int32)
+        self._node_count = np.zeros(0, dtype=np.int32)
+        self._node_parent = np.zeros(0, dtype=np.int32)
+        self._levels: List[np.ndarray] = []
+        self._pending: set = set()
+        self._dirty_leaves: set = set()
+
+        self.stats = {"builds": 0, "refits": 0, "full_refits": 0}
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, obj_id: int) -> bool:
+        return obj_id in self._slot_of
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+
+    def insert(self, obj_id: int, position, scale, extent=None):
+        """Add an object to the index"""
+        pos = _vec3(position, "position")
+        scl = _vec3(scale, "scale")
+        ext = _vec3(extent, "extent") if extent is not None else None
+        with self._lock:
+            if obj_id in self._slot_of:
+                raise KeyError(f"Object {obj_id} already indexed")
+            slot = self._allocate_slot()
+            self._slot_of[obj_id] = slot
+            self._ids[slot] = obj_id
+            self._alive[slot] = True
+            self._extent[slot] = ext if ext is not None else DEFAULT_EXTENT
+            self._write_bounds(slot, pos, scl)
+            if self._leaf_of[slot] < 0:
+                self._pending.add(slot)
+
+    def update(self, obj_id: int, position, scale):
+        """Move or rescale an indexed object"""
+        pos = _vec3(position, "position")
+        scl = _vec3(scale, "scale")
+        with self._lock:
+            slot = self._slot_of[obj_id]
+            self._write_bounds(slot, pos, scl)
+
+    def update_many(self, obj_ids: Sequence[int], positions, scales):
+        """Vectorized update for many objects at once"""
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        scales = np.asarray(scales, dtype=np.float32).reshape(-1, 3)
+        with self._lock:
+            slots = np.fromiter((self._slot_of[i] for i in obj_ids),
+                                dtype=np.int64, count=len(obj_ids))
+            if slots.size == 0:
+                return
+            radius = np.linalg.norm(self._extent[slots] * scales, axis=1)
+            self._centers[slots] = positions
+            self._half[slots] = radius[:, None]
+            self._mins[slots] = positions - radius[:, None]
+            self._maxs[slots] = positions + radius[:, None]
+            leaves = self._leaf_of[slots]
+            self._dirty_leaves.update(np.unique(leaves[leaves >= 0]).tolist())
+
+    def set_extent(self, obj_id: int, extent, position, scale):
+        """Replace an object's local half extent (e.g. from mesh bounds)"""
+        ext = _vec3(extent, "extent")
+        with self._lock:
+            slot = self._slot_of[obj_id]
+            self._extent[slot] = ext
+            self._write_bounds(slot, _vec3(position, "position"), _vec3(scale, "scale"))
+
+    def remove(self, obj_id: int):
+        """Drop an object; its slot stays in the tree until reused or rebuilt"""
+        with self._lock:
+            slot = self._slot_of.pop(obj_id)
+            self._alive[slot] = False
+            self._ids[slot] = -1
+            self._pending.discard(slot)
+            self._free.append(slot)
+
+    def rebuild(self):
+        """Rebuild the tree from scratch over all live objects"""
+        with self._lock:
+            self._build()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def bounds(self) -> Optional[Tuple[List[float], List[float]]]:
+        """Return (min, max) over every live object, or None if empty"""
+        with self._lock:
+            alive = self._alive[:self._high_water]
+            if not alive.any():
+                return None
+            lo = self._mins[:self._high_water][alive].min(axis=0)
+            hi = self._maxs[:self._high_water][alive].max(axis=0)
+            return lo.tolist(), hi.tolist()
+
+    def ray_pick(self, origin, direction, max_distance: float = np.inf,
+                 limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return (id, distance) pairs for objects hit by a ray, nearest first"""
+        o = _vec3(origin, "origin")
+        d = _vec3(direction, "direction")
+        length = np.linalg.norm(d)
+        if length == 0:
+            raise ValueError("direction must be non-zero")
+        d = d / length
+        d = np.where(np.abs(d) < 1e-12, 1e-12, d)
+        inv = (1.0 / d).astype(np.float32)
+        o = o.astype(np.float32)
+
+        def test(lo, hi):
+            t1 = (lo - o) * inv
+            t2 = (hi - o) * inv
+            tmin = np.minimum(t1, t2).max(axis=1)
+            tmax = np.maximum(t1, t2).min(axis=1)
+            return (tmax >= np.maximum(tmin, 0)) & (tmin <= max_distance), tmin
+
+        with self._lock:
+            slots = self._candidates(lambda lo, hi: test(lo, hi)[0])
+            if slots.size == 0:
+                return []
+            hit, tmin = test(self._mins[slots], self._maxs[slots])
+            slots = slots[hit]
+            dist = np.maximum(tmin[hit], 0)
+            order = np.argsort(dist, kind="stable")
+            if limit is not None:
+                order = order[:limit]
+            return [(int(i), float(t)) for i, t in zip(self._ids[slots[order]], dist[order])]
+
+    def frustum_query(self, planes) -> List[int]:
+        """Return ids of objects intersecting a frustum
+
+        `planes` is a (6, 4) array of inward-facing (nx, ny, nz, d) planes,
+        as produced by `frustum_planes`.
+        """
+        planes = np.asarray(planes, dtype=np.float32).reshape(6, 4)
+        normals = planes[:, :3]
+        offsets = planes[:, 3]
+        abs_normals = np.abs(normals)
+
+        def test(lo, hi):
+            center = (lo + hi) * 0.5
+            half = (hi - lo) * 0.5
+            dist = center @ normals.T + offsets + half @ abs_normals.T
+            return (dist >= 0).all(axis=1)
+
+        with self._lock:
+            slots = self._candidates(test)
+            if slots.size == 0:
+                return []
+            slots = slots[test(self._mins[slots], self._maxs[slots])]
+            return self._ids[np.sort(slots)].tolist()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _allocate_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        slot = self._high_water
+        if slot == len(self._alive):
+            self._grow()
+        self._high_water += 1
+        return slot
+
+    def _grow(self):
+        capacity = len(self._alive) * 2
+        for name in ("_centers", "_half", "_mins", "_maxs"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, 3), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        extent = np.tile(np.asarray(DEFAULT_EXTENT, dtype=np.float32), (capacity, 1))
+        extent[:len(self._extent)] = self._extent
+        self._extent = extent
+        for name, fill in (("_alive", False), ("_ids", -1), ("_leaf_of", -1)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _write_bounds(self, slot: int, pos: np.ndarray, scl: np.ndarray):
+        radius = float(np.linalg.norm(self._extent[slot] * scl))
+        self._centers[slot] = pos
+        self._half[slot] = radius
+        self._mins[slot] = pos - radius
+        self._maxs[slot] = pos + radius
+        leaf = self._leaf_of[slot]
+        if leaf >= 0:
+            self._dirty_leaves.add(int(leaf))
+
+    def _candidates(self, node_test) -> np.ndarray:
+        """Slots whose leaf (or pending status) survives `node_test`"""
+        if len(self._pending) > max(self.leaf_size, self.rebuild_ratio * len(self._order)):
+            self._build()
+        elif self._dirty_leaves:
+            self._refit()
+
+        parts = []
+        if len(self._node_left):
+            frontier = np.zeros(1, dtype=np.int32)
+            leaves = []
+            while frontier.size:
+                frontier = frontier[node_test(self._node_min[frontier], self._node_max[frontier])]
+                is_leaf = self._node_left[frontier] < 0
+                leaves.append(frontier[is_leaf])
+                inner = frontier[~is_leaf]
+                frontier = np.concatenate((self._node_left[inner], self._node_right[inner]))
+            leaves = np.concatenate(leaves)
+            if leaves.size:
+                starts = self._node_start[leaves]
+                counts = self._node_count[leaves]
+                total = int(counts.sum())
+                index = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+                tree_slots = self._order[index]
+                parts.append(tree_slots[self._alive[tree_slots]])
+        if self._pending:
+            parts.append(np.fromiter(self._pending, dtype=np.int32, count=len(self._pending)))
+        if not parts:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate(parts)
+
+    def _build(self):
+        """Median-split build over the centers of all live slots"""
+        slots = np.flatnonzero(self._alive[:self._high_water]).astype(np.int32)
+        self._leaf_of[:] = -1
+        self._pending.clear()
+        self._dirty_leaves.clear()
+        self._order = slots
+        self.stats["builds"] += 1
+
+        node_min, node_max, left, right, start, count, parent, depth = ([] for _ in range(8))
+        if slots.size == 0:
+            self._node_left = np.zeros(0, dtype=np.int32)
+            self._levels = []
+            return
+
+        centers = self._centers
+        stack = [(0, slots.size, -1, 0)]
+        while stack:
+            lo, hi, par, dep = stack.pop()
+            node = len(left)
+            seg = self._order[lo:hi]
+            node_min.append(self._mins[seg].min(axis=0))
+            node_max.append(self._maxs[seg].max(axis=0))
+            parent.append(par)
+            depth.append(dep)
+            start.append(lo)
+            count.append(hi - lo)
+            left.append(-1)
+            right.append(-1)
+            if par >= 0:
+                if left[par] == -2:
+                    left[par] = node
+                else:
+                    right[par] = node
+            if hi - lo <= self.leaf_size:
+                self._leaf_of[seg] = node
+                continue
+            c = centers[seg]
+            axis = int(np.argmax(c.max(axis=0) - c.min(axis=0)))
+            mid = (hi - lo) // 2
+            self._order[lo:hi] = seg[np.argpartition(c[:, axis], mid)]
+            left[node] = -2  # marker: first child pushed next becomes left
+            stack.append((lo + mid, hi, node, dep + 1))
+            stack.append((lo, lo + mid, node, dep + 1))
+
+        self._node_min = np.asarray(node_min, dtype=np.float32)
+        self._node_max = np.asarray(node_max, dtype=np.float32)
+        self._node_left = np.asarray(left, dtype=np.int32)
+        self._node_right = np.asarray(right, dtype=np.int32)
+        self._node_start = np.asarray(start, dtype=np.int32)
+        self._node_count = np.asarray(count, dtype=np.int32)
+        self._node_parent = np.asarray(parent, dtype=np.int32)
+        depth = np.asarray(depth, dtype=np.int32)
+        inner = np.flatnonzero(self._node_left >= 0)
+        self._levels = [inner[depth[inner] == d] for d in range(int(depth.max()), -1, -1)]
+
+    def _refit(self):
+        """Recompute bounds of dirty leaves and their ancestors"""
+        dirty = np.fromiter(self._dirty_leaves, dtype=np.int32, count=len(self._dirty_leaves))
+        self._dirty_leaves.clear()
+        self.stats["refits"] += 1
+        leaves = np.flatnonzero(self._node_left < 0)
+
+        if dirty.size * 8 >= leaves.size:
+            # Most of the tree moved: refit every node with segmented reductions
+            self.stats["full_refits"] += 1
+            leaves = leaves[np.argsort(self._node_start[leaves])]
+            starts = self._node_start[leaves]
+            ordered = self._order
+            self._node_min[leaves] = np.minimum.reduceat(self._mins[ordered], starts, axis=0)
+            self._node_max[leaves] = np.maximum.reduceat(self._maxs[ordered], starts, axis=0)
+            for level in self._levels:
+                l, r = self._node_left[level], self._node_right[level]
+                self._node_min[level] = np.minimum(self._node_min[l], self._node_min[r])
+                self._node_max[level] = np.maximum(self._node_max[l], self._node_max[r])
+            return
+
+        ancestors = set()
+        for leaf in dirty.tolist():
+            s = self._node_start[leaf]
+            seg = self._order[s:s + self._node_count[leaf]]
+            self._node_min[leaf] = self._mins[seg].min(axis=0)
+            self._node_max[leaf] = self._maxs[seg].max(axis=0)
+            p = int(self._node_parent[leaf])
+            while p >= 0 and p not in ancestors:
+                ancestors.add(p)
+                p = int(self._node_parent[p])
+        for level in self._levels:
+            nodes = level[np.isin(level, list(ancestors))]
+            if nodes.size:
+                l, r = self._node_left[nodes], self._node_right[nodes]
+                self._node_min[nodes] = np.minimum(self._node_min[l], self._node_min[r])
+                self._node_max[nodes] = np.maximum(self._node_max[l], self._node_max[r])
+
+
+# ----------------------------------------------------------------------
+# Camera helpers
+# ----------------------------------------------------------------------
+
+def look_at(eye, target, up=(0, 1, 0)) -> np.ndarray:
+    """Right-handed view matrix"""
+    eye = _vec3(eye, "position")
+    f = _vec3(target, "target") - eye
+    f /= np.linalg.norm(f)
+    s = np.cross(f, _vec3(up, "up"))
+    s /= np.linalg.norm(s)
+    u = np.cross(s, f)
+    view = np.identity(4)
+    view[0, :3], view[1, :3], view[2, :3] = s, u, -f
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view
+
+
+def perspective(fov_deg: float, aspect: float, near: float, far: float) -> np.ndarray:
+    """OpenGL-style perspective projection matrix"""
+    f = 1.0 / np.tan(np.radians(fov_deg) / 2)
+    proj = np.zeros((4, 4))
+    proj[0, 0] = f / aspect
+    proj[1, 1] = f
+    proj[2, 2] = (far + near) / (near - far)
+    proj[2, 3] = 2 * far * near / (near - far)
+    proj[3, 2] = -1
+    return proj
+
+
+def camera_matrices(camera: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """View and projection matrices for a renderer camera dict"""
+    view = look_at(camera.get("position", (0, 0, 5)),
+                   camera.get("target", (0, 0, 0)),
+                   camera.get("up", (0, 1, 0)))
+    proj = perspective(float(camera.get("fov", 45)),
+                       float(camera.get("aspect", 16 / 9)),
+                       float(camera.get("near", 0.1)),
+                       float(camera.get("far", 1000.0)))
+    return view, proj
+
+
+def frustum_planes(camera: Dict) -> np.ndarray:
+    """Six inward-facing planes (left, right, bottom, top, near, far)"""
+    view, proj = camera_matrices(camera)
+    m = proj @ view
+    planes = np.array([m[3] + m[0], m[3] - m[0],
+                       m[3] + m[1], m[3] - m[1],
+                       m[3] + m[2], m[3] - m[2]])
+    planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+    return planes
+
+
+def camera_ray(camera: Dict, ndc) -> Tuple[List[float], List[float]]:
+    """World-space ray through a point in normalized device coordinates"""
+    x, y = (float(v) for v in ndc)
+    view, proj = camera_matrices(camera)
+    inv = np.linalg.inv(proj @ view)
+    near = inv @ np.array([x, y, -1.0, 1.0])
+    far = inv @ np.array([x, y, 1.0, 1.0])
+    near, far = near[:3] / near[3], far[:3] / far[3]
+    direction = far - near
+    return near.tolist(), (direction / np.linalg.norm(direction)).tolist()
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def benchmark(n: int = 100_000, queries: int = 1000, seed: int = 0):
+    """Time index operations against brute force at scene size n"""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-500, 500, (n, 3))
+    scales = rng.uniform(0.5, 3.0, (n, 3))
+    index = SpatialIndex()
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        index.insert(i, positions[i], scales[i])
+    t_insert = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index.rebuild()
+    t_build = time.perf_counter() - t0
+
+    origins = rng.uniform(-600, 600, (queries, 3))
+    directions = rng.normal(size=(queries, 3))
+    t0 = time.perf_counter()
+    for o, d in zip(origins, directions):
+        index.ray_pick(o, d, limit=1)
+    t_pick = (time.perf_counter() - t0) / queries
+
+    mins, maxs = index._mins[:n], index._maxs[:n]
+    t0 = time.perf_counter()
+    for o, d in zip(origins[:100], directions[:100]):
+        d = d / np.linalg.norm(d)
+        t1 = (mins - o) / d
+        t2 = (maxs - o) / d
+        tmin = np.minimum(t1, t2).max(axis=1)
+        tmax = np.maximum(t1, t2).min(axis=1)
+        np.flatnonzero(tmax >= np.maximum(tmin, 0))
+    t_brute = (time.perf_counter() - t0) / 100
+
+    camera = {"position": [0, 0, 600], "target": [0, 0, 0], "fov": 45}
+    planes = frustum_planes(camera)
+    t0 = time.perf_counter()
+    visible = index.frustum_query(planes)
+    t_frustum = time.perf_counter() - t0
+
+    moved = rng.choice(n, size=queries, replace=False)
+    t0 = time.perf_counter()
+    for i in moved.tolist():
+        index.update(i, positions[i] + 1.0, scales[i])
+    index.ray_pick(origins[0], directions[0], limit=1)
+    t_update = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index.update_many(range(n), positions + 2.0, scales)
+    index.ray_pick(origins[0], directions[0], limit=1)
+    t_bulk = time.perf_counter() - t0
+
+    logger.info(f"[SpatialIndex] n={n}")
+    logger.info(f"  insert:        {t_insert * 1e3:9.1f} ms total")
+    logger.info(f"  build:         {t_build * 1e3:9.1f} ms")
+    logger.info(f"  ray pick:      {t_pick * 1e6:9.1f} us/query (brute force {t_brute * 1e6:.1f} us)")
+    logger.info(f"  frustum:       {t_frustum * 1e3:9.1f} ms ({len(visible)} visible)")
+    logger.info(f"  {queries} updates + refit: {t_update * 1e3:.1f} ms")
+    logger.info(f"  bulk update + full refit: {t_bulk * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+transform_store.py - Structure-of-arrays transform storage for scene objects
+
+Provides:
+- Contiguous N x 3 position / rotation / scale arrays with a free-list
+- Dict-compatible per-object views for the JSON routes
+- Vectorized bulk translate / rotate / scale
+- Vectorized model matrix computation
+
+Rotations are Euler angles in degrees, applied X then Y then Z, matching the
+[x, y, z] lists the REST API has always exposed.
+"""
+
+import logging
+import time
+import tracemalloc
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRANSFORM_FIELDS = ("position", "rotation", "scale")
+_DEFAULTS = {"position": (0, 0, 0), "rotation": (0, 0, 0), "scale": (1, 1, 1)}
+
+
+class ObjectView(MutableMapping):
+    """Dict-like view of one object backed by the store's arrays
+
+    Transform fields read and write through to the arrays and the name
+    lives in a flat list; any other key (mesh, color, ...) goes into a
+    per-object dict created on first use. Transform values are returned as
+    fresh lists, so mutate them via assignment.
+    """
+
+    __slots__ = ("_store", "_slot")
+
+    def __init__(self, store: "TransformStore", slot: int):
+        self._store = store
+        self._slot = slot
+
+    def __getitem__(self, key: str) -> Any:
+        if key in TRANSFORM_FIELDS:
+            return self._store._arrays[key][self._slot].tolist()
+        if key == "id":
+            return int(self._store._ids[self._slot])
+        if key == "name":
+            return self._store._names[self._slot]
+        extras = self._store._extras[self._slot]
+        if extras is None:
+            raise KeyError(key)
+        return extras[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in TRANSFORM_FIELDS:
+            self._store._arrays[key][self._slot] = _vec3(value, key)
+        elif key == "id":
+            raise KeyError("id is read-only")
+        elif key == "name":
+            self._store._names[self._slot] = value
+        else:
+            if self._store._extras[self._slot] is None:
+                self._store._extras[self._slot] = {}
+            self._store._extras[self._slot][key] = value
+
+    def __delitem__(self, key: str):
+        if key in TRANSFORM_FIELDS or key in ("id", "name"):
+            raise KeyError(f"{key} cannot be removed")
+        extras = self._store._extras[self._slot]
+        if extras is None:
+            raise KeyError(key)
+        del extras[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield "id"
+        yield "name"
+        yield from self._store._extras[self._slot] or ()
+        yield from TRANSFORM_FIELDS
+
+    def __len__(self) -> int:
+        return 2 + len(self._store._extras[self._slot] or ()) + len(TRANSFORM_FIELDS)
+
+    def update(self, other=(), **kwargs):
+        """Validate every transform field before writing any of them"""
+        data = dict(other, **kwargs)
+        values = {k: _vec3(data[k], k) for k in TRANSFORM_FIELDS if k in data}
+        if "id" in data:
+            raise KeyError("id is read-only")
+        for key, vec in values.items():
+            self._store._arrays[key][self._slot] = vec
+        for key, value in data.items():
+            if key not in values:
+                self[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f"ObjectView({self.to_dict()!r})"
+
+
+class _ObjectTable(Mapping):
+    """Read-only id -> ObjectView mapping (scene_manager.objects)"""
+
+    def __init__(self, store: "TransformStore"):
+        self._store = store
+
+    def __getitem__(self, obj_id: int) -> ObjectView:
+        return ObjectView(self._store, self._store._slot_of[obj_id])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._store._slot_of)
+
+    def __len__(self) -> int:
+        return len(self._store._slot_of)
+
+    def __contains__(self, obj_id) -> bool:
+        return obj_id in self._store._slot_of
+
+
+def _vec3(value, name: str) -> np.ndarray:
+    try:
+        vec = np.asarray(value, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a list of 3 numbers")
+    if vec.shape != (3,) or not np.all(np.isfinite(vec)):
+        raise ValueError(f"{name} must be a list of 3 finite numbers")
+    return vec
+
+
+def euler_to_matrices(rotations: np.ndarray) -> np.ndarray:
+    """(N, 3) Euler degrees -> (N, 3, 3) rotation matrices (Rz @ Ry @ Rx)"""
+    rx, ry, rz = np.radians(rotations).T
+    cx, sx = np.cos(rx), np.sin(rx)
+    cy, sy = np.cos(ry), np.sin(ry)
+    cz, sz = np.cos(rz), np.sin(rz)
+    m = np.empty((len(rotations), 3, 3))
+    m[:, 0, 0] = cy * cz
+    m[:, 0, 1] = sx * sy * cz - cx * sz
+    m[:, 0, 2] = cx * sy * cz + sx * sz
+    m[:, 1, 0] = cy * sz
+    m[:, 1, 1] = sx * sy * sz + cx * cz
+    m[:, 1, 2] = cx * sy * sz - sx * cz
+    m[:, 2, 0] = -sy
+    m[:, 2, 1] = sx * cy
+    m[:, 2, 2] = cx * cy
+    return m
+
+
+class TransformStore:
+    """Slot-allocated transform arrays for every object in the scene"""
+
+    def __init__(self, capacity: int = 1024):
+        self._arrays = {name: np.zeros((capacity, 3)) for name in TRANSFORM_FIELDS}
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._names: List[Optional[str]] = [None] * capacity
+        self._extras: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._slot_of: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._high_water = 0
+        self.objects = _ObjectTable(self)
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._arrays["position"]
+
+    @property
+    def rotations(self) -> np.ndarray:
+        return self._arrays["rotation"]
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._arrays["scale"]
+
+    def add(self, obj_id: int, **fields) -> ObjectView:
+        """Allocate a slot for obj_id and return its view"""
+        if obj_id in self._slot_of:
+            raise KeyError(f"Object {obj_id} already exists")
+        slot = self._allocate_slot()
+        for name in TRANSFORM_FIELDS:
+            self._arrays[name][slot] = _DEFAULTS[name]
+        self._alive[slot] = True
+        self._ids[slot] = obj_id
+        self._names[slot] = fields.pop("name", "Object")
+        self._slot_of[obj_id] = slot
+        view = ObjectView(self, slot)
+        view.update(fields)
+        return view
+
+    def remove(self, obj_id: int):
+        slot = self._slot_of.pop(obj_id)
+        self._alive[slot] = False
+        self._ids[slot] = -1
+        self._names[slot] = None
+        self._extras[slot] = None
+        self._free.append(slot)
+
+    def slots(self, obj_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Slots for obj_ids (all live objects when None); KeyError on unknown ids"""
+        if obj_ids is None:
+            return np.flatnonzero(self._alive[:self._high_water])
+        return np.fromiter((self._slot_of[i] for i in obj_ids), dtype=np.int64, count=len(obj_ids))
+
+    def ids(self, slots: np.ndarray) -> np.ndarray:
+        return self._ids[slots]
+
+    # ------------------------------------------------------------------
+    # Bulk operations
+    # ------------------------------------------------------------------
+
+    def translate_many(self, slots: np.ndarray, delta):
+        """Add delta ((3,) or (k, 3)) to positions"""
+        self.positions[slots] += np.asarray(delta, dtype=np.float64)
+
+    def rotate_many(self, slots: np.ndarray, delta_degrees):
+        """Add delta ((3,) or (k, 3)) Euler degrees to rotations"""
+        rot = self.rotations[slots] + np.asarray(delta_degrees, dtype=np.float64)
+        self.rotations[slots] = np.mod(rot + 180.0, 360.0) - 180.0
+
+    def scale_many(self, slots: np.ndarray, factor):
+        """Multiply scales by a scalar, (3,) or (k, 3) factor"""
+        self.scales[slots] *= np.asarray(factor, dtype=np.float64)
+
+    def model_matrices(self, slots: Optional[np.ndarray] = None) -> np.ndarray:
+        """(k, 4, 4) model matrices T @ R @ S"""
+        if slots is None:
+            slots = self.slots()
+        rs = euler_to_matrices(self.rotations[slots]) * self.scales[slots][:, None, :]
+        m = np.zeros((len(slots), 4, 4))
+        m[:, :3, :3] = rs
+        m[:, :3, 3] = self.positions[slots]
+        m[:, 3, 3] = 1.0
+        return m
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._arrays.values()) + self._alive.nbytes + self._ids.nbytes
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _allocate_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        slot = self._high_water
+        if slot == len(self._alive):
+            self._grow()
+        self._high_water += 1
+        return slot
+
+    def _grow(self):
+        old = len(self._alive)
+        capacity = old * 2
+        for name, arr in self._arrays.items():
+            new = np.zeros((capacity, 3))
+            new[:old] = arr
+            self._arrays[name] = new
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:old] = self._alive
+        self._alive = alive
+        ids = np.full(capacity, -1, dtype=np.int64)
+        ids[:old] = self._ids
+        self._ids = ids
+        self._names.extend([None] * (capacity - old))
+        self._extras.extend([None] * (capacity - old))
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+def benchmark(n: int = 100_000, seed: int = 0):
+    """Compare SoA storage against per-object dicts at scene size n"""
+    rng = np.random.default_rng(seed)
+    delta = rng.normal(size=(n, 3))
+
+    tracemalloc.start()
+    dicts = {i: {"id": i, "name": f"obj{i}", "position": [0.0, 0.0, 0.0],
+                 "rotation": [0.0, 0.0, 0.0], "scale": [1.0, 1.0, 1.0]} for i in range(n)}
+    dict_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for i, obj in dicts.items():
+        p, d = obj["position"], delta[i]
+        obj["position"] = [p[0] + d[0], p[1] + d[1], p[2] + d[2]]
+    t_dict_translate = time.perf_counter() - t0
+
+    store = TransformStore()
+    tracemalloc.start()
+    for i in range(n):
+        store.add(i, name=f"obj{i}")
+    store_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    slots = store.slots()
+    t0 = time.perf_counter()
+    store.translate_many(slots, delta)
+    t_translate = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    store.rotate_many(slots, (0, 15, 0))
+    store.scale_many(slots, 1.01)
+    t_rot_scale = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    matrices = store.model_matrices(slots)
+    t_matrices = time.perf_counter() - t0
+
+    logger.info(f"[TransformStore] n={n}")
+    logger.info(f"  transform arrays:    {store.nbytes() / 2**20:8.1f} MiB")
+    logger.info(f"  store total (traced):{store_mem / 2**20:8.1f} MiB   dicts: {dict_mem / 2**20:.1f} MiB")
+    logger.info(f"  translate all:       {t_translate * 1e3:8.2f} ms   dicts: {t_dict_translate * 1e3:.1f} ms")
+    logger.info(f"  rotate + scale all:  {t_rot_scale * 1e3:8.2f} ms")
+    logger.info(f"  model matrices:      {t_matrices * 1e3:8.2f} ms ({matrices.nbytes / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    benchmark()
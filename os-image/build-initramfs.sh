@@ -25,7 +25,12 @@ fi
 # Method 2: Python bundled packer
 if command -v python3 >/dev/null 2>&1; then
   echo "Using bundled Python cpio newc packer"
-  python3 "$HERE/create_cpio_newc.py" "$ROOTDIR" "$OUT"
+  # -j 0: compress blocks on all cores (still a single gzip member)
+  # --cache: only recompress the parts of the tree that changed since last run
+  # --reproducible: byte-identical output for identical trees (honours SOURCE_DATE_EPOCH)
+  # --devices: /dev nodes from a spec file, so building needs no root
+  python3 "$HERE/create_cpio_newc.py" -j 0 --reproducible --cache "$HERE/.initramfs-cache" \
+    --devices "$HERE/initramfs-devices.txt" "$ROOTDIR" "$OUT"
   ls -lh "$OUT"
   exit 0
 fi
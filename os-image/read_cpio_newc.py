@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+read_cpio_newc.py - Streaming reader for CPIO newc archives (initramfs images).
+Usage: read_cpio_newc.py <command> [options] <image> ...
+
+  list IMAGE             ls -l style listing
+  verify IMAGE           check headers, padding, hardlinks and the trailer
+  extract IMAGE DEST     unpack (device nodes and ownership only as root)
+  index IMAGE            write the IMAGE.idx sidecar
+  cat IMAGE NAME         write one file to stdout
+  diff A B               compare two images by metadata and content hash
+
+Images are decompressed on the fly (gzip, xz, zstd, lz4 legacy or raw,
+including the concatenated members create_cpio_newc.py writes with
+--cache), so memory stays flat whatever the archive size. `verify` also
+checks what the kernel's unpacker checks: every compressed member must end
+on an entry boundary.
+
+While reading, the start of every compressed member (every block for lz4)
+is recorded as a checkpoint. The sidecar index stores the checkpoints
+together with each entry's data offset and sha256; `cat` then only
+decompresses from the nearest checkpoint before the file, and `diff`
+compares two indexed images without reading either of them.
+"""
+import os, sys, json, stat, time, lzma, zlib, struct, hashlib, argparse
+from collections import namedtuple
+
+from create_cpio_newc import LZ4_LEGACY_BLOCK, LZ4_LEGACY_MAGIC, TRAILER, _require, pad4
+
+CHUNK_SIZE = 1 << 20
+INDEX_VERSION = 1
+HEADER_SIZE = 110
+MAGICS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (struct.pack('<I', LZ4_LEGACY_MAGIC), 'lz4'),
+    (b'070701', 'none'),
+    (b'070702', 'none'),
+)
+
+Entry = namedtuple('Entry', 'name mode uid gid nlink mtime size ino devmajor devminor '
+                            'rdevmajor rdevminor offset')
+
+
+class FormatError(Exception):
+    pass
+
+
+def detect_codec(path):
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    for magic, codec in MAGICS:
+        if head.startswith(magic):
+            return codec
+    raise FormatError(f'{path}: not a cpio archive or unknown compression')
+
+
+class ImageReader:
+    """Uncompressed view of an image, read forwards from a checkpoint.
+
+    `pos` is the offset in the uncompressed cpio stream; `checkpoints`
+    collects (compressed offset, uncompressed offset) pairs where a new
+    member starts and decoding can resume, `member_ends` the uncompressed
+    offsets where a member ended.
+    """
+
+    def __init__(self, path, codec=None, start=(0, 0)):
+        self.codec = codec or detect_codec(path)
+        self.f = open(path, 'rb')
+        self.f.seek(start[0])
+        self.consumed = start[0]  # compressed bytes fed to finished decoders
+        self.pos = start[1]
+        self.checkpoints = []
+        self.member_ends = []
+        self.out = bytearray()
+        self.input = b''
+        self.dec = None
+        self.eof = False
+        if self.codec == 'zstd':
+            self.zstd = _require('zstandard', 'zstandard')
+        elif self.codec == 'lz4':
+            self.lz4 = _require('lz4.block', 'lz4')
+
+    def close(self):
+        self.f.close()
+
+    def _read_input(self):
+        data = self.f.read(CHUNK_SIZE)
+        self.input += data
+        return bool(data)
+
+    def _fill(self):
+        """Decode at most ~CHUNK_SIZE more bytes into self.out."""
+        if self.codec == 'none':
+            data = self.f.read(CHUNK_SIZE)
+            self.out += data
+            self.eof = not data
+            return
+        if self.codec == 'lz4':
+            return self._fill_lz4()
+
+        if self.dec is None:
+            # Between members; the kernel also skips zero padding here
+            while True:
+                stripped = self.input.lstrip(b'\x00')
+                self.consumed += len(self.input) - len(stripped)
+                self.input = stripped
+                if self.input or not self._read_input():
+                    break
+            if not self.input:
+                self.eof = True
+                return
+            self.checkpoints.append((self.consumed, self.pos + len(self.out)))
+            if self.codec == 'gzip':
+                self.dec = zlib.decompressobj(wbits=31)
+            elif self.codec == 'xz':
+                self.dec = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+            else:
+                self.dec = self.zstd.ZstdDecompressor().decompressobj()
+
+        needs_input = not self.input
+        if self.codec == 'xz':
+            needs_input = needs_input and self.dec.needs_input
+        if needs_input and not self._read_input():
+            raise FormatError(f'truncated {self.codec} stream')
+
+        if self.codec == 'gzip':
+            self.out += self.dec.decompress(self.input, CHUNK_SIZE)
+            rest = self.dec.unused_data if self.dec.eof else self.dec.unconsumed_tail
+        elif self.codec == 'xz':
+            self.out += self.dec.decompress(self.input, CHUNK_SIZE)
+            rest = self.dec.unused_data if self.dec.eof else b''
+        else:
+            # zstd cannot cap its output, so cap the input instead
+            self.out += self.dec.decompress(self.input[:16384])
+            rest = (self.dec.unused_data if self.dec.eof else b'') + self.input[16384:]
+        self.consumed += len(self.input) - len(rest)
+        self.input = rest
+        if self.dec.eof:
+            self.member_ends.append(self.pos + len(self.out))
+            self.dec = None
+
+    def _fill_lz4(self):
+        # Legacy blocks are independent: each one is a checkpoint
+        while len(self.input) < 4 and self._read_input():
+            pass
+        if len(self.input) < 4:
+            self.eof = True
+            return
+        size = struct.unpack('<I', self.input[:4])[0]
+        if size in (LZ4_LEGACY_MAGIC, 0):
+            # Start of a concatenated stream, or zero padding
+            self.input = self.input[4:]
+            self.consumed += 4
+            return
+        while len(self.input) < 4 + size:
+            if not self._read_input():
+                raise FormatError('truncated lz4 block')
+        self.checkpoints.append((self.consumed, self.pos + len(self.out)))
+        self.out += self.lz4.decompress(self.input[4:4 + size], uncompressed_size=LZ4_LEGACY_BLOCK)
+        self.input = self.input[4 + size:]
+        self.consumed += 4 + size
+
+    def read(self, n):
+        while len(self.out) < n and not self.eof:
+            self._fill()
+        data = bytes(self.out[:n])
+        del self.out[:n]
+        self.pos += len(data)
+        return data
+
+    def read_exact(self, n):
+        data = self.read(n)
+        if len(data) != n:
+            raise FormatError(f'unexpected end of archive at offset {self.pos}')
+        return data
+
+    def iter_range(self, size):
+        """Yield the next `size` bytes in chunks."""
+        while size:
+            chunk = self.read_exact(min(size, CHUNK_SIZE))
+            size -= len(chunk)
+            yield chunk
+
+    def skip(self, size):
+        for _ in self.iter_range(size):
+            pass
+
+    def seek(self, offset):
+        """Move forward to an uncompressed offset."""
+        if offset < self.pos:
+            raise ValueError('ImageReader only seeks forwards')
+        if self.codec == 'none':
+            self.f.seek(offset)
+            self.pos = offset
+            self.out.clear()
+            return
+        self.skip(offset - self.pos)
+
+
+def parse_header(hdr, offset):
+    if hdr[:6] not in (b'070701', b'070702'):
+        raise FormatError(f'bad magic {hdr[:6]!r} at offset {offset}')
+    try:
+        return [int(hdr[6 + 8 * i:14 + 8 * i], 16) for i in range(13)]
+    except ValueError:
+        raise FormatError(f'malformed header at offset {offset}')
+
+
+def iter_entries(reader, problems=None, boundaries=None):
+    """Yield each Entry; data the caller did not read is skipped afterwards.
+
+    With a `problems` list, recoverable format issues (non-zero padding,
+    a set check field) are appended there instead of being ignored. A
+    `boundaries` set collects the offset of every header and of the end
+    of the trailer.
+    """
+    while True:
+        offset = reader.pos
+        if boundaries is not None:
+            boundaries.add(offset)
+        hdr = reader.read_exact(HEADER_SIZE)
+        (ino, mode, uid, gid, nlink, mtime, size, devmajor, devminor,
+         rdevmajor, rdevminor, namesize, check) = parse_header(hdr, offset)
+        if not namesize:
+            raise FormatError(f'empty name at offset {offset}')
+        raw = reader.read_exact(namesize)
+        padding = reader.read_exact(pad4(HEADER_SIZE + namesize))
+        if raw[-1:] != b'\x00':
+            raise FormatError(f'name not NUL-terminated at offset {offset}')
+        name = raw[:-1].decode('utf-8', 'surrogateescape')
+        if problems is not None:
+            if padding.strip(b'\x00'):
+                problems.append(f'{name}: non-zero header padding')
+            if check and hdr[:6] == b'070701':
+                problems.append(f'{name}: check field set in a 070701 header')
+        if name == TRAILER:
+            if boundaries is not None:
+                boundaries.add(reader.pos)
+            return
+        entry = Entry(name, mode, uid, gid, nlink, mtime, size, ino, devmajor, devminor,
+                      rdevmajor, rdevminor, reader.pos)
+        yield entry
+        reader.seek(entry.offset + size)
+        padding = reader.read_exact(pad4(size))
+        if problems is not None and padding.strip(b'\x00'):
+            problems.append(f'{name}: non-zero data padding')
+
+
+def link_key(entry):
+    return (entry.ino, entry.devmajor, entry.devminor)
+
+
+# ----------------------------------------------------------------------
+# Sidecar index
+# ----------------------------------------------------------------------
+
+def build_index(path):
+    """Scan an image once: entries with data offset, sha256 / link target."""
+    reader = ImageReader(path)
+    rows = []
+    try:
+        for e in iter_entries(reader):
+            digest = ''
+            if stat.S_ISLNK(e.mode):
+                digest = reader.read_exact(e.size).decode('utf-8', 'surrogateescape')
+            elif stat.S_ISREG(e.mode) and e.size:
+                h = hashlib.sha256()
+                for chunk in reader.iter_range(e.size):
+                    h.update(chunk)
+                digest = h.hexdigest()
+            rows.append(list(e) + [digest])
+    finally:
+        reader.close()
+    st = os.stat(path)
+    return {'version': INDEX_VERSION, 'codec': reader.codec, 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns, 'checkpoints': reader.checkpoints or [[0, 0]],
+            'fields': list(Entry._fields) + ['digest'], 'entries': rows}
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def load_index(path, write=False):
+    """The sidecar index if it matches the image, else a fresh scan."""
+    st = os.stat(path)
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        if (index.get('version') == INDEX_VERSION and index['size'] == st.st_size
+                and index['mtime_ns'] == st.st_mtime_ns):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_index(path)
+    if write:
+        tmp = index_path(path) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, index_path(path))
+    return index
+
+
+def indexed_entries(index):
+    """name -> (Entry, digest), with hardlinks resolved to their data."""
+    entries = {}
+    data_of = {}
+    for row in index['entries']:
+        entry, digest = Entry(*row[:-1]), row[-1]
+        entries[entry.name] = (entry, digest)
+        if stat.S_ISREG(entry.mode) and entry.nlink > 1 and entry.size:
+            data_of[link_key(entry)] = (entry, digest)
+    for name, (entry, digest) in entries.items():
+        if stat.S_ISREG(entry.mode) and entry.nlink > 1 and not entry.size:
+            linked = data_of.get(link_key(entry))
+            if linked:
+                entries[name] = (entry._replace(size=linked[0].size, offset=linked[0].offset),
+                                 linked[1])
+    return entries
+
+
+def read_file(path, name, out):
+    """Copy one file's data to `out`, decoding from the nearest checkpoint."""
+    index = load_index(path)
+    entries = indexed_entries(index)
+    if name.strip('/') not in entries:
+        raise KeyError(name)
+    entry, _ = entries[name.strip('/')]
+    if not (stat.S_ISREG(entry.mode) or stat.S_ISLNK(entry.mode)):
+        raise ValueError(f'{name}: not a regular file or symlink')
+    start = (0, 0)
+    for checkpoint in index['checkpoints']:
+        if checkpoint[1] <= entry.offset:
+            start = tuple(checkpoint)
+        else:
+            break
+    reader = ImageReader(path, index['codec'], start)
+    try:
+        reader.seek(entry.offset)
+        for chunk in reader.iter_range(entry.size):
+            out.write(chunk)
+    finally:
+        reader.close()
+
+
+# ----------------------------------------------------------------------
+# Commands
+# ----------------------------------------------------------------------
+
+def describe(entry, target=''):
+    kind = stat.filemode(entry.mode)
+    if stat.S_ISCHR(entry.mode) or stat.S_ISBLK(entry.mode):
+        size = f'{entry.rdevmajor:>4}, {entry.rdevminor:>3}'
+    else:
+        size = f'{entry.size:>9}'
+    when = time.strftime('%Y-%m-%d %H:%M', time.gmtime(entry.mtime))
+    line = f'{kind} {entry.nlink:>3} {entry.uid:>5} {entry.gid:>5} {size} {when} {entry.name}'
+    return line + (f' -> {target}' if target else '')
+
+
+def cmd_list(path):
+    reader = ImageReader(path)
+    try:
+        for entry in iter_entries(reader):
+            target = ''
+            if stat.S_ISLNK(entry.mode):
+                target = reader.read_exact(entry.size).decode('utf-8', 'surrogateescape')
+            print(describe(entry, target))
+    finally:
+        reader.close()
+    return 0
+
+
+def cmd_verify(path):
+    """Check structure and hardlink consistency; exit status 1 on problems."""
+    reader = ImageReader(path)
+    problems, seen, links, boundaries = [], set(), {}, set()
+    count = total = 0
+    try:
+        for entry in iter_entries(reader, problems, boundaries):
+            count += 1
+            total += entry.size
+            if entry.name in seen:
+                problems.append(f'{entry.name}: duplicate entry')
+            seen.add(entry.name)
+            parent = os.path.dirname(entry.name)
+            if parent and parent not in seen:
+                problems.append(f'{entry.name}: parent directory not created before it')
+            if stat.S_ISDIR(entry.mode) and entry.size:
+                problems.append(f'{entry.name}: directory with {entry.size} bytes of data')
+            if stat.S_ISLNK(entry.mode) and not entry.size:
+                problems.append(f'{entry.name}: symlink without target')
+            if (stat.S_ISCHR(entry.mode) or stat.S_ISBLK(entry.mode)) and entry.size:
+                problems.append(f'{entry.name}: device node with data')
+            if stat.S_ISREG(entry.mode) and entry.nlink > 1:
+                links.setdefault(link_key(entry), []).append(entry)
+    except FormatError as e:
+        problems.append(str(e))
+    finally:
+        reader.close()
+
+    # unpack_to_rootfs: "junk at the end of compressed archive" otherwise
+    for end in reader.member_ends:
+        if end not in boundaries:
+            problems.append(f'compressed member ends inside an entry (offset {end})')
+
+    for group in links.values():
+        names = ', '.join(e.name for e in group)
+        if len(group) > group[0].nlink:
+            problems.append(f'{names}: {len(group)} links but nlink={group[0].nlink}')
+        sizes = {e.size for e in group if e.size}
+        if len(sizes) > 1:
+            problems.append(f'{names}: hardlinks carry different data sizes')
+
+    for problem in problems:
+        print(f'ERROR: {problem}')
+    if problems:
+        return 1
+    print(f'✓ {path}: {count} entries, {total} bytes of data, {reader.codec} '
+          f'({len(reader.checkpoints) or 1} checkpoints)')
+    return 0
+
+
+def safe_join(dest, name):
+    """dest/name, refusing names that leave `dest` (a realpath).
+
+    Besides '..' components this catches paths through a symlink the
+    archive created earlier (`a -> /etc` followed by `a/passwd`).
+    """
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if '..' in parts:
+        raise FormatError(f'{name}: refusing to extract outside the destination')
+    target = os.path.join(dest, *parts)
+    parent = os.path.realpath(os.path.dirname(target))
+    if parent != dest and not parent.startswith(dest.rstrip(os.sep) + os.sep):
+        raise FormatError(f'{name}: refusing to extract through a symlink leading outside the destination')
+    return target
+
+
+def cmd_extract(path, dest):
+    is_root = hasattr(os, 'geteuid') and os.geteuid() == 0
+    os.makedirs(dest, exist_ok=True)
+    root = os.path.realpath(dest)
+    reader = ImageReader(path)
+    first_link, dirs, skipped = {}, [], 0
+    try:
+        for e in iter_entries(reader):
+            target = safe_join(root, e.name)
+            # A symlink is replaced, never written through (even one to a directory)
+            if os.path.islink(target) or (os.path.lexists(target) and not os.path.isdir(target)):
+                os.unlink(target)
+            if stat.S_ISDIR(e.mode):
+                os.makedirs(target, exist_ok=True)
+                dirs.append((target, e))
+                continue
+            if stat.S_ISREG(e.mode):
+                key = link_key(e)
+                if e.nlink > 1 and key in first_link:
+                    os.link(first_link[key], target)
+                if e.size or not os.path.exists(target):
+                    with open(target, 'wb') as f:
+                        for chunk in reader.iter_range(e.size):
+                            f.write(chunk)
+                if e.nlink > 1:
+                    first_link.setdefault(key, target)
+            elif stat.S_ISLNK(e.mode):
+                os.symlink(reader.read_exact(e.size), os.fsencode(target))
+            elif stat.S_ISFIFO(e.mode):
+                os.mkfifo(target, stat.S_IMODE(e.mode))
+            elif is_root:
+                os.mknod(target, e.mode, os.makedev(e.rdevmajor, e.rdevminor))
+            else:
+                print(f'WARNING: skipping {stat.filemode(e.mode)[0]} {e.name} (needs root)')
+                skipped += 1
+                continue
+            if is_root:
+                os.chown(target, e.uid, e.gid, follow_symlinks=False)
+            if not stat.S_ISLNK(e.mode):
+                os.chmod(target, stat.S_IMODE(e.mode))
+            os.utime(target, (e.mtime, e.mtime), follow_symlinks=False)
+    finally:
+        reader.close()
+
+    # Directory modes and times last, once nothing more is written into them
+    for target, e in reversed(dirs):
+        if is_root:
+            os.chown(target, e.uid, e.gid)
+        os.chmod(target, stat.S_IMODE(e.mode))
+        os.utime(target, (e.mtime, e.mtime))
+    print(f'✓ Extracted {path} to {dest}' + (f' ({skipped} special files skipped)' if skipped else ''))
+    return 0
+
+
+def cmd_index(path):
+    t0 = time.perf_counter()
+    index = load_index(path, write=True)
+    print(f'✓ Wrote {index_path(path)}: {len(index["entries"])} entries, '
+          f'{len(index["checkpoints"])} checkpoints ({time.perf_counter() - t0:.2f}s)')
+    return 0
+
+
+def cmd_cat(path, name):
+    read_file(path, name, sys.stdout.buffer)
+    return 0
+
+
+def cmd_diff(path_a, path_b, ignore_mtime=False):
+    """Print added (+), removed (-) and changed (~) entries; status 1 if any."""
+    a = indexed_entries(load_index(path_a))
+    b = indexed_entries(load_index(path_b))
+    fields = ['mode', 'uid', 'gid', 'size', 'rdevmajor', 'rdevminor']
+    if not ignore_mtime:
+        fields.append('mtime')
+    differences = 0
+    for name in sorted(a.keys() | b.keys()):
+        if name not in b:
+            print(f'- {name}')
+        elif name not in a:
+            print(f'+ {name}')
+        else:
+            (ea, da), (eb, db) = a[name], b[name]
+            changes = []
+            for field in fields:
+                va, vb = getattr(ea, field), getattr(eb, field)
+                if va != vb:
+                    fmt = oct if field == 'mode' else str
+                    changes.append(f'{field} {fmt(va)} -> {fmt(vb)}')
+            if da != db:
+                changes.append(f'target {da} -> {db}' if stat.S_ISLNK(eb.mode) else 'content')
+            if not changes:
+                continue
+            print(f'~ {name}: ' + ', '.join(changes))
+        differences += 1
+    print(f'{differences} difference(s)')
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect CPIO newc archives.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for command in ('list', 'verify', 'index'):
+        sub.add_parser(command).add_argument('image')
+    p = sub.add_parser('extract')
+    p.add_argument('image')
+    p.add_argument('dest')
+    p = sub.add_parser('cat')
+    p.add_argument('image')
+    p.add_argument('name')
+    p = sub.add_parser('diff')
+    p.add_argument('a')
+    p.add_argument('b')
+    p.add_argument('--ignore-mtime', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            status = cmd_list(args.image)
+        elif args.command == 'verify':
+            status = cmd_verify(args.image)
+        elif args.command == 'extract':
+            status = cmd_extract(args.image, args.dest)
+        elif args.command == 'index':
+            status = cmd_index(args.image)
+        elif args.command == 'cat':
+            status = cmd_cat(args.image, args.name)
+        else:
+            status = cmd_diff(args.a, args.b, args.ignore_mtime)
+    except (OSError, FormatError, KeyError, ValueError, RuntimeError) as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        status = 2
+    sys.exit(status)
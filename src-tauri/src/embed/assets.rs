@@ -0,0 +1,11 @@
+/// Auto-generated embedded assets
+/// Generated by embed_assets.py - do not edit
+/// 0 assets, 0 unique blobs, 0 bytes (+0 gzip, +0 brotli)
+
+use super::{EmbeddedAsset, PackInfo};
+
+pub static PACK: Option<PackInfo> = None;
+
+/// Sorted by path (byte order) for binary search
+pub static ASSETS: [EmbeddedAsset; 0] = [
+];
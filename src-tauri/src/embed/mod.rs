@@ -1,65 +1,215 @@
 /// Embedded Assets Module
-/// 
+///
 /// This module provides embedded access to frontend assets (HTML, JS, CSS, images)
 /// directly from the binary without needing external files on disk.
+///
+/// The asset table lives in `assets.rs`, generated by `embed_assets.py`: a static
+/// array sorted by path, with precompressed gzip/brotli variants and ETags, so
+/// nothing is built at startup and compressed bytes are served as-is.
+///
+/// Assets above the generator's pack threshold live in `assets.pack` next to
+/// the executable instead (see `pack.rs`); it is memory-mapped the first time
+/// one of them is requested.
 
-use std::collections::HashMap;
-use std::path::Path;
+use std::path::{Path, PathBuf};
+use std::sync::OnceLock;
+
+mod assets;
+pub mod pack;
+
+pub use pack::{AssetPack, PackInfo, PackedAsset};
+
+/// Environment variable overriding the asset pack location
+pub const PACK_ENV: &str = "KIACHA_ASSET_PACK";
+
+static PACK: OnceLock<Option<AssetPack>> = OnceLock::new();
 
 /// Represents an embedded asset file
-#[derive(Debug, Clone)]
+#[derive(Debug, Clone, Copy)]
 pub struct EmbeddedAsset {
-    pub path: String,
+    pub path: &'static str,
     pub content: &'static [u8],
     pub mime_type: &'static str,
+    /// Quoted strong validator of the identity bytes, derived from the content hash
+    /// (compressed variants get their own, see `etag_for`)
+    pub etag: &'static str,
+    pub gzip: Option<&'static [u8]>,
+    pub brotli: Option<&'static [u8]>,
+    /// Set when the bytes live in the asset pack (the fields above are empty)
+    pub packed: Option<PackedAsset>,
+}
+
+/// Content-Encoding of the bytes chosen for a response
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum ContentEncoding {
+    Identity,
+    Gzip,
+    Brotli,
+}
+
+impl ContentEncoding {
+    /// Value for the Content-Encoding header (None for identity)
+    pub fn header_value(&self) -> Option<&'static str> {
+        match self {
+            ContentEncoding::Identity => None,
+            ContentEncoding::Gzip => Some("gzip"),
+            ContentEncoding::Brotli => Some("br"),
+        }
+    }
+
+    /// Suffix distinguishing this coding's ETag from the identity one
+    fn etag_suffix(&self) -> &'static str {
+        match self {
+            ContentEncoding::Identity => "",
+            ContentEncoding::Gzip => "-gz",
+            ContentEncoding::Brotli => "-br",
+        }
+    }
+}
+
+/// `Vary` header value for responses whose encoding was negotiated
+pub const VARY: &str = "Accept-Encoding";
+
+impl EmbeddedAsset {
+    /// Uncompressed bytes; None if the asset is packed and the pack is unavailable
+    pub fn data(&self) -> Option<&'static [u8]> {
+        match self.packed {
+            Some(packed) => pack_entry(packed.content),
+            None => Some(self.content),
+        }
+    }
+
+    /// Whether the response bytes depend on Accept-Encoding (send `Vary: VARY`)
+    pub fn has_variants(&self) -> bool {
+        match self.packed {
+            Some(packed) => packed.gzip.is_some() || packed.brotli.is_some(),
+            None => self.gzip.is_some() || self.brotli.is_some(),
+        }
+    }
+
+    /// Strong ETag of one representation: each content-coding is a different
+    /// entity, so caches must not answer a gzip request from a br 304
+    pub fn etag_for(&self, encoding: ContentEncoding) -> String {
+        let suffix = encoding.etag_suffix();
+        match self.etag.strip_suffix('"') {
+            Some(tag) if !suffix.is_empty() => format!("{}{}\"", tag, suffix),
+            _ => self.etag.to_string(),
+        }
+    }
+
+    /// Pick the smallest representation the client accepts
+    pub fn negotiate(&self, accept_encoding: &str) -> Option<(&'static [u8], ContentEncoding)> {
+        let (gzip, brotli) = match self.packed {
+            Some(packed) => (packed.gzip.and_then(pack_entry), packed.brotli.and_then(pack_entry)),
+            None => (self.gzip, self.brotli),
+        };
+        if let Some(data) = brotli {
+            if accepts(accept_encoding, "br") {
+                return Some((data, ContentEncoding::Brotli));
+            }
+        }
+        if let Some(data) = gzip {
+            if accepts(accept_encoding, "gzip") {
+                return Some((data, ContentEncoding::Gzip));
+            }
+        }
+        self.data().map(|data| (data, ContentEncoding::Identity))
+    }
+
+    /// True when an If-None-Match header value matches the representation
+    /// negotiated for this request (weak comparison, as RFC 9110 requires)
+    pub fn not_modified(&self, if_none_match: &str, encoding: ContentEncoding) -> bool {
+        let etag = self.etag_for(encoding);
+        if_none_match
+            .split(',')
+            .map(|tag| tag.trim().trim_start_matches("W/"))
+            .any(|tag| tag == "*" || tag == etag)
+    }
+}
+
+/// Candidate pack locations: override, next to the executable, crate dir in debug
+fn pack_paths(info: &PackInfo) -> Vec<PathBuf> {
+    let mut paths = Vec::new();
+    if let Some(path) = std::env::var_os(PACK_ENV) {
+        paths.push(PathBuf::from(path));
+    }
+    if let Ok(exe) = std::env::current_exe() {
+        paths.push(exe.with_file_name(info.file));
+    }
+    if cfg!(debug_assertions) {
+        paths.push(Path::new(env!("CARGO_MANIFEST_DIR")).join(info.file));
+    }
+    paths
+}
+
+/// The asset pack, mapped on first use
+fn asset_pack() -> Option<&'static AssetPack> {
+    PACK.get_or_init(|| {
+        let info = assets::PACK.as_ref()?;
+        for path in pack_paths(info) {
+            if !path.exists() {
+                continue;
+            }
+            match AssetPack::open(&path, info) {
+                Ok(pack) => return Some(pack),
+                Err(e) => eprintln!("[KIACHA] Ignoring asset pack {}: {}", path.display(), e),
+            }
+        }
+        eprintln!("[KIACHA] Asset pack {} not found; packed assets unavailable", info.file);
+        None
+    })
+    .as_ref()
+}
+
+fn pack_entry(index: u32) -> Option<&'static [u8]> {
+    asset_pack()?.entry(index)
+}
+
+/// Whether an Accept-Encoding header value allows `encoding` (q=0 rejects)
+fn accepts(accept_encoding: &str, encoding: &str) -> bool {
+    accept_encoding.split(',').any(|item| {
+        let mut parts = item.split(';');
+        let name = parts.next().unwrap_or("").trim();
+        if !name.eq_ignore_ascii_case(encoding) && name != "*" {
+            return false;
+        }
+        !parts.any(|p| {
+            let p = p.trim();
+            p.starts_with("q=") && p[2..].trim().parse::<f32>().map_or(false, |q| q == 0.0)
+        })
+    })
 }
 
 /// Central asset store - all assets embedded in binary
 pub struct AssetStore {
-    assets: HashMap<String, EmbeddedAsset>,
+    assets: &'static [EmbeddedAsset],
 }
 
 impl AssetStore {
     /// Create a new asset store with all embedded assets
     pub fn new() -> Self {
-        let mut assets = HashMap::new();
-        
-        // Embed index.html
-        assets.insert(
-            "index.html".to_string(),
-            EmbeddedAsset {
-                path: "index.html".to_string(),
-                content: include_bytes!("../../dist/index.html"),
-                mime_type: "text/html; charset=utf-8",
-            },
-        );
-        
-        // Try to embed main JS (will be created during frontend build)
-        // These will be populated by the build system
-        
-        AssetStore { assets }
-    }
-    
+        AssetStore { assets: &assets::ASSETS }
+    }
+
     /// Get an asset by path
     pub fn get(&self, path: &str) -> Option<&EmbeddedAsset> {
         let normalized = path.trim_start_matches('/');
-        self.assets.get(normalized)
+        self.assets
+            .binary_search_by(|asset| asset.path.cmp(normalized))
+            .ok()
+            .map(|i| &self.assets[i])
     }
-    
+
     /// Get or return 404
     pub fn get_or_404(&self, path: &str) -> &'static [u8] {
-        if let Some(asset) = self.get(path) {
-            asset.content
-        } else {
-            b"404 Not Found"
-        }
+        self.get(path).and_then(EmbeddedAsset::data).unwrap_or(b"404 Not Found")
     }
-    
+
     /// List all available assets
     pub fn list_assets(&self) -> Vec<&str> {
-        self.assets.keys().map(|k| k.as_str()).collect()
+        self.assets.iter().map(|asset| asset.path).collect()
     }
-    
+
     /// Get MIME type for asset
     pub fn get_mime_type(&self, path: &str) -> &'static str {
         if let Some(asset) = self.get(path) {
@@ -68,7 +218,7 @@ impl AssetStore {
             Self::guess_mime_type(path)
         }
     }
-    
+
     /// Guess MIME type from file extension
     fn guess_mime_type(path: &str) -> &'static str {
         if let Some(ext) = Path::new(path).extension() {
@@ -104,7 +254,7 @@ impl Default for AssetStore {
 #[cfg(test)]
 mod tests {
     use super::*;
-    
+
     #[test]
     fn test_mime_type_detection() {
         assert_eq!(AssetStore::guess_mime_type("file.html"), "text/html; charset=utf-8");
@@ -113,4 +263,51 @@ mod tests {
         assert_eq!(AssetStore::guess_mime_type("file.png"), "image/png");
         assert_eq!(AssetStore::guess_mime_type("file.wasm"), "application/wasm");
     }
+
+    #[test]
+    fn test_table_is_sorted() {
+        let store = AssetStore::new();
+        assert!(store.assets.windows(2).all(|w| w[0].path < w[1].path));
+        for asset in store.assets {
+            assert!(store.get(asset.path).is_some());
+        }
+    }
+
+    #[test]
+    fn test_encoding_negotiation() {
+        let asset = EmbeddedAsset {
+            path: "app.js",
+            content: b"identity",
+            mime_type: "application/javascript; charset=utf-8",
+            etag: "\"0123456789abcdef\"",
+            gzip: Some(b"gz"),
+            brotli: Some(b"br"),
+            packed: None,
+        };
+        assert_eq!(asset.negotiate("gzip, deflate, br").unwrap().1, ContentEncoding::Brotli);
+        assert_eq!(asset.negotiate("gzip, br;q=0").unwrap().1, ContentEncoding::Gzip);
+        assert_eq!(asset.negotiate("").unwrap().1, ContentEncoding::Identity);
+        assert!(asset.has_variants());
+    }
+
+    #[test]
+    fn test_etag_per_encoding() {
+        let asset = EmbeddedAsset {
+            path: "app.js",
+            content: b"identity",
+            mime_type: "application/javascript; charset=utf-8",
+            etag: "\"0123456789abcdef\"",
+            gzip: Some(b"gz"),
+            brotli: Some(b"br"),
+            packed: None,
+        };
+        assert_eq!(asset.etag_for(ContentEncoding::Identity), "\"0123456789abcdef\"");
+        assert_eq!(asset.etag_for(ContentEncoding::Gzip), "\"0123456789abcdef-gz\"");
+        assert_eq!(asset.etag_for(ContentEncoding::Brotli), "\"0123456789abcdef-br\"");
+        assert!(asset.not_modified("W/\"0123456789abcdef\"", ContentEncoding::Identity));
+        assert!(asset.not_modified("\"0123456789abcdef-br\"", ContentEncoding::Brotli));
+        assert!(!asset.not_modified("\"0123456789abcdef-br\"", ContentEncoding::Gzip));
+        assert!(!asset.not_modified("\"0123456789abcdef\"", ContentEncoding::Gzip));
+        assert!(!asset.not_modified("\"other\"", ContentEncoding::Identity));
+    }
 }
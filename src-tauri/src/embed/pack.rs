@@ -0,0 +1,179 @@
+/// Asset Pack
+///
+/// Large assets (WASM builds, fonts) can be kept out of the binary in a single
+/// indexed file next to the executable, written by `embed_assets.py
+/// --pack-threshold`. The file is memory-mapped on first use, so startup does
+/// not pay for it and pages are only read when an asset is served.
+///
+/// Layout (little endian):
+///
+/// ```text
+///  0  magic      b"KIAPACK\0"
+///  8  version    u32
+/// 12  count      u32
+/// 16  align      u32   blob alignment (page size)
+/// 20  reserved   u32
+/// 24  pack id    [u8; 16]
+/// 40  entries    count x { offset u64, length u64, sha256 [u8; 32] }
+///     blobs      each starting at a multiple of `align`
+/// ```
+///
+/// The pack id is compared with the one compiled into the asset table, so a
+/// pack from another build is rejected instead of serving wrong bytes.
+
+use std::fs::File;
+use std::io;
+use std::path::Path;
+
+use memmap2::Mmap;
+
+pub const MAGIC: &[u8; 8] = b"KIAPACK\0";
+pub const VERSION: u32 = 1;
+const HEADER_LEN: usize = 40;
+const ENTRY_LEN: usize = 48;
+
+/// Pack identity compiled into the generated asset table
+#[derive(Debug, Clone, Copy)]
+pub struct PackInfo {
+    /// File name looked up next to the executable
+    pub file: &'static str,
+    pub id: [u8; 16],
+    pub entries: u32,
+}
+
+/// Pack entry indices of an asset stored outside the binary
+#[derive(Debug, Clone, Copy)]
+pub struct PackedAsset {
+    pub content: u32,
+    pub gzip: Option<u32>,
+    pub brotli: Option<u32>,
+}
+
+/// A mapped, validated asset pack
+pub struct AssetPack {
+    map: Mmap,
+    entries: Vec<(usize, usize)>,
+}
+
+impl AssetPack {
+    /// Map a pack file and check it against the compiled-in pack info
+    pub fn open(path: &Path, info: &PackInfo) -> io::Result<Self> {
+        let file = File::open(path)?;
+        // Safety: the pack is read-only build output; it is not modified
+        // while the application runs
+        let map = unsafe { Mmap::map(&file)? };
+        let entries = parse(&map, info)?;
+        Ok(AssetPack { map, entries })
+    }
+
+    /// Bytes of one entry
+    pub fn entry(&self, index: u32) -> Option<&[u8]> {
+        let &(offset, length) = self.entries.get(index as usize)?;
+        Some(&self.map[offset..offset + length])
+    }
+
+    pub fn len(&self) -> usize {
+        self.entries.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.entries.is_empty()
+    }
+}
+
+fn invalid(message: &str) -> io::Error {
+    io::Error::new(io::ErrorKind::InvalidData, message.to_string())
+}
+
+fn read_u32(data: &[u8], at: usize) -> u32 {
+    u32::from_le_bytes(data[at..at + 4].try_into().unwrap())
+}
+
+fn read_u64(data: &[u8], at: usize) -> u64 {
+    u64::from_le_bytes(data[at..at + 8].try_into().unwrap())
+}
+
+/// Validate the header and offset table; returns (offset, length) per entry
+pub fn parse(data: &[u8], info: &PackInfo) -> io::Result<Vec<(usize, usize)>> {
+    if data.len() < HEADER_LEN || &data[..8] != MAGIC {
+        return Err(invalid("not an asset pack"));
+    }
+    if read_u32(data, 8) != VERSION {
+        return Err(invalid("unsupported asset pack version"));
+    }
+    if data[24..40] != info.id {
+        return Err(invalid("asset pack does not match this build"));
+    }
+    let count = read_u32(data, 12) as usize;
+    if count != info.entries as usize {
+        return Err(invalid("asset pack entry count mismatch"));
+    }
+    let table_end = HEADER_LEN + count * ENTRY_LEN;
+    if data.len() < table_end {
+        return Err(invalid("truncated asset pack table"));
+    }
+    let mut entries = Vec::with_capacity(count);
+    for i in 0..count {
+        let at = HEADER_LEN + i * ENTRY_LEN;
+        let offset = read_u64(data, at);
+        let length = read_u64(data, at + 8);
+        let end = offset.checked_add(length).ok_or_else(|| invalid("asset pack entry overflow"))?;
+        if offset < table_end as u64 || end > data.len() as u64 {
+            return Err(invalid("asset pack entry out of bounds"));
+        }
+        entries.push((offset as usize, length as usize));
+    }
+    Ok(entries)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn build(id: [u8; 16], blobs: &[&[u8]]) -> Vec<u8> {
+        let align = 64;
+        let mut out = Vec::new();
+        out.extend_from_slice(MAGIC);
+        out.extend_from_slice(&VERSION.to_le_bytes());
+        out.extend_from_slice(&(blobs.len() as u32).to_le_bytes());
+        out.extend_from_slice(&(align as u32).to_le_bytes());
+        out.extend_from_slice(&0u32.to_le_bytes());
+        out.extend_from_slice(&id);
+        let mut offset = HEADER_LEN + blobs.len() * ENTRY_LEN;
+        let mut data = Vec::new();
+        for blob in blobs {
+            offset = (offset + align - 1) / align * align;
+            out.extend_from_slice(&(offset as u64).to_le_bytes());
+            out.extend_from_slice(&(blob.len() as u64).to_le_bytes());
+            out.extend_from_slice(&[0u8; 32]);
+            data.push((offset, *blob));
+            offset += blob.len();
+        }
+        for (offset, blob) in data {
+            out.resize(offset, 0);
+            out.extend_from_slice(blob);
+        }
+        out
+    }
+
+    #[test]
+    fn test_parse_pack() {
+        let info = PackInfo { file: "assets.pack", id: [7; 16], entries: 2 };
+        let data = build([7; 16], &[b"wasm bytes", b"font"]);
+        let entries = parse(&data, &info).unwrap();
+        assert_eq!(entries.len(), 2);
+        let (offset, length) = entries[1];
+        assert_eq!(offset % 64, 0);
+        assert_eq!(&data[offset..offset + length], b"font");
+    }
+
+    #[test]
+    fn test_reject_foreign_pack() {
+        let info = PackInfo { file: "assets.pack", id: [7; 16], entries: 1 };
+        assert!(parse(&build([8; 16], &[b"x"]), &info).is_err());
+        let mut truncated = build([7; 16], &[b"payload"]);
+        truncated.truncate(truncated.len() - 1);
+        assert!(parse(&truncated, &info).is_err());
+        assert!(parse(b"KIAPACK", &info).is_err());
+    }
+}